@@ -0,0 +1,96 @@
+"""Measure how mbox import throughput scales with the number of parser processes.
+
+An mbox of synthetic emails is generated, with plain text, HTML
+alternative and attachment parts, and imported into a fresh SQLite
+database once per number of workers. Peak memory of the importer and of
+its worker processes is reported, to check it stays bounded by the shard
+size rather than growing with the file.
+
+Usage:
+    poetry run python -m benchmarks.bench_archive_import --num-emails 200000 --workers 1 2 4 8
+"""
+import argparse
+import base64
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from benchmarks.synthetic_corpus import generate_emails
+from llm_email_search.extract_archive_to_sqlite import DEFAULT_SHARD_BYTES, extract_archive_to_sqlite
+from llm_email_search.logger import setup_logger
+from llm_email_search.profiling import resource
+
+logger = setup_logger(__name__)
+
+BOUNDARY = "benchmark-boundary"
+
+
+def write_mbox(path: str, num_emails: int, seed: int = 0) -> None:
+    """Write an mbox of unique synthetic emails, cycling through a pool of bodies.
+
+    Messages are formatted from templates rather than with ``EmailMessage``,
+    which would take longer than the import being measured.
+    """
+    rng = random.Random(seed)
+    bodies = generate_emails(min(num_emails, 10000), seed)
+    attachment = base64.encodebytes(rng.randbytes(2048)).decode("ascii")
+    with open(path, "w", newline="\n") as file:
+        for i in range(num_emails):
+            body = f"{bodies[i % len(bodies)]}\nReference {i}\n"
+            parts = [f"Content-Type: text/plain; charset=utf-8\n\n{body}"]
+            if i % 3 == 0:
+                parts.append(f"Content-Type: text/html; charset=utf-8\n\n<html><body><p>{body}</p></body></html>\n")
+            if i % 10 == 0:
+                parts.append(
+                    "Content-Type: application/pdf\nContent-Transfer-Encoding: base64\n"
+                    f'Content-Disposition: attachment; filename="report{i}.pdf"\n\n{attachment}'
+                )
+            sent = format_datetime(datetime.fromtimestamp(1700000000 + i * 60, tz=timezone.utc))
+            file.write(
+                f"From MAILER-DAEMON Thu Jan  1 00:00:00 2024\nFrom: sender{i % 1000}@example.com\n"
+                f"Subject: Subject {i}\nDate: {sent}\nMIME-Version: 1.0\n"
+                f'Content-Type: multipart/mixed; boundary="{BOUNDARY}"\n\n'
+                + "".join(f"--{BOUNDARY}\n{part}\n" for part in parts)
+                + f"--{BOUNDARY}--\n\n"
+            )
+
+
+def get_peak_child_rss_mb() -> float:
+    # Largest peak RSS of the worker processes that have exited, in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024 if resource else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-emails", type=int, default=200000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--shard-mb", type=int, default=DEFAULT_SHARD_BYTES // (1024 * 1024))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "archive.mbox")
+        start = time.perf_counter()
+        write_mbox(path, args.num_emails)
+        logger.info(
+            f"Generated {args.num_emails} emails, {os.path.getsize(path) / (1024 * 1024):.0f} MB, "
+            f"in {time.perf_counter() - start:.1f} s; {os.cpu_count()} CPUs available"
+        )
+
+        baseline = None
+        for workers in args.workers:
+            database = os.path.join(directory, f"emails-{workers}.db")
+            start = time.perf_counter()
+            extract_archive_to_sqlite(path, database, workers=workers, shard_bytes=args.shard_mb * 1024 * 1024)
+            rate = args.num_emails / (time.perf_counter() - start)
+            baseline = baseline or rate
+            logger.info(
+                f"{workers:2d} workers: {rate:8.0f} emails/sec ({rate / baseline:.2f}x), "
+                f"peak worker RSS so far {get_peak_child_rss_mb():.0f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
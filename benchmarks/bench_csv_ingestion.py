@@ -0,0 +1,99 @@
+"""Measure the rows/sec of loading a large CSV of emails into SQLite.
+
+A CSV of synthetic emails is generated, then loaded by the chunked loader,
+which streams the CSV and writes each chunk with one bulk INSERT. For
+comparison, the first --orm-rows rows are loaded the way the loaders did
+before: the whole CSV read at once, and one ORM object added per row.
+
+Usage:
+    poetry run python -m benchmarks.bench_csv_ingestion --num-rows 2000000
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.synthetic_corpus import generate_emails
+from llm_email_search.csv_loader import DEFAULT_BODY_COLUMN, DEFAULT_CHUNK_SIZE, load_csv_to_sqlite
+from llm_email_search.logger import setup_logger
+from llm_email_search.models import Email, init_database
+from llm_email_search.profiling import get_peak_rss_mb
+from llm_email_search.text_cleaning import clean_text
+
+logger = setup_logger(__name__)
+
+COLUMNS = {"body": DEFAULT_BODY_COLUMN, "sender": "From", "subject": "Subject", "timestamp": "Date"}
+
+
+def write_csv(path: str, num_rows: int) -> None:
+    """Write a CSV of unique synthetic emails, cycling through a pool of bodies."""
+    bodies = generate_emails(10000)
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS.values())
+        for i in range(num_rows):
+            writer.writerow(
+                (f"{bodies[i % len(bodies)]} #{i}", f"sender{i % 1000}@example.com", f"Subject {i}", i)
+            )
+
+
+def load_with_orm(database: str, csv_path: str, num_rows: int) -> None:
+    import pandas as pd
+
+    session = sessionmaker(bind=init_database(database))()
+    df = pd.read_csv(csv_path, nrows=num_rows)
+    session.add_all(
+        Email(
+            sender=row["From"],
+            subject=row["Subject"],
+            body=row[DEFAULT_BODY_COLUMN],
+            clean_body=clean_text(row[DEFAULT_BODY_COLUMN]),
+            timestamp=int(row["Date"]),
+        )
+        for _, row in df.iterrows()
+    )
+    session.commit()
+    session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-rows", type=int, default=2000000)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--orm-rows", type=int, default=100000, help="Rows loaded the old way, 0 to skip (default: 100000)"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "emails.csv")
+        start = time.perf_counter()
+        write_csv(csv_path, args.num_rows)
+        logger.info(
+            f"Generated {args.num_rows} rows, {os.path.getsize(csv_path) / (1024 * 1024):.0f} MB, "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+
+        if args.orm_rows:
+            database = os.path.join(directory, "orm.db")
+            start = time.perf_counter()
+            load_with_orm(database, csv_path, args.orm_rows)
+            elapsed = time.perf_counter() - start
+            logger.info(f"ORM, one commit:    {args.orm_rows / elapsed:8.0f} rows/sec")
+
+        database = os.path.join(directory, "chunked.db")
+        start = time.perf_counter()
+        load_csv_to_sqlite(database, csv_path, COLUMNS, args.chunk_size)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Chunked Core insert: {args.num_rows / elapsed:8.0f} rows/sec, {elapsed:.1f} s")
+
+        peak_rss_mb = get_peak_rss_mb()
+        if peak_rss_mb is not None:
+            logger.info(f"Peak memory usage (RSS): {peak_rss_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
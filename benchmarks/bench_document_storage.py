@@ -0,0 +1,113 @@
+"""Compare disk use and result payloads of indexes with and without stored documents.
+
+Synthetic emails are written to SQLite, and random embeddings of them to a
+vector store twice: once with the bodies as documents, and once with only
+vectors and metadata. Searches of the id-only store read the bodies of
+their results from SQLite in one batched query.
+
+Usage:
+    poetry run python -m benchmarks.bench_document_storage --num-emails 20000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_vector_backends import generate_embeddings
+from benchmarks.synthetic_corpus import generate_emails
+from llm_email_search.document_store import DOCUMENT_MODES, DocumentStore, fill_documents
+from llm_email_search.logger import setup_logger
+from llm_email_search.models import Email, init_database
+from llm_email_search.vector_store import (
+    BACKENDS,
+    CHROMA_BACKEND,
+    build_metadata,
+    get_max_batch_size,
+    open_collection,
+)
+
+logger = setup_logger(__name__)
+
+MODEL_NAME = "benchmark-model"
+
+
+def get_size_mb(path: str) -> float:
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    ) / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-emails", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--num-queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10, help="Number of results per query")
+    parser.add_argument("--backend", choices=BACKENDS, default=CHROMA_BACKEND)
+    args = parser.parse_args()
+
+    bodies = generate_emails(args.num_emails)
+    embeddings = generate_embeddings(args.num_emails, args.dimensions, seed=0)
+    queries = generate_embeddings(args.num_queries, args.dimensions, seed=1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        sql_path = os.path.join(directory, "emails.db")
+        session = sessionmaker(bind=init_database(sql_path))()
+        session.add_all(
+            Email(sender=f"sender{i % 100}@example.com", subject=f"Subject {i}", body=body, timestamp=i)
+            for i, body in enumerate(bodies)
+        )
+        session.commit()
+        session.close()
+        logger.info(f"Emails database: {os.path.getsize(sql_path) / (1024 * 1024):.1f} MB")
+        ids = [str(i) for i in range(1, args.num_emails + 1)]
+        metadatas = [
+            build_metadata(f"sender{i % 100}@example.com", f"Subject {i}", i, None)
+            for i in range(args.num_emails)
+        ]
+
+        for store_documents in (True, False):
+            embeddings_path = os.path.join(directory, f"embeddings-{store_documents}")
+            os.makedirs(embeddings_path)
+            collection = open_collection(embeddings_path, MODEL_NAME, backend=args.backend)
+            batch_size = (
+                get_max_batch_size(embeddings_path) if args.backend == CHROMA_BACKEND else args.num_emails
+            )
+            for i in range(0, args.num_emails, batch_size):
+                collection.add(
+                    ids=ids[i : i + batch_size],
+                    embeddings=embeddings[i : i + batch_size],
+                    documents=bodies[i : i + batch_size] if store_documents else None,
+                    metadatas=metadatas[i : i + batch_size],
+                )
+            if args.backend != CHROMA_BACKEND:
+                collection.save()
+            label = "with documents" if store_documents else "id-only"
+            logger.info(f"{label:14s} index: {get_size_mb(embeddings_path):.1f} MB")
+
+            store = DocumentStore(sql_path)
+            for mode in DOCUMENT_MODES:
+                latencies = []
+                payload_bytes = 0
+                for query in queries:
+                    start = time.perf_counter()
+                    results = fill_documents(
+                        collection.query(query_embeddings=query[None], n_results=args.k),
+                        mode,
+                        store=store,
+                    )
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    payload_bytes += len(json.dumps({key: results.get(key) for key in ("ids", "documents")}))
+                logger.info(
+                    f"{label:14s} {mode:7s}: p50 {np.percentile(latencies, 50):.2f} ms, "
+                    f"ids and documents {payload_bytes / args.num_queries / 1024:.1f} KB per query"
+                )
+            del collection
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Measure the encode time saved by reusing embeddings of identical and near-duplicate emails.
+
+Synthetic emails are written to SQLite, with a share of exact copies and
+of near duplicates that differ in a word or two, like notifications and
+newsletters. They are embedded without the embedding cache, with it, with
+near-duplicate reuse, and again after a rebuild from the warm cache.
+
+Usage:
+    poetry run python -m benchmarks.bench_embedding_cache --num-emails 2000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.synthetic_corpus import WORDS, generate_emails
+from llm_email_search.embed_emails import embed_emails
+from llm_email_search.encoder import SentenceTransformerEncoder
+from llm_email_search.logger import setup_logger
+from llm_email_search.models import Email, init_database
+from llm_email_search.vector_store import DEFAULT_MODEL_NAME, NUMPY_BACKEND, open_collection
+
+logger = setup_logger(__name__)
+
+
+def generate_duplicated_bodies(
+    num_emails: int, duplicate_fraction: float, near_duplicate_fraction: float, seed: int = 0
+):
+    """Bodies of which a share are copies or near duplicates of earlier ones.
+
+    Returns:
+        tuple: The bodies, and pairs of the index of a near duplicate and of its original
+    """
+    rng = random.Random(seed)
+    bodies = generate_emails(num_emails, seed)
+    near_duplicates = []
+    for i in range(1, num_emails):
+        draw = rng.random()
+        original = rng.randrange(i)
+        if draw < duplicate_fraction:
+            bodies[i] = bodies[original]
+        elif draw < duplicate_fraction + near_duplicate_fraction:
+            words = bodies[original].split(" ")
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            bodies[i] = " ".join(words)
+            near_duplicates.append((i, original))
+    return bodies, near_duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-emails", type=int, default=2000)
+    parser.add_argument("--duplicate-fraction", type=float, default=0.2)
+    parser.add_argument("--near-duplicate-fraction", type=float, default=0.2)
+    parser.add_argument("--model-name", type=str, default=DEFAULT_MODEL_NAME)
+    args = parser.parse_args()
+
+    bodies, near_duplicates = generate_duplicated_bodies(
+        args.num_emails, args.duplicate_fraction, args.near_duplicate_fraction
+    )
+    logger.info(
+        f"{args.num_emails} emails, {len(set(bodies))} distinct, {len(near_duplicates)} near duplicates"
+    )
+    encode_spy = {"texts": 0}
+    encode_tokenized = SentenceTransformerEncoder.encode_tokenized
+
+    def counting_encode_tokenized(self, tokenized, *encode_args, **kwargs):
+        encode_spy["texts"] += len(tokenized["input_ids"])
+        return encode_tokenized(self, tokenized, *encode_args, **kwargs)
+
+    SentenceTransformerEncoder.encode_tokenized = counting_encode_tokenized
+
+    with tempfile.TemporaryDirectory() as directory:
+        sql_path = os.path.join(directory, "emails.db")
+        session = sessionmaker(bind=init_database(sql_path))()
+        session.add_all(
+            Email(sender=f"sender{i % 100}@example.com", subject=f"Subject {i}", body=body, timestamp=i)
+            for i, body in enumerate(bodies)
+        )
+        session.commit()
+        session.close()
+
+        # Warm up so model loading is not measured
+        SentenceTransformerEncoder(args.model_name).encode(bodies[:64])
+        runs = (
+            ("no cache", "uncached", dict(use_embedding_cache=False)),
+            ("exact", "cached", dict()),
+            ("near-duplicate", "near", dict(near_duplicates=True)),
+            ("rebuild", "near", dict(near_duplicates=True, rebuild=True)),
+        )
+        for name, path, kwargs in runs:
+            embeddings_path = os.path.join(directory, path)
+            os.makedirs(embeddings_path, exist_ok=True)
+            encode_spy["texts"] = 0
+            start = time.perf_counter()
+            embed_emails(sql_path, embeddings_path, args.model_name, backend=NUMPY_BACKEND, **kwargs)
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"{name:15s}: encoded {encode_spy['texts']:6d} of {args.num_emails} emails, "
+                f"{elapsed:6.1f} s ({args.num_emails / elapsed:.0f} emails/sec)"
+            )
+
+        # Ids are assigned in insertion order, starting from 1
+        exact = open_collection(os.path.join(directory, "cached"), args.model_name, backend=NUMPY_BACKEND)
+        near = open_collection(os.path.join(directory, "near"), args.model_name, backend=NUMPY_BACKEND)
+        ids = [str(i + 1) for i, _ in near_duplicates]
+        reference = np.asarray(exact.get(ids=ids, include=["embeddings"])["embeddings"], dtype=np.float32)
+        reused = np.asarray(near.get(ids=ids, include=["embeddings"])["embeddings"], dtype=np.float32)
+        similarity = np.sum(reference * reused, axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(reused, axis=1)
+        )
+        logger.info(
+            f"Cosine similarity of near-duplicate embeddings to their own: mean {similarity.mean():.4f}, "
+            f"min {similarity.min():.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
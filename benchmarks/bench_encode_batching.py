@@ -0,0 +1,53 @@
+"""Compare embedding throughput with and without length-bucketed inference batches.
+
+Usage:
+    poetry run python -m benchmarks.bench_encode_batching --num-emails 5000
+"""
+import argparse
+import time
+
+from benchmarks.synthetic_corpus import generate_emails
+from llm_email_search.encoder import DEFAULT_ENCODE_BATCH_SIZE, SentenceTransformerEncoder
+from llm_email_search.logger import setup_logger
+from llm_email_search.vector_store import DEFAULT_MODEL_NAME
+
+logger = setup_logger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-emails", type=int, default=5000)
+    parser.add_argument("--model-name", type=str, default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--batch-size", type=int, default=2500, help="Storage batch size")
+    parser.add_argument("--encode-batch-size", type=int, default=DEFAULT_ENCODE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    emails = generate_emails(args.num_emails)
+    encoder = SentenceTransformerEncoder(args.model_name)
+    # Warm up so model loading and first-call overhead are not measured
+    encoder.encode(emails[:64])
+
+    def before(batch):
+        # What Chroma's embedding function did: one encode call per storage batch,
+        # which SentenceTransformer sorts by character length internally
+        encoder.model.encode(batch, batch_size=args.encode_batch_size)
+
+    strategies = {
+        "arrival order": lambda batch: encoder.encode(
+            batch, batch_size=args.encode_batch_size, sort_by_length=False
+        ),
+        "before (storage batch, character sort)": before,
+        "after (tokenize once, token-length buckets)": lambda batch: encoder.encode(
+            batch, batch_size=args.encode_batch_size
+        ),
+    }
+    for name, encode in strategies.items():
+        start = time.perf_counter()
+        for i in range(0, len(emails), args.batch_size):
+            encode(emails[i : i + args.batch_size])
+        elapsed = time.perf_counter() - start
+        logger.info(f"{name:<46} {len(emails) / elapsed:8.1f} emails/sec")
+
+
+if __name__ == "__main__":
+    main()
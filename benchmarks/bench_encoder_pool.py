@@ -0,0 +1,60 @@
+"""Measure how embedding throughput scales with the number of encoder processes.
+
+Usage:
+    poetry run python -m benchmarks.bench_encoder_pool --num-emails 5000 --max-workers 8
+"""
+import argparse
+import time
+
+from benchmarks.synthetic_corpus import generate_emails
+from llm_email_search.encoder import (
+    DEFAULT_ENCODE_BATCH_SIZE,
+    EncoderPool,
+    SentenceTransformerEncoder,
+    get_physical_cores,
+)
+from llm_email_search.logger import setup_logger
+from llm_email_search.vector_store import DEFAULT_MODEL_NAME
+
+logger = setup_logger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-emails", type=int, default=5000)
+    parser.add_argument("--model-name", type=str, default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--max-workers", type=int, default=get_physical_cores())
+    parser.add_argument("--batch-size", type=int, default=2500, help="Storage batch size")
+    parser.add_argument("--encode-batch-size", type=int, default=DEFAULT_ENCODE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    emails = generate_emails(args.num_emails)
+    logger.info(f"{get_physical_cores()} physical cores available")
+
+    baseline = None
+    workers = 1
+    while workers <= args.max_workers:
+        if workers == 1:
+            encoder = SentenceTransformerEncoder(args.model_name)
+            encode, close = encoder.encode, lambda: None
+        else:
+            pool = EncoderPool(args.model_name, workers)
+            encode, close = pool.encode, pool.close
+        # Warm up so model loading in the workers is not measured
+        encode(emails[: 64 * workers], batch_size=args.encode_batch_size)
+
+        start = time.perf_counter()
+        for i in range(0, len(emails), args.batch_size):
+            encode(emails[i : i + args.batch_size], batch_size=args.encode_batch_size)
+        throughput = len(emails) / (time.perf_counter() - start)
+        close()
+
+        baseline = baseline or throughput
+        logger.info(
+            f"{workers:3d} workers: {throughput:8.1f} emails/sec ({throughput / baseline:.2f}x)"
+        )
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
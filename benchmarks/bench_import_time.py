@@ -0,0 +1,122 @@
+"""Measure how long importing each CLI module takes, and fail if startup regresses.
+
+Each module is imported in a fresh interpreter with ``python -X importtime``,
+which reports the cumulative import time of every module. The run fails if
+a module imports one of the heavy dependencies (which should only be
+imported once the code path that needs them runs), or takes longer than the
+time budget.
+
+Usage:
+    poetry run python -m benchmarks.bench_import_time --max-ms 500
+"""
+import argparse
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import List, Set
+
+from llm_email_search.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Modules run as command line entry points, whose --help should be instant
+CLI_MODULES = (
+    "llm_email_search.embed_emails",
+    "llm_email_search.run_query",
+    "llm_email_search.query_server",
+    "llm_email_search.extract_emails_to_sqlite",
+    "llm_email_search.extract_demo_emails_to_sqlite",
+    "llm_email_search.extract_public_emails_to_sqlite",
+    "llm_email_search.extract_archive_to_sqlite",
+)
+
+# Dependencies that take seconds to import
+HEAVY_MODULES = (
+    "torch",
+    "chromadb",
+    "sentence_transformers",
+    "googleapiclient.discovery",
+    "google_auth_oauthlib",
+    "pandas",
+)
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)$")
+
+
+@dataclass
+class ImportProfile:
+    """Result of importing a module in a fresh interpreter.
+
+    Attributes:
+        module (str): Name of the imported module
+        cumulative_ms (float): Time to import the module and everything it imports
+        imported (set): Names of all modules imported along the way
+    """
+
+    module: str
+    cumulative_ms: float
+    imported: Set[str]
+
+    def heavy_imports(self) -> List[str]:
+        """Heavy dependencies that were imported, see ``HEAVY_MODULES``."""
+        return sorted(heavy for heavy in HEAVY_MODULES if heavy in self.imported)
+
+
+def profile_import(module: str) -> ImportProfile:
+    """Import a module in a fresh interpreter and record what it imports.
+
+    Args:
+        module (str): Name of the module to import
+
+    Returns:
+        ImportProfile: Import time and imported modules
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = set()
+    cumulative_us = 0
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        name = match.group(4)
+        imported.add(name)
+        if name == module:
+            cumulative_us = int(match.group(2))
+    return ImportProfile(module, cumulative_us / 1000, imported)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--max-ms", type=float, default=1000, help="Time budget for importing each module"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module; the fastest counts")
+    args = parser.parse_args()
+
+    failures = []
+    for module in CLI_MODULES:
+        profiles = [profile_import(module) for _ in range(args.repeat)]
+        profile = min(profiles, key=lambda profile: profile.cumulative_ms)
+        heavy = profile.heavy_imports()
+        logger.info(
+            f"{module}: {profile.cumulative_ms:.0f} ms, {len(profile.imported)} modules"
+            + (f", imports {', '.join(heavy)}" if heavy else "")
+        )
+        if heavy:
+            failures.append(f"{module} imports {', '.join(heavy)}")
+        if profile.cumulative_ms > args.max_ms:
+            failures.append(f"{module} takes {profile.cumulative_ms:.0f} ms to import")
+
+    for failure in failures:
+        logger.error(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Measure recall, latency, build time and size of the IVF/PQ index against brute force.
+
+Usage:
+    poetry run python -m benchmarks.bench_ivf_pq --num-vectors 200000 --nprobe 1 4 16 64
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_vector_backends import generate_embeddings, recall_at_k
+from llm_email_search.ivf_pq import (
+    DEFAULT_SHORTLIST,
+    DEFAULT_SUBQUANTIZERS,
+    IVFPQIndex,
+    exact_rerank,
+    get_default_nlist,
+)
+from llm_email_search.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def brute_force(embeddings: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Exact k nearest neighbours of each query, and the time they took per query."""
+    nearest = []
+    start = time.perf_counter()
+    squared_norms = (embeddings ** 2).sum(axis=1)
+    for query in queries:
+        distances = squared_norms - 2 * embeddings @ query
+        candidates = np.argpartition(distances, k)[:k]
+        nearest.append(candidates[np.argsort(distances[candidates])])
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return np.asarray(nearest), elapsed_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-vectors", type=int, default=200000)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10, help="Number of results per query")
+    parser.add_argument("--nlist", type=int, help="Number of inverted lists (default: about 4 * sqrt(n))")
+    parser.add_argument("--subquantizers", type=int, default=DEFAULT_SUBQUANTIZERS)
+    parser.add_argument("--shortlist", type=int, default=DEFAULT_SHORTLIST)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    embeddings = generate_embeddings(args.num_vectors, args.dimensions, seed=0)
+    queries = generate_embeddings(args.num_queries, args.dimensions, seed=1)
+    expected, brute_force_ms = brute_force(embeddings, queries, args.k)
+    logger.info(f"Brute force over {args.num_vectors} vectors: {brute_force_ms:.2f} ms per query")
+
+    start = time.perf_counter()
+    index = IVFPQIndex.train(
+        embeddings, args.nlist or get_default_nlist(args.num_vectors), args.subquantizers
+    )
+    trained = time.perf_counter()
+    ids = [str(i) for i in range(args.num_vectors)]
+    index.add(ids, embeddings)
+    added = time.perf_counter()
+    logger.info(
+        f"Index with {index.nlist} lists and {index.num_subquantizers} bytes per vector: "
+        f"trained in {trained - start:.1f} s, added {len(index)} vectors in {added - trained:.1f} s, "
+        f"{index.size_bytes() / (1024 * 1024):.1f} MB "
+        f"(float32 vectors take {embeddings.nbytes / (1024 * 1024):.1f} MB)"
+    )
+
+    for nprobe in args.nprobe:
+        approximate, reranked, latencies = [], [], []
+        for query in queries:
+            query_start = time.perf_counter()
+            (candidate_ids, _), = index.search(query[None], args.shortlist, nprobe)
+            rows = [int(candidate_id) for candidate_id in candidate_ids]
+            top_ids, _ = exact_rerank(query, candidate_ids, embeddings[rows], args.k)
+            latencies.append((time.perf_counter() - query_start) * 1000)
+            approximate.append(candidate_ids[: args.k])
+            reranked.append(top_ids)
+        logger.info(
+            f"nprobe {nprobe:4d}: recall@{args.k} {recall_at_k(approximate, expected):.3f} from codes, "
+            f"{recall_at_k(reranked, expected):.3f} after re-ranking {args.shortlist}, "
+            f"p50 {np.percentile(latencies, 50):.2f} ms, p99 {np.percentile(latencies, 99):.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Load test the query server and report latency percentiles and throughput.
+
+Start the server first, e.g.:
+    poetry run python llm_email_search/query_server.py --embeddings-path embedded_emails.db
+
+Then run:
+    poetry run python -m benchmarks.bench_query_server --concurrency 32 --num-requests 2000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List
+
+import numpy as np
+
+from benchmarks.synthetic_corpus import WORDS
+from llm_email_search.logger import setup_logger
+from llm_email_search.query_server import DEFAULT_PORT, read_request
+
+logger = setup_logger(__name__)
+
+
+async def read_response(reader: asyncio.StreamReader) -> dict:
+    # Responses have the same framing as requests, with the status line in place of the request line
+    _, status, _, body = await read_request(reader)
+    if not status.startswith("200"):
+        raise RuntimeError(f"Server responded with {status}: {body!r}")
+    return json.loads(body)
+
+
+async def run_client(
+    host: str, port: int, queries: List[str], num_results: int, latencies: List[float]
+) -> None:
+    """Send queries one after another over a keep-alive connection."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for query in queries:
+            body = json.dumps({"query": query, "num_results": num_results}).encode("utf-8")
+            start = time.perf_counter()
+            writer.write(
+                f"POST /search HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+            await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load_test(args: argparse.Namespace) -> None:
+    rng = random.Random(0)
+    queries = [" ".join(rng.sample(WORDS, rng.randint(1, 4))) for _ in range(args.num_requests)]
+    latencies: List[float] = []
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            run_client(args.host, args.port, queries[i :: args.concurrency], args.num_results, latencies)
+            for i in range(args.concurrency)
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    logger.info(
+        f"{len(latencies)} requests with concurrency {args.concurrency}: "
+        f"{len(latencies) / elapsed:.1f} QPS, latency p50 {np.percentile(latencies_ms, 50):.1f} ms, "
+        f"p99 {np.percentile(latencies_ms, 99):.1f} ms"
+    )
+
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    writer.write(f"GET /health HTTP/1.1\r\nHost: {args.host}\r\nConnection: close\r\n\r\n".encode("latin-1"))
+    health = await read_response(reader)
+    writer.close()
+    if health["batches"]:
+        logger.info(f"Server average batch size: {health['queries'] / health['batches']:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--concurrency", type=int, default=32, help="Number of concurrent clients")
+    parser.add_argument("--num-requests", type=int, default=2000)
+    parser.add_argument("--num-results", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run_load_test(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Report the tokens and encode time saved per email by cleaning the bodies before embedding.
+
+Bodies are read from an emails database with --sql-path, or generated:
+HTML newsletters, and plain text replies quoting earlier messages and
+ending in a signature.
+
+Usage:
+    poetry run python -m benchmarks.bench_text_cleaning --num-emails 2000
+    poetry run python -m benchmarks.bench_text_cleaning --sql-path emails.db
+"""
+import argparse
+import random
+import sqlite3
+import time
+from typing import List
+
+import numpy as np
+
+from benchmarks.synthetic_corpus import WORDS, generate_emails
+from llm_email_search.encoder import DEFAULT_ENCODE_BATCH_SIZE, SentenceTransformerEncoder
+from llm_email_search.logger import setup_logger
+from llm_email_search.text_cleaning import clean_text
+from llm_email_search.vector_store import DEFAULT_MODEL_NAME
+
+logger = setup_logger(__name__)
+
+
+def generate_raw_bodies(num_emails: int, seed: int = 0) -> List[str]:
+    """Email bodies with the markup, quotes and signatures of a real mailbox."""
+    rng = random.Random(seed)
+    texts = generate_emails(num_emails, seed)
+    bodies = []
+    for i, text in enumerate(texts):
+        if i % 3 == 0:
+            paragraphs = "".join(
+                f'<tr><td style="padding:12px;font-family:Arial,sans-serif;color:#333333">'
+                f'<p style="margin:0">{text[j : j + 200]}</p></td></tr>'
+                for j in range(0, len(text), 200)
+            )
+            bodies.append(
+                "<html><head><style>td { font-size: 14px; }</style></head><body>"
+                f'<table width="100%" cellpadding="0" cellspacing="0">{paragraphs}</table>'
+                '<div style="font-size:11px">Unsubscribe&nbsp;|&nbsp;View in browser</div></body></html>'
+            )
+        else:
+            quoted = "\n".join(
+                "> " + " ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(rng.randint(5, 40))
+            )
+            bodies.append(
+                f"{text}\n\nBest regards,\nAlex Example\nSenior Manager, Example Corp\n+1 555 0100\n\n"
+                f"On Mon, 3 Jun 2024 at 10:00, Sam <sam@example.com> wrote:\n{quoted}\n"
+            )
+    return bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-emails", type=int, default=2000)
+    parser.add_argument("--sql-path", type=str, help="Read the bodies of this emails database instead")
+    parser.add_argument("--model-name", type=str, default=DEFAULT_MODEL_NAME)
+    parser.add_argument(
+        "--num-encoded", type=int, default=500, help="Number of emails encoded to compare encode time"
+    )
+    args = parser.parse_args()
+
+    if args.sql_path:
+        connection = sqlite3.connect(args.sql_path)
+        bodies = [
+            body
+            for body, in connection.execute("SELECT body FROM emails ORDER BY id LIMIT ?", (args.num_emails,))
+        ]
+        connection.close()
+    else:
+        bodies = generate_raw_bodies(args.num_emails)
+
+    start = time.perf_counter()
+    cleaned = [clean_text(body) for body in bodies]
+    elapsed = time.perf_counter() - start
+    megabytes = sum(len(body) for body in bodies) / (1024 * 1024)
+    logger.info(
+        f"Cleaned {len(bodies)} emails in {elapsed:.2f} s ({len(bodies) / elapsed:.0f} emails/sec, "
+        f"{megabytes / elapsed:.1f} MB/sec), {sum(map(len, cleaned)) / sum(map(len, bodies)):.0%} "
+        "of the characters are left"
+    )
+
+    encoder = SentenceTransformerEncoder(args.model_name)
+    tokenizer = encoder.model.tokenizer
+    window = encoder.model.max_seq_length
+    raw_tokens = np.array([len(ids) for ids in tokenizer(bodies)["input_ids"]])
+    clean_tokens = np.array([len(ids) for ids in tokenizer(cleaned)["input_ids"]])
+    logger.info(
+        f"Tokens per email: {raw_tokens.mean():.0f} raw, {clean_tokens.mean():.0f} cleaned, "
+        f"{(raw_tokens - clean_tokens).mean():.0f} saved per email; tokens inside the "
+        f"{window}-token window: {np.minimum(raw_tokens, window).mean():.0f} raw, "
+        f"{np.minimum(clean_tokens, window).mean():.0f} cleaned; emails over the window: "
+        f"{(raw_tokens > window).sum()} raw, {(clean_tokens > window).sum()} cleaned"
+    )
+
+    # Warm up so model loading and first-call overhead are not measured
+    encoder.encode(cleaned[:64])
+    for name, texts in (("raw", bodies), ("cleaned", cleaned)):
+        start = time.perf_counter()
+        encoder.encode(texts[: args.num_encoded], batch_size=DEFAULT_ENCODE_BATCH_SIZE)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Encoding {name:8s} {min(args.num_encoded, len(texts)) / elapsed:8.1f} emails/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Compare recall, latency, open time and memory of the Chroma and NumPy vector backends.
+
+Synthetic clustered embeddings (similar in shape to sentence embeddings)
+are written to a Chroma collection and to NumPy stores of every storage
+type. Recall@k is measured against exact float32 search. Open time and
+memory are measured in a fresh process per backend, so nothing is cached
+from building the stores.
+
+Usage:
+    poetry run python -m benchmarks.bench_vector_backends --num-vectors 50000
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from llm_email_search.logger import setup_logger
+from llm_email_search.vector_store import (
+    CHROMA_BACKEND,
+    NUMPY_BACKEND,
+    NUMPY_DTYPES,
+    get_max_batch_size,
+    get_numpy_store_path,
+    open_collection,
+)
+
+logger = setup_logger(__name__)
+
+MODEL_NAME = "benchmark-model"
+
+
+# Sentence embeddings vary along far fewer directions than they have dimensions
+INTRINSIC_DIMENSIONS = 24
+
+
+def generate_embeddings(count: int, dimensions: int, seed: int) -> np.ndarray:
+    """Unit vectors scattered around a few hundred cluster centres.
+
+    Centres and the directions points vary along are the same for every
+    seed, so queries generated with one seed have near neighbours among
+    embeddings generated with another.
+    """
+    shape_rng = np.random.default_rng(0)
+    centres = shape_rng.normal(size=(256, dimensions))
+    directions = shape_rng.normal(size=(INTRINSIC_DIMENSIONS, dimensions))
+    rng = np.random.default_rng((seed, 1))
+    embeddings = (
+        centres[rng.integers(0, len(centres), count)]
+        + rng.normal(scale=0.3, size=(count, INTRINSIC_DIMENSIONS)) @ directions
+        + rng.normal(scale=0.05, size=(count, dimensions))
+    )
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings.astype(np.float32)
+
+
+def get_rss_mb() -> Optional[float]:
+    """Current resident set size, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+def measure_cold_open(
+    embeddings_path: str, backend: str, dtype: str, queries: np.ndarray, k: int
+) -> Dict[str, Optional[float]]:
+    """Open a store and run a first query; meant to run in a fresh process."""
+    if backend == CHROMA_BACKEND:
+        import chromadb  # noqa: F401 - imported up front so its import is not measured
+    rss_before = get_rss_mb()
+    start = time.perf_counter()
+    collection = open_collection(embeddings_path, MODEL_NAME, backend=backend, dtype=dtype)
+    opened = time.perf_counter()
+    collection.query(query_embeddings=queries[:1], n_results=k, include=[])
+    first_query = time.perf_counter()
+    for query in queries:
+        collection.query(query_embeddings=query[None], n_results=k, include=[])
+    rss_after = get_rss_mb()
+    return {
+        "open_ms": (opened - start) * 1000,
+        "first_query_ms": (first_query - opened) * 1000,
+        "rss_mb": None if rss_before is None else rss_after - rss_before,
+    }
+
+
+def recall_at_k(found: List[List[str]], expected: np.ndarray) -> float:
+    k = expected.shape[1]
+    return float(
+        np.mean([len(set(map(int, ids)) & set(row.tolist())) / k for ids, row in zip(found, expected)])
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-vectors", type=int, default=50000)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10, help="Number of results per query")
+    args = parser.parse_args()
+
+    embeddings = generate_embeddings(args.num_vectors, args.dimensions, seed=0)
+    queries = generate_embeddings(args.num_queries, args.dimensions, seed=1)
+    distances = (
+        (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ embeddings.T + (embeddings ** 2).sum(axis=1)
+    )
+    expected = np.argsort(distances, axis=1)[:, : args.k]
+    ids = [str(i) for i in range(args.num_vectors)]
+
+    with tempfile.TemporaryDirectory() as embeddings_path:
+        configurations = [(CHROMA_BACKEND, NUMPY_DTYPES[0])]
+        configurations += [(NUMPY_BACKEND, dtype) for dtype in NUMPY_DTYPES]
+        # A spawned process starts without anything imported or cached
+        context = multiprocessing.get_context("spawn")
+        for backend, dtype in configurations:
+            start = time.perf_counter()
+            collection = open_collection(
+                embeddings_path, MODEL_NAME, rebuild=True, backend=backend, dtype=dtype
+            )
+            batch_size = (
+                get_max_batch_size(embeddings_path) if backend == CHROMA_BACKEND else args.num_vectors
+            )
+            for i in range(0, args.num_vectors, batch_size):
+                collection.add(ids=ids[i : i + batch_size], embeddings=embeddings[i : i + batch_size])
+            if backend == NUMPY_BACKEND:
+                collection.save()
+            build_seconds = time.perf_counter() - start
+
+            latencies = []
+            found = []
+            for query in queries:
+                query_start = time.perf_counter()
+                results = collection.query(query_embeddings=query[None], n_results=args.k, include=[])
+                latencies.append((time.perf_counter() - query_start) * 1000)
+                found.append(results["ids"][0])
+            del collection
+
+            with context.Pool(1) as pool:
+                cold = pool.apply(
+                    measure_cold_open, (embeddings_path, backend, dtype, queries, args.k)
+                )
+            if backend == NUMPY_BACKEND:
+                store_path = get_numpy_store_path(embeddings_path, MODEL_NAME)
+                disk_mb = sum(
+                    os.path.getsize(os.path.join(store_path, name)) for name in os.listdir(store_path)
+                ) / (1024 * 1024)
+                name = f"{backend} {dtype}"
+            else:
+                disk_mb = sum(
+                    os.path.getsize(os.path.join(root, name))
+                    for root, _, names in os.walk(embeddings_path)
+                    for name in names
+                    if NUMPY_BACKEND not in root
+                ) / (1024 * 1024)
+                name = backend
+            rss = "n/a" if cold["rss_mb"] is None else f"{cold['rss_mb']:.0f} MB"
+            logger.info(
+                f"{name:14s} recall@{args.k} {recall_at_k(found, expected):.3f}, "
+                f"p50 {np.percentile(latencies, 50):.2f} ms, p99 {np.percentile(latencies, 99):.2f} ms, "
+                f"cold open {cold['open_ms']:.1f} ms + first query {cold['first_query_ms']:.1f} ms, "
+                f"RSS after {args.num_queries} queries {rss}, disk {disk_mb:.0f} MB, "
+                f"build {build_seconds:.1f} s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import random
+from typing import List
+
+WORDS = (
+    "invoice meeting flight confirmation order shipped receipt payment account "
+    "password reset schedule project update team lunch friday report review "
+    "contract deadline budget travel hotel booking newsletter sale discount offer "
+    "subscription renewal delivery tracking number support ticket question answer"
+).split()
+
+
+def generate_emails(num_emails: int, seed: int = 0) -> List[str]:
+    """Generate email bodies with a long-tailed length distribution.
+
+    Most bodies are a few dozen words, while a small fraction are thousands of
+    words long, similar to a real mailbox with newsletters and long threads.
+
+    Args:
+        num_emails (int): Number of email bodies to generate
+        seed (int): Random seed, so runs are comparable
+
+    Returns:
+        list: Generated email bodies
+    """
+    rng = random.Random(seed)
+    emails = []
+    for _ in range(num_emails):
+        num_words = min(5000, max(3, int(rng.lognormvariate(3.5, 1.2))))
+        emails.append(" ".join(rng.choice(WORDS) for _ in range(num_words)))
+    return emails
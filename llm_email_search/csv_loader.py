@@ -0,0 +1,184 @@
+import argparse
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional, Union
+
+from llm_email_search.logger import setup_logger
+from llm_email_search.models import CSV_SOURCE, bulk_insert_emails, compute_content_hash, init_database
+from llm_email_search.text_cleaning import clean_text
+from llm_email_search.vector_store import to_epoch_ms
+
+logger = setup_logger(__name__)
+
+# Demo is based on the csv here:
+# https://www.kaggle.com/datasets/subhajournal/phishingemails
+DEFAULT_CSV_PATH = "data/Phishing_email.csv"
+DEFAULT_BODY_COLUMN = "Email Text"
+# Rows read from the CSV and inserted per transaction; memory use depends on this,
+# not on the size of the CSV
+DEFAULT_CHUNK_SIZE = 50000
+
+# Email fields that can be read from a CSV column
+CSV_FIELDS = ("sender", "subject", "body", "timestamp", "attachment_types")
+
+
+def parse_timestamp(value: str) -> Optional[int]:
+    """Convert a CSV timestamp to epoch milliseconds.
+
+    Args:
+        value (str): Epoch milliseconds, an ISO 8601 date, or an RFC 2822 date as
+            in email Date headers (e.g. "Thu, 14 Mar 2024 10:00:00 +0000")
+
+    Returns:
+        int: Epoch timestamp in milliseconds, or None if the value is not a date
+    """
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        return to_epoch_ms(value)
+    except ValueError:
+        pass
+    try:
+        sent = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError, OverflowError):
+        logger.warning(f"Could not parse timestamp {value!r}, storing none")
+        return None
+    if sent.tzinfo is None:
+        sent = sent.replace(tzinfo=timezone.utc)
+    return int(sent.timestamp() * 1000)
+
+
+def read_csv_rows(
+    csv_path: str, columns: Dict[str, str], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[List[Dict[str, Union[str, int, None]]]]:
+    """Stream the emails of a CSV file a chunk at a time.
+
+    Rows without a body are skipped.
+
+    Args:
+        csv_path (str): Path to the CSV file
+        columns (dict): CSV column of each email field, see ``CSV_FIELDS``; fields
+            that are left out are stored as None
+        chunk_size (int): Number of CSV rows read at a time
+
+    Yields:
+        list: Email rows with the fields of ``CSV_FIELDS``, their clean body and source
+    """
+    # pandas is slow to import, so it is only loaded when reading the CSV
+    import pandas as pd
+
+    chunks = pd.read_csv(
+        csv_path, usecols=list(columns.values()), dtype=str, keep_default_na=False, chunksize=chunk_size
+    )
+    for chunk in chunks:
+        values = {field: chunk[column].tolist() for field, column in columns.items()}
+        rows = []
+        for i in range(len(chunk)):
+            row = {field: values[field][i] if field in values else None for field in CSV_FIELDS}
+            if not row["body"]:
+                continue
+            # Missing values are read as empty strings
+            for field in CSV_FIELDS:
+                if row[field] == "":
+                    row[field] = None
+            if row["timestamp"] is not None:
+                row["timestamp"] = parse_timestamp(row["timestamp"])
+            row["clean_body"] = clean_text(row["body"])
+            row["source"] = CSV_SOURCE
+            rows.append(row)
+        yield rows
+
+
+def load_csv_to_sqlite(
+    database: str,
+    csv_path: str = DEFAULT_CSV_PATH,
+    columns: Optional[Dict[str, str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    drop_duplicates: bool = True,
+) -> int:
+    """Load the emails of a CSV file into a SQLite database.
+
+    The CSV is streamed a chunk at a time, and each chunk is written with a
+    single bulk ``INSERT`` through SQLAlchemy Core in its own transaction (see
+    ``bulk_insert_emails``), so CSVs of millions of rows load without holding
+    them in memory.
+
+    Args:
+        database (str): Path to SQLite database file
+        csv_path (str): Path to the CSV file
+        columns (dict, optional): CSV column of each email field, see ``CSV_FIELDS``.
+            By default only the body is read, from the "Email Text" column
+        chunk_size (int): Number of CSV rows read and inserted at a time
+        drop_duplicates (bool): Skip emails already in the database or earlier in
+            the CSV, by their content hash (see ``compute_content_hash``)
+
+    Returns:
+        int: Number of emails inserted
+
+    Raises:
+        ValueError: If a field of ``columns`` is not one of ``CSV_FIELDS``, or the
+            body column is missing
+    """
+    columns = columns or {"body": DEFAULT_BODY_COLUMN}
+    unknown_fields = set(columns) - set(CSV_FIELDS)
+    if unknown_fields:
+        raise ValueError(f"Unknown fields {', '.join(sorted(unknown_fields))}, expected {', '.join(CSV_FIELDS)}")
+    if "body" not in columns:
+        raise ValueError("A CSV column is needed for the body")
+
+    engine = init_database(database)
+    num_read = 0
+    num_inserted = 0
+    for rows in read_csv_rows(csv_path, columns, chunk_size):
+        if not rows:
+            continue
+        for row in rows:
+            row["content_hash"] = compute_content_hash(row) if drop_duplicates else None
+        num_inserted += bulk_insert_emails(engine, rows)
+        num_read += len(rows)
+        logger.debug(f"Inserted {num_inserted} of {num_read} emails read so far")
+    logger.info(f"Added {num_inserted} emails to the database, skipped {num_read - num_inserted} duplicates")
+    return num_inserted
+
+
+def add_csv_arguments(parser: argparse.ArgumentParser, default_database: str) -> None:
+    """Add the arguments of ``load_csv_to_sqlite`` to a command line parser."""
+    parser.add_argument(
+        "--database",
+        type=str,
+        default=default_database,
+        help=f"Path to SQLite database file (default: {default_database})",
+    )
+    parser.add_argument(
+        "--csv-path",
+        type=str,
+        default=DEFAULT_CSV_PATH,
+        help=f"CSV file to read the emails from (default: {DEFAULT_CSV_PATH})",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f"Number of CSV rows read and inserted at a time (default: {DEFAULT_CHUNK_SIZE})",
+    )
+    parser.add_argument(
+        "--body-column",
+        type=str,
+        default=DEFAULT_BODY_COLUMN,
+        help=f"CSV column holding the email bodies (default: {DEFAULT_BODY_COLUMN})",
+    )
+    for field in CSV_FIELDS:
+        if field != "body":
+            parser.add_argument(
+                f"--{field.replace('_', '-')}-column",
+                type=str,
+                help=f"CSV column holding the email {field.replace('_', ' ')}"
+                + (", as epoch milliseconds, ISO 8601 or RFC 2822 dates" if field == "timestamp" else ""),
+            )
+
+
+def get_column_mapping(args: argparse.Namespace) -> Dict[str, str]:
+    """CSV column of each email field given on the command line, see ``add_csv_arguments``."""
+    columns = {field: getattr(args, f"{field}_column") for field in CSV_FIELDS}
+    return {field: column for field, column in columns.items() if column}
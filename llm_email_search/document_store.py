@@ -0,0 +1,166 @@
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from llm_email_search.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# How the bodies of the results are returned: in full, as a short snippet, or not at all
+DOCUMENTS_FULL = "full"
+DOCUMENTS_SNIPPET = "snippet"
+DOCUMENTS_NONE = "none"
+DOCUMENT_MODES = (DOCUMENTS_FULL, DOCUMENTS_SNIPPET, DOCUMENTS_NONE)
+
+# Number of characters of a body kept in a snippet
+DEFAULT_SNIPPET_LENGTH = 200
+
+# Ids bound per statement; older SQLite builds allow at most 999 parameters
+MAX_IDS_PER_QUERY = 900
+
+
+def make_snippet(
+    text: Optional[str], length: int = DEFAULT_SNIPPET_LENGTH, truncated: bool = False
+) -> Optional[str]:
+    """Shorten a body to its first characters, with runs of whitespace collapsed.
+
+    Args:
+        text (str): Body of an email, or None
+        length (int): Largest number of characters to keep
+        truncated (bool): Whether ``text`` is only the start of the body, so the
+            snippet is marked as cut even when it fits
+
+    Returns:
+        str: Snippet, ending in "..." if the body was cut, or None if there was no body
+    """
+    if text is None:
+        return None
+    snippet = " ".join(text.split())
+    if len(snippet) <= length and not truncated:
+        return snippet
+    return snippet[:length].rstrip() + "..."
+
+
+class DocumentStore:
+    """Reads the bodies of emails from the SQLite emails database by id.
+
+    Embeddings written with ``embed_emails(store_documents=False)`` keep only
+    vectors and metadata in the index, so each body is stored once, in
+    SQLite. The bodies of the results a search returns are then read here,
+    all in one batched query.
+
+    Attributes:
+        sql_path (str): Path to SQLite database containing emails
+    """
+
+    def __init__(self, sql_path: str):
+        self.sql_path = sql_path
+
+    def get(
+        self, ids: List[str], max_length: Optional[int] = None
+    ) -> Dict[str, Tuple[Optional[str], bool]]:
+        """Read the bodies of emails.
+
+        Args:
+            ids (list): Email ids, as strings like the ids of the vector store
+            max_length (int, optional): Read only this many characters of each body
+
+        Returns:
+            dict: Body per id, and whether it was cut at ``max_length``; ids of
+                emails that no longer exist are left out
+
+        Raises:
+            FileNotFoundError: If the emails database does not exist
+        """
+        if not ids:
+            return {}
+        if not os.path.exists(self.sql_path):
+            raise FileNotFoundError(
+                f"SQLite database file not found at {self.sql_path}; it is needed to show "
+                "the bodies of emails that were embedded without documents"
+            )
+        # Results show the email as it was received, like documents stored in the index
+        columns = "body, 0"
+        if max_length is not None:
+            columns = "substr(body, 1, ?), length(body) > ?"
+        bodies: Dict[str, Tuple[Optional[str], bool]] = {}
+        # A connection per read, so reads can run on any thread
+        connection = sqlite3.connect(self.sql_path)
+        try:
+            for i in range(0, len(ids), MAX_IDS_PER_QUERY):
+                chunk = ids[i : i + MAX_IDS_PER_QUERY]
+                parameters = [int(email_id) for email_id in chunk]
+                if max_length is not None:
+                    parameters[:0] = [max_length, max_length]
+                rows = connection.execute(
+                    f"SELECT id, {columns} FROM emails WHERE id IN ({', '.join('?' * len(chunk))})",
+                    parameters,
+                ).fetchall()
+                bodies.update((str(email_id), (body, bool(cut))) for email_id, body, cut in rows)
+        finally:
+            connection.close()
+        return bodies
+
+
+def fill_documents(
+    results: dict,
+    mode: str = DOCUMENTS_FULL,
+    snippet_length: int = DEFAULT_SNIPPET_LENGTH,
+    store: Optional[DocumentStore] = None,
+) -> dict:
+    """Return search results with their documents in the requested form.
+
+    Documents the index returned as None are read from the emails database
+    with one query for all results. Results are copied rather than changed,
+    since they may be held by the result cache.
+
+    Args:
+        results (dict): Search results with one list per query under ids and documents
+        mode (str): One of ``DOCUMENT_MODES``; with "none" the documents are dropped
+        snippet_length (int): Number of characters of a snippet
+        store (DocumentStore, optional): Where missing documents are read from;
+            without it they stay None
+
+    Returns:
+        dict: Results with the documents filled in, shortened or dropped
+
+    Raises:
+        ValueError: If the mode is not one of ``DOCUMENT_MODES``
+    """
+    if mode not in DOCUMENT_MODES:
+        raise ValueError(
+            f"Unknown documents mode {mode}, expected one of {', '.join(DOCUMENT_MODES)}"
+        )
+    results = dict(results)
+    if mode == DOCUMENTS_NONE:
+        results.pop("documents", None)
+        return results
+    if "documents" not in results:
+        return results
+
+    documents = [list(query_documents) for query_documents in results["documents"]]
+    missing = [
+        email_id
+        for query_ids, query_documents in zip(results["ids"], documents)
+        for email_id, document in zip(query_ids, query_documents)
+        if document is None
+    ]
+    # Whether each document was read only up to the snippet length
+    truncated = [[False] * len(query_documents) for query_documents in documents]
+    if missing and store is not None:
+        max_length = None if mode == DOCUMENTS_FULL else snippet_length
+        bodies = store.get(list(dict.fromkeys(missing)), max_length)
+        for query_ids, query_documents, query_truncated in zip(results["ids"], documents, truncated):
+            for i, email_id in enumerate(query_ids):
+                if query_documents[i] is None:
+                    query_documents[i], query_truncated[i] = bodies.get(email_id, (None, False))
+    if mode == DOCUMENTS_SNIPPET:
+        documents = [
+            [
+                make_snippet(document, snippet_length, cut)
+                for document, cut in zip(query_documents, query_truncated)
+            ]
+            for query_documents, query_truncated in zip(documents, truncated)
+        ]
+    results["documents"] = documents
+    return results
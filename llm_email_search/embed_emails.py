@@ -1,87 +1,474 @@
 import argparse
+import hashlib
+import json
 import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
-import chromadb
-from chromadb.utils import embedding_functions
-from sqlalchemy import create_engine
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from tqdm import tqdm
 
-from llm_email_search.extract_emails_to_sqlite import Email
+from llm_email_search.embedding_cache import (
+    DEFAULT_MAX_SIGNATURES,
+    DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+    EmbeddingCache,
+    MinHashLSH,
+    content_key,
+)
 from llm_email_search.logger import setup_logger
+from llm_email_search.models import Email, init_database
+from llm_email_search.pipeline import StageStats, run_pipeline
+from llm_email_search.profiling import get_peak_rss_mb
+from llm_email_search.text_cleaning import clean_text
+from llm_email_search.vector_store import (
+    BACKENDS,
+    CHROMA_BACKEND,
+    DEFAULT_BACKEND,
+    DEFAULT_ENCODE_BATCH_SIZE,
+    DEFAULT_MODEL_NAME,
+    DEFAULT_NUMPY_DTYPE,
+    NUMPY_DTYPES,
+    EMBEDDING_HASH_KEY,
+    build_metadata,
+    bump_collection_version,
+    get_embedding_cache_path,
+    get_embedding_hashes,
+    get_max_batch_size,
+    iter_entry_ids,
+    open_collection,
+)
+
+# The encoder imports torch, and chromadb is slow to import, so they are only imported once embedding starts
+if TYPE_CHECKING:
+    from chromadb.api.models.Collection import Collection
+
+    from llm_email_search.encoder import TokenizedTexts
 
 logger = setup_logger(__name__)
 
 
+def compute_embedding_hash(document: str, metadata: Dict[str, Union[str, int, bool]]) -> str:
+    """Compute the hash identifying what an email's embedding entry was built from.
+
+    Args:
+        document (str): Text that is embedded
+        metadata (dict): Metadata stored alongside the embedding
+
+    Returns:
+        str: Hex-encoded SHA-256 of the document and metadata
+    """
+    payload = json.dumps({"document": document, "metadata": metadata}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class EmbedBatch:
+    """A batch of emails moving through the embedding pipeline.
+
+    Attributes:
+        ids (list): Ids of the emails to embed
+        documents (list): Texts to embed
+        bodies (list): Raw body of each email, stored as the document shown in search results
+        metadatas (list): Metadata stored alongside each embedding
+        replaced_ids (list): Ids whose existing entries are replaced by this batch
+        keys (list): Content key of each document, see ``content_key``
+        pending (list): Indices of the documents that need encoding, set by the lookup
+            stage; the embeddings of the others are reused
+        copies (list): Pairs of the index of a document and the index of the pending
+            document whose embedding it reuses
+        tokenized (dict): Token ids of the pending documents, set by the tokenize stage
+        embeddings (numpy.ndarray): Embeddings of the documents, set by the lookup and encode stages
+    """
+
+    ids: List[str] = field(default_factory=list)
+    documents: List[str] = field(default_factory=list)
+    bodies: List[str] = field(default_factory=list)
+    metadatas: List[Dict[str, Union[str, int, bool]]] = field(default_factory=list)
+    replaced_ids: List[str] = field(default_factory=list)
+    keys: List[str] = field(default_factory=list)
+    pending: List[int] = field(default_factory=list)
+    copies: List[Tuple[int, int]] = field(default_factory=list)
+    tokenized: Optional["TokenizedTexts"] = None
+    embeddings: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def read_changed_emails(
+    engine: Engine,
+    read_hashes: Callable[[List[str]], Dict[str, str]],
+    batch_size: int,
+    progress: tqdm,
+) -> Iterator[EmbedBatch]:
+    """Stream the emails that are new or modified since they were last embedded.
+
+    The embedding hashes of the existing entries are read a batch of emails at
+    a time, so memory depends on ``batch_size``, not on the size of the collection.
+
+    Args:
+        engine (Engine): SQLAlchemy engine of the emails database
+        read_hashes (callable): Returns the embedding hash of each of a list of ids
+            that has an entry, see ``get_embedding_hashes``
+        batch_size (int): Number of emails read at a time
+        progress (tqdm): Progress bar updated with the number of emails read
+
+    Yields:
+        EmbedBatch: Emails that need to be embedded, at most ``batch_size`` per batch
+    """
+    # Sessions cannot be shared between threads, so the reader opens its own
+    session = sessionmaker(bind=engine)()
+    # Rows are streamed from SQLite so that only one batch is held in memory at a time
+    rows = session.execute(
+        select(
+            Email.id,
+            Email.sender,
+            Email.subject,
+            Email.clean_body,
+            Email.body,
+            Email.timestamp,
+            Email.attachment_types,
+        ),
+        execution_options={"yield_per": batch_size},
+    )
+    try:
+        for partition in rows.partitions():
+            batch = EmbedBatch()
+            previous_hashes = read_hashes([str(email.id) for email in partition])
+            for email in partition:
+                metadata = build_metadata(
+                    email.sender, email.subject, email.timestamp, email.attachment_types
+                )
+                email_id = str(email.id)
+                document = email.clean_body if email.clean_body is not None else clean_text(email.body)
+                embedding_hash = compute_embedding_hash(document, metadata)
+                previous_hash = previous_hashes.get(email_id)
+                if previous_hash == embedding_hash:
+                    continue
+                if previous_hash is not None:
+                    batch.replaced_ids.append(email_id)
+
+                if email.sender is None:
+                    logger.warning(f"Email {email.id} has no sender")
+                if email.timestamp is None:
+                    logger.warning(f"Email {email.id} has no timestamp")
+                batch.documents.append(document)
+                batch.bodies.append(email.body)
+                batch.metadatas.append({**metadata, EMBEDDING_HASH_KEY: embedding_hash})
+                batch.ids.append(email_id)
+            progress.update(len(partition))
+            if batch.ids:
+                yield batch
+    finally:
+        session.close()
+
+
+def find_deleted_ids(engine: Engine, collection: "Collection", page_size: int) -> List[str]:
+    """Find the entries of a collection whose email is no longer in the database.
+
+    The ids of the collection are streamed a page at a time and looked up in
+    SQLite, so only the ids of deleted emails are held in memory.
+
+    Args:
+        engine (Engine): SQLAlchemy engine of the emails database
+        collection (Collection): Chroma collection
+        page_size (int): Number of ids read and looked up at a time
+
+    Returns:
+        list: Ids of the entries of deleted emails
+    """
+    deleted_ids = []
+    with sessionmaker(bind=engine)() as session:
+        for ids in iter_entry_ids(collection, page_size):
+            email_ids = [int(entry_id) for entry_id in ids if entry_id.isdigit()]
+            stored = {str(email_id) for (email_id,) in session.query(Email.id).filter(Email.id.in_(email_ids))}
+            deleted_ids.extend(entry_id for entry_id in ids if entry_id not in stored)
+    return deleted_ids
+
+
 def embed_emails(
     sql_path: str, embeddings_path: str, model_name: str, batch_size: int = 2500,
-    use_mps: bool = False
-) -> None:
+    use_mps: bool = False, rebuild: bool = False,
+    encode_batch_size: int = DEFAULT_ENCODE_BATCH_SIZE,
+    workers: int = 1, queue_size: int = 2,
+    backend: str = DEFAULT_BACKEND, dtype: str = DEFAULT_NUMPY_DTYPE,
+    store_documents: bool = True, use_embedding_cache: bool = True,
+    near_duplicates: bool = False,
+    near_duplicate_threshold: float = DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+) -> List[StageStats]:
     """Embed emails from SQLite database into vector database.
 
+    Embedding is incremental: every entry stores a hash of the document and
+    metadata it was built from, so only new or modified emails are embedded,
+    and entries of emails deleted from SQLite are removed. Hashes are read a
+    batch of emails at a time, and the collection is only scanned for entries
+    of deleted emails when its size shows there are some. Each model writes
+    to its own collection (see ``get_collection_name``), so switching
+    ``model_name`` builds a fresh collection. Metadata is typed so it can be
+    filtered on, see ``build_metadata``. The cleaned text of each email is
+    embedded rather than its raw body, see ``clean_text``.
+
+    Embeddings are cached on disk by model and content, see ``EmbeddingCache``,
+    so identical texts are encoded once, and rebuilds and other backends
+    reuse the embeddings computed before. Optionally, texts that are near
+    duplicates of another (quoted threads, newsletters, notifications) reuse
+    its embedding too, see ``MinHashLSH``.
+
+    Reading from SQLite, cache lookups, tokenization, encoding and writing to Chroma run as
+    separate pipeline stages on their own threads, connected by bounded
+    queues, so disk I/O overlaps with encoding. Every write bumps the
+    collection version, which invalidates cached search results.
+
     Args:
         sql_path (str): Path to SQLite database containing emails
         embeddings_path (str): Path to store embeddings database
         model_name (str): Name of sentence transformer model to use
-        batch_size (int): Number of emails to embed at once
+        batch_size (int): Number of emails read from SQLite and written to Chroma at once.
+            Peak memory depends on this, not on the number of emails
         use_mps (bool): Whether to use MPS (Metal Performance Shaders) for Apple Silicon
+        rebuild (bool): Discard the existing collection and embed every email again
+        encode_batch_size (int): Number of emails per model inference batch. Emails
+            of each storage batch are bucketed by token length before encoding
+        workers (int): Number of CPU processes encoding in parallel. Ignored when using MPS
+        queue_size (int): Maximum number of batches waiting between two pipeline stages
+        backend (str): Store the embeddings are kept in, see ``BACKENDS``. The NumPy
+            store, and the IVF/PQ index over it, are written once all emails are embedded
+        dtype (str): Storage type of the vectors of a new NumPy store, see ``NUMPY_DTYPES``
+        store_documents (bool): Store the raw bodies in the vector database too. Without
+            them only vectors and metadata are stored, and searches read the bodies
+            of their results from SQLite, see ``DocumentStore``
+        use_embedding_cache (bool): Reuse the embeddings of identical texts, and cache the
+            embeddings that are computed. Without it every text is encoded
+        near_duplicates (bool): Let texts reuse the embedding of a near duplicate,
+            trading a little accuracy for encode time. Near duplicates are looked for
+            among the last ``DEFAULT_MAX_SIGNATURES`` distinct texts, which bounds memory
+        near_duplicate_threshold (float): Smallest estimated Jaccard similarity of the
+            word shingles of two texts for them to be near duplicates
+
+    Returns:
+        list: Throughput and queue depth statistics of each pipeline stage
     """
-    engine = create_engine(f"sqlite:///{sql_path}")
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    from llm_email_search.encoder import EncoderPool, SentenceTransformerEncoder
+
+    engine = init_database(sql_path)
 
     # Configure device for Apple Silicon if requested
-    device_kwargs = {}
+    device = "cpu"
     if use_mps:
         try:
             import torch
             if torch.backends.mps.is_available():
                 logger.info("Using MPS (Metal Performance Shaders) for Apple Silicon acceleration")
-                device_kwargs = {"device": "mps"}
+                device = "mps"
             else:
                 logger.warning("MPS requested but not available. Using CPU instead.")
         except (ImportError, AttributeError):
             logger.warning("Could not import torch or MPS not supported. Using CPU instead.")
 
-    client = chromadb.PersistentClient(path=embeddings_path)
-    sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name=model_name, **device_kwargs
-    )
-    collection = client.get_or_create_collection(
-        "test_emails", embedding_function=sentence_transformer_ef
-    )
-
-    documents = []
-    metadatas = []
-    ids = []
-    for email in session.query(Email).all():
-        documents.append(email.body)
-        if email.sender is None:
-            logger.warning(f"Email {email.id} has no sender")
-        if email.timestamp is None:
-            logger.warning(f"Email {email.id} has no timestamp")
-        metadatas.append(
-            {
-                "sender": str(email.sender),
-                "subject": str(email.subject),
-                "timestamp": str(
-                    email.timestamp
-                ),  # Convert epoch milliseconds to string
-                "attachment_types": str(email.attachment_types),
-            }
+    encoder = SentenceTransformerEncoder(model_name, device=device)
+    collection = open_collection(
+        embeddings_path,
+        model_name,
+        embedding_function=encoder,
+        rebuild=rebuild,
+        backend=backend,
+        dtype=dtype,
+    )
+    if backend == CHROMA_BACKEND:
+        max_batch_size = get_max_batch_size(embeddings_path)
+        if batch_size > max_batch_size:
+            logger.warning(f"Reducing batch size to Chroma's maximum of {max_batch_size}")
+            batch_size = max_batch_size
+
+    with sessionmaker(bind=engine)() as session:
+        num_emails = session.query(func.count(Email.id)).scalar()
+    logger.info(
+        f"Checking {num_emails} emails against {collection.count()} embedded emails "
+        f"in collection {collection.name}"
+    )
+    # Entries are read by the read stage while the write stage changes the
+    # collection, which the NumPy store does not support concurrently
+    collection_lock = threading.Lock()
+    # Number of emails that already have an entry, to tell whether any entry was left by a deleted email
+    num_matched = 0
+
+    def read_hashes(ids: List[str]) -> Dict[str, str]:
+        nonlocal num_matched
+        with collection_lock:
+            hashes = get_embedding_hashes(collection, ids)
+        num_matched += len(hashes)
+        return hashes
+
+    cache = (
+        EmbeddingCache(get_embedding_cache_path(embeddings_path), model_name)
+        if use_embedding_cache
+        else None
+    )
+    # Signatures of texts whose embeddings are cached; without a cache, near
+    # duplicates are only looked for within a batch
+    near_duplicate_index = MinHashLSH(near_duplicate_threshold) if near_duplicates else None
+    num_identical = num_near_duplicates = num_encoded = 0
+    encode_seconds = 0.0
+
+    def lookup(batch: EmbedBatch) -> EmbedBatch:
+        nonlocal num_identical, num_near_duplicates
+        batch.keys = [content_key(document) for document in batch.documents]
+        cached = cache.get_many(batch.keys) if cache is not None else {}
+        batch.embeddings = np.empty((len(batch), encoder.dimension), dtype=np.float32)
+        index = near_duplicate_index
+        if near_duplicates and cache is None:
+            index = MinHashLSH(near_duplicate_threshold)
+        # Index of the first pending document of each key
+        pending_by_key: Dict[str, int] = {}
+        near_matches: List[Tuple[int, str]] = []
+        for i, (key, document) in enumerate(zip(batch.keys, batch.documents)):
+            if key in cached:
+                batch.embeddings[i] = cached[key]
+                num_identical += 1
+                if index is not None:
+                    index.add(key, index.signature(document))
+            elif cache is not None and key in pending_by_key:
+                batch.copies.append((i, pending_by_key[key]))
+                num_identical += 1
+            else:
+                if index is not None:
+                    signature = index.signature(document)
+                    match = index.query(signature)
+                    if match is not None:
+                        near_matches.append((i, match))
+                        continue
+                    index.add(key, signature)
+                pending_by_key[key] = i
+                batch.pending.append(i)
+
+        # Near duplicates of a text encoded by an earlier batch that is still
+        # being written are encoded themselves
+        unresolved = [match for _, match in near_matches if match not in pending_by_key]
+        matched = cache.get_many(unresolved) if cache is not None and unresolved else {}
+        for i, match in near_matches:
+            if match in pending_by_key:
+                batch.copies.append((i, pending_by_key[match]))
+            elif match in matched:
+                batch.embeddings[i] = matched[match]
+            else:
+                batch.pending.append(i)
+                continue
+            num_near_duplicates += 1
+        return batch
+
+    def tokenize(batch: EmbedBatch) -> EmbedBatch:
+        if batch.pending:
+            batch.tokenized = encoder.tokenize([batch.documents[i] for i in batch.pending])
+        return batch
+
+    def encode(batch: EmbedBatch) -> EmbedBatch:
+        nonlocal num_encoded, encode_seconds
+        if batch.pending:
+            start = time.perf_counter()
+            if pool is not None:
+                texts = [batch.documents[i] for i in batch.pending]
+                embeddings = pool.encode(texts, batch_size=encode_batch_size)
+            elif batch.tokenized is not None:
+                embeddings = encoder.encode_tokenized(batch.tokenized, batch_size=encode_batch_size)
+            else:
+                texts = [batch.documents[i] for i in batch.pending]
+                embeddings = encoder.encode(texts, batch_size=encode_batch_size)
+            encode_seconds += time.perf_counter() - start
+            num_encoded += len(batch.pending)
+            batch.embeddings[batch.pending] = embeddings
+            if cache is not None:
+                cache.put_many([batch.keys[i] for i in batch.pending], embeddings)
+        for i, source in batch.copies:
+            batch.embeddings[i] = batch.embeddings[source]
+        batch.tokenized = None
+        return batch
+
+    def write(batch: EmbedBatch) -> None:
+        with collection_lock:
+            # Modified entries are replaced rather than upserted, since upserts merge metadata
+            if batch.replaced_ids:
+                collection.delete(ids=batch.replaced_ids)
+            collection.add(
+                documents=batch.bodies if store_documents else None,
+                embeddings=batch.embeddings,
+                metadatas=batch.metadatas,
+                ids=batch.ids,
+            )
+        bump_collection_version(embeddings_path, model_name)
+
+    pool = None
+    stages = [("lookup", lookup), ("tokenize", tokenize), ("encode", encode), ("write", write)]
+    if workers > 1 and device == "cpu":
+        pool = EncoderPool(model_name, workers)
+        # Worker processes tokenize their own shards
+        stages.remove(("tokenize", tokenize))
+    elif workers > 1:
+        logger.warning(f"Multiple workers are only supported on CPU. Encoding on {device} instead.")
+
+    num_replaced = 0
+
+    def read() -> Iterator[EmbedBatch]:
+        nonlocal num_replaced
+        for batch in read_changed_emails(engine, read_hashes, batch_size, progress):
+            num_replaced += len(batch.replaced_ids)
+            yield batch
+
+    try:
+        with tqdm(total=num_emails) as progress:
+            stats = run_pipeline(("read", read), stages, queue_size=queue_size)
+    finally:
+        if pool is not None:
+            pool.close()
+        if cache is not None:
+            cache.close()
+
+    num_embedded = stats[0].items
+    # Every entry belongs to an email that was read, or else to a deleted email,
+    # so the collection is only scanned for deleted emails when there are some
+    num_added = num_embedded - num_replaced
+    has_deleted = collection.count() > num_matched + num_added
+    deleted_ids = find_deleted_ids(engine, collection, batch_size) if has_deleted else []
+    for i in range(0, len(deleted_ids), batch_size):
+        collection.delete(ids=deleted_ids[i : i + batch_size])
+    if backend != CHROMA_BACKEND:
+        collection.save()
+    if deleted_ids or backend != CHROMA_BACKEND:
+        bump_collection_version(embeddings_path, model_name)
+    logger.info(
+        f"Embedded {num_added} new and {num_replaced} modified emails, "
+        f"removed {len(deleted_ids)} deleted emails"
+    )
+    num_reused = num_identical + num_near_duplicates
+    if num_embedded:
+        # Time saved is estimated from the encode time of the texts that were encoded
+        saved = (
+            f", saving about {num_reused * encode_seconds / num_encoded:.1f} s of encoding"
+            if num_encoded
+            else ""
         )
-        ids.append(str(email.id))
-    logger.info(f"Embedding {len(documents)} emails")
-
-    for i in tqdm(range(0, len(documents), batch_size)):
-        collection.add(
-            documents=documents[i : min(i + batch_size, len(documents))],
-            metadatas=metadatas[i : min(i + batch_size, len(metadatas))],
-            ids=ids[i : min(i + batch_size, len(ids))],
+        logger.info(
+            f"Reused the embeddings of {num_reused} emails ({num_reused / num_embedded:.0%} hit rate): "
+            f"{num_identical} identical and {num_near_duplicates} near-duplicate texts; "
+            f"encoded {num_encoded} emails in {encode_seconds:.1f} s{saved}"
         )
+    for stage_stats in stats:
+        logger.info(f"Stage {stage_stats}")
+    if num_embedded:
+        bottleneck = max(stats, key=lambda stage_stats: stage_stats.busy_seconds)
+        logger.info(f"Bottleneck stage: {bottleneck.name}")
+
+    peak_rss_mb = get_peak_rss_mb()
+    if peak_rss_mb is not None:
+        logger.info(f"Peak memory usage (RSS): {peak_rss_mb:.0f} MB")
     logger.info(
         f"Embedding is complete. Collection now contains {collection.count()} embedded emails"
     )
+    return stats
 
 
 def main():
@@ -101,25 +488,101 @@ def main():
     parser.add_argument(
         "--model-name",
         type=str,
-        default="sentence-transformers/all-MiniLM-L6-v2",
-        help="Name of sentence transformer model (default: sentence-transformers/all-MiniLM-L6-v2)",
+        default=DEFAULT_MODEL_NAME,
+        help=f"Name of sentence transformer model (default: {DEFAULT_MODEL_NAME})",
     )
     parser.add_argument(
         "--batch-size",
         type=int,
         default=2500,
-        help="Batch size for embedding inference (default: 2500)",
+        help="Number of emails read from SQLite and written to Chroma at once (default: 2500)",
+    )
+    parser.add_argument(
+        "--encode-batch-size",
+        type=int,
+        default=DEFAULT_ENCODE_BATCH_SIZE,
+        help=f"Batch size for embedding inference (default: {DEFAULT_ENCODE_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of CPU processes encoding in parallel, up to the number of physical cores (default: 1)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=2,
+        help="Maximum number of batches waiting between two pipeline stages (default: 2)",
     )
     parser.add_argument(
         "--use-mps",
         action="store_true",
         help="Use MPS (Metal Performance Shaders) for Apple Silicon acceleration",
     )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Discard the existing embeddings and embed every email again",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=DEFAULT_BACKEND,
+        help="Store for the embeddings; numpy keeps them in memory-mapped files that open instantly, "
+        f"ivfpq adds an approximate index over those files (default: {DEFAULT_BACKEND})",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=NUMPY_DTYPES,
+        default=DEFAULT_NUMPY_DTYPE,
+        help=f"Storage type of the vectors of a new numpy or ivfpq store (default: {DEFAULT_NUMPY_DTYPE})",
+    )
+    parser.add_argument(
+        "--no-documents",
+        action="store_true",
+        help="Store only vectors and metadata, not the bodies, which searches read from the "
+        "SQLite database instead; use with --rebuild to drop bodies stored before",
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="Encode every text, rather than reusing the embeddings cached in the embeddings path",
+    )
+    parser.add_argument(
+        "--near-duplicates",
+        action="store_true",
+        help="Let emails that are near duplicates of another reuse its embedding; the signatures "
+        f"of the last {DEFAULT_MAX_SIGNATURES} distinct emails are kept, taking up to about 110 MB",
+    )
+    parser.add_argument(
+        "--near-duplicate-threshold",
+        type=float,
+        default=DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+        help="Smallest estimated Jaccard similarity of the word shingles of near duplicates "
+        f"(default: {DEFAULT_NEAR_DUPLICATE_THRESHOLD})",
+    )
     args = parser.parse_args()
     if not os.path.exists(args.sql_path):
         raise FileNotFoundError(f"SQLite database file not found at {args.sql_path}")
 
-    embed_emails(args.sql_path, args.embeddings_path, args.model_name, args.batch_size, args.use_mps)
+    embed_emails(
+        args.sql_path,
+        args.embeddings_path,
+        args.model_name,
+        args.batch_size,
+        args.use_mps,
+        args.rebuild,
+        args.encode_batch_size,
+        args.workers,
+        args.queue_size,
+        args.backend,
+        args.dtype,
+        not args.no_documents,
+        not args.no_embedding_cache,
+        args.near_duplicates,
+        args.near_duplicate_threshold,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,221 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Set
+
+import numpy as np
+
+# Keys looked up per statement; older SQLite builds allow at most 999 parameters
+MAX_KEYS_PER_QUERY = 900
+
+# MinHash signature length, split into bands of rows for locality-sensitive hashing.
+# Two texts become candidates if all rows of any band match; with 16 bands of
+# 8 rows, texts of Jaccard similarity 0.9 almost always do and texts of 0.5 rarely
+DEFAULT_NUM_PERMUTATIONS = 128
+DEFAULT_NUM_BANDS = 16
+# Smallest estimated Jaccard similarity of word shingles at which a text reuses
+# the embedding of another
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.9
+SHINGLE_SIZE = 3
+# Most signatures kept for near-duplicate search; each takes about 5.5 KB with
+# its bucket entries, so the default bounds the index to about 110 MB
+DEFAULT_MAX_SIGNATURES = 20000
+
+# Mersenne prime of the universal hash functions simulating permutations
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+def content_key(text: str) -> str:
+    """Hash of a text with its whitespace normalized.
+
+    Tokenizers ignore the kind and amount of whitespace between words, so
+    texts that differ only in whitespace get the same embedding and share a key.
+
+    Args:
+        text (str): Text to embed
+
+    Returns:
+        str: Hex-encoded SHA-256 of the normalized text
+    """
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk cache of embeddings keyed by model name and content hash.
+
+    Identical texts are encoded once, and the vectors are reused by every
+    collection and rebuild of the same model. The cache is a SQLite file
+    next to the vector database, see ``get_embedding_cache_path``.
+
+    Attributes:
+        path (str): Path to the SQLite file of the cache
+        model_name (str): Name of the model whose embeddings are looked up and stored
+    """
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        # Stages of the embedding pipeline use the cache from different threads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (model_name TEXT NOT NULL, "
+                "content_key TEXT NOT NULL, embedding BLOB NOT NULL, "
+                "PRIMARY KEY (model_name, content_key)) WITHOUT ROWID"
+            )
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Look up the embeddings of content keys.
+
+        Args:
+            keys (sequence): Content keys, see ``content_key``
+
+        Returns:
+            dict: Embedding per key that is cached
+        """
+        unique_keys = list(dict.fromkeys(keys))
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for i in range(0, len(unique_keys), MAX_KEYS_PER_QUERY):
+                chunk = unique_keys[i : i + MAX_KEYS_PER_QUERY]
+                rows = self._connection.execute(
+                    "SELECT content_key, embedding FROM embeddings WHERE model_name = ? "
+                    f"AND content_key IN ({', '.join('?' * len(chunk))})",
+                    [self.model_name, *chunk],
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+        return found
+
+    def put_many(self, keys: Sequence[str], embeddings: np.ndarray) -> None:
+        """Store embeddings; keys that are already cached keep their embedding.
+
+        Args:
+            keys (sequence): Content keys, see ``content_key``
+            embeddings (np.ndarray): Embedding of each key, one per row
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (model_name, content_key, embedding) VALUES (?, ?, ?)",
+                [(self.model_name, key, embedding.tobytes()) for key, embedding in zip(keys, embeddings)],
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model_name = ?", (self.model_name,)
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class MinHashLSH:
+    """Finds near-duplicate texts by MinHash signatures of their word shingles.
+
+    Signatures are split into bands, and texts sharing a whole band are
+    candidates. Candidates are confirmed by the fraction of matching
+    signature values, which estimates the Jaccard similarity of the shingles.
+
+    At most ``max_signatures`` texts are kept; beyond that, the text least
+    recently added or found as a near duplicate is forgotten, so memory stays
+    bounded however many texts are added.
+
+    Attributes:
+        threshold (float): Smallest estimated Jaccard similarity of a near duplicate
+        num_bands (int): Number of bands the signatures are split into
+        max_signatures (int): Most texts kept, or None for no limit
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+        num_permutations: int = DEFAULT_NUM_PERMUTATIONS,
+        num_bands: int = DEFAULT_NUM_BANDS,
+        seed: int = 0,
+        max_signatures: Optional[int] = DEFAULT_MAX_SIGNATURES,
+    ):
+        if num_permutations % num_bands:
+            raise ValueError("The number of permutations must be a multiple of the number of bands")
+        self.threshold = threshold
+        self.num_bands = num_bands
+        self.max_signatures = max_signatures
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, num_permutations, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, num_permutations, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, Set[Hashable]]] = [{} for _ in range(num_bands)]
+        # Least recently used first
+        self._signatures: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of the word shingles of a text.
+
+        Args:
+            text (str): Text to sign
+
+        Returns:
+            np.ndarray: One minimum hash per permutation
+        """
+        words = re.findall(r"\w+", text.lower())
+        shingles = {" ".join(words[i : i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+        # Stable across processes, unlike hash()
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) % MERSENNE_PRIME for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        # Values stay below 2**62, so the products do not overflow
+        permuted = (hashes[:, None] * self._a + self._b) % MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    def _bands(self, signature: np.ndarray) -> List[bytes]:
+        return [band.tobytes() for band in np.split(signature, self.num_bands)]
+
+    def query(self, signature: np.ndarray) -> Optional[Hashable]:
+        """Find the most similar added text that is a near duplicate.
+
+        Args:
+            signature (np.ndarray): Signature of the text, see ``signature``
+
+        Returns:
+            Hashable: Key of the most similar near duplicate, or None
+        """
+        candidates = set()
+        for bucket, band in zip(self._buckets, self._bands(signature)):
+            candidates.update(bucket.get(band, ()))
+        best_key, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        if best_key is not None:
+            self._signatures.move_to_end(best_key)
+        return best_key
+
+    def add(self, key: Hashable, signature: np.ndarray) -> None:
+        """Add a text that later texts may be near duplicates of.
+
+        Args:
+            key (Hashable): Key returned by ``query`` for near duplicates of the text
+            signature (np.ndarray): Signature of the text, see ``signature``
+        """
+        if key in self._signatures:
+            return
+        self._signatures[key] = signature
+        for bucket, band in zip(self._buckets, self._bands(signature)):
+            bucket.setdefault(band, set()).add(key)
+        if self.max_signatures is not None and len(self._signatures) > self.max_signatures:
+            oldest, oldest_signature = self._signatures.popitem(last=False)
+            for bucket, band in zip(self._buckets, self._bands(oldest_signature)):
+                bucket[band].discard(oldest)
+                if not bucket[band]:
+                    del bucket[band]
+
+    def __len__(self) -> int:
+        return len(self._signatures)
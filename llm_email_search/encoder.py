@@ -0,0 +1,279 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from sentence_transformers import SentenceTransformer
+from sentence_transformers.models import Transformer
+from sentence_transformers.util import batch_to_device
+
+from llm_email_search.logger import setup_logger
+from llm_email_search.vector_store import DEFAULT_ENCODE_BATCH_SIZE
+
+logger = setup_logger(__name__)
+
+# Token id lists per text, keyed by model input name (input_ids, attention_mask, ...)
+TokenizedTexts = Dict[str, List[List[int]]]
+
+
+class SentenceTransformerEncoder(EmbeddingFunction[Documents]):
+    """Chroma embedding function with control over how texts are batched for inference.
+
+    Produces the same embeddings as Chroma's ``SentenceTransformerEmbeddingFunction``,
+    so collections written by either can be queried with the other. Loaded
+    models are cached per (model name, device) for the lifetime of the process.
+
+    Texts are tokenized once, without padding, and then bucketed by their
+    exact token count into inference batches, so each batch is only padded to
+    the length of its own longest text. ``SentenceTransformer.encode`` instead
+    sorts by character count and tokenizes again for every call.
+
+    Attributes:
+        model_name (str): Name of the sentence transformer model
+        model (SentenceTransformer): Loaded model
+        normalize_embeddings (bool): Whether returned vectors are normalized to unit length
+    """
+
+    models: Dict[Any, SentenceTransformer] = {}
+
+    def __init__(
+        self,
+        model_name: str,
+        device: str = "cpu",
+        normalize_embeddings: bool = False,
+    ):
+        if (model_name, device) not in self.models:
+            logger.info(f"Loading model {model_name} on {device}")
+            self.models[(model_name, device)] = SentenceTransformer(model_name, device=device)
+        self.model_name = model_name
+        self.model = self.models[(model_name, device)]
+        self.normalize_embeddings = normalize_embeddings
+        # Pre-tokenization needs a Hugging Face transformer as first module
+        first_module = self.model[0]
+        self._transformer = first_module if isinstance(first_module, Transformer) else None
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return list(self.encode(list(input)))
+
+    @property
+    def dimension(self) -> int:
+        """Number of dimensions of the embeddings."""
+        return self.model.get_sentence_embedding_dimension()
+
+    def tokenize(self, texts: List[str]) -> Optional[TokenizedTexts]:
+        """Tokenize texts the way the model does, but without padding.
+
+        Args:
+            texts (list): Texts to tokenize
+
+        Returns:
+            dict: Token id lists per model input, or None if the model does not
+                support pre-tokenization
+        """
+        if self._transformer is None:
+            return None
+        texts = [str(text).strip() for text in texts]
+        if self._transformer.do_lower_case:
+            texts = [text.lower() for text in texts]
+        return dict(
+            self._transformer.tokenizer(
+                texts,
+                padding=False,
+                truncation="longest_first",
+                max_length=self._transformer.max_seq_length,
+            )
+        )
+
+    def _pad(self, tokenized: TokenizedTexts, indices: np.ndarray) -> Dict[str, torch.Tensor]:
+        length = max(len(tokenized["input_ids"][i]) for i in indices)
+        features = {}
+        for name, sequences in tokenized.items():
+            pad_value = self._transformer.tokenizer.pad_token_id if name == "input_ids" else 0
+            padded = np.full((len(indices), length), pad_value, dtype=np.int64)
+            for row, i in enumerate(indices):
+                padded[row, : len(sequences[i])] = sequences[i]
+            features[name] = torch.from_numpy(padded)
+        return features
+
+    def encode_tokenized(
+        self,
+        tokenized: TokenizedTexts,
+        batch_size: int = DEFAULT_ENCODE_BATCH_SIZE,
+        sort_by_length: bool = True,
+    ) -> np.ndarray:
+        """Embed pre-tokenized texts in inference batches of similar token length.
+
+        Args:
+            tokenized (dict): Result of ``tokenize``
+            batch_size (int): Number of texts per inference batch
+            sort_by_length (bool): Bucket texts by token count before batching;
+                when False texts are batched in input order
+
+        Returns:
+            numpy.ndarray: Embeddings with one row per text, in input order
+        """
+        lengths = [len(input_ids) for input_ids in tokenized["input_ids"]]
+        embeddings = np.empty((len(lengths), self.dimension), dtype=np.float32)
+        order = np.argsort(lengths, kind="stable") if sort_by_length else np.arange(len(lengths))
+
+        self.model.eval()
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start : start + batch_size]
+            features = batch_to_device(self._pad(tokenized, batch_indices), self.model.device)
+            with torch.inference_mode():
+                batch_embeddings = self.model(features)["sentence_embedding"]
+                if self.normalize_embeddings:
+                    batch_embeddings = torch.nn.functional.normalize(batch_embeddings, p=2, dim=1)
+            embeddings[batch_indices] = batch_embeddings.float().cpu().numpy()
+        return embeddings
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = DEFAULT_ENCODE_BATCH_SIZE,
+        sort_by_length: bool = True,
+    ) -> np.ndarray:
+        """Embed texts in inference batches of similar token length.
+
+        Args:
+            texts (list): Texts to embed
+            batch_size (int): Number of texts per inference batch
+            sort_by_length (bool): Bucket texts by token count before batching;
+                when False texts are batched in input order
+
+        Returns:
+            numpy.ndarray: Embeddings with one row per text, in input order
+        """
+        tokenized = self.tokenize(texts) if texts else None
+        if tokenized is None:
+            if not texts:
+                return np.empty((0, self.dimension), dtype=np.float32)
+            return self.model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize_embeddings,
+            ).astype(np.float32)
+        return self.encode_tokenized(tokenized, batch_size=batch_size, sort_by_length=sort_by_length)
+
+
+def get_physical_cores() -> int:
+    """Count the physical cores this process may run on.
+
+    Hyperthreads of the same core share its execution units, so encoding
+    does not scale beyond the number of physical cores. On Linux, the CPU
+    topology is read from sysfs; elsewhere the logical CPU count is used.
+
+    Returns:
+        int: Number of physical cores in the process's CPU affinity mask
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = os.sched_getaffinity(0)
+    else:
+        cpus = range(os.cpu_count() or 1)
+    cores = set()
+    for cpu in cpus:
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        try:
+            with open(f"{topology}/physical_package_id") as package_file, open(
+                f"{topology}/core_id"
+            ) as core_file:
+                cores.add((package_file.read().strip(), core_file.read().strip()))
+        except OSError:
+            return len(cpus)
+    return len(cores) or len(cpus)
+
+
+# Encoder of the current worker process, set up by _init_worker
+_worker_encoder = None
+
+
+def _init_worker(model_name: str, normalize_embeddings: bool, num_threads: int) -> None:
+    global _worker_encoder
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set before the first parallel operation
+        pass
+    _worker_encoder = SentenceTransformerEncoder(
+        model_name, device="cpu", normalize_embeddings=normalize_embeddings
+    )
+
+
+def _encode_in_worker(texts: List[str], batch_size: int) -> np.ndarray:
+    return _worker_encoder.encode(texts, batch_size=batch_size)
+
+
+class EncoderPool:
+    """Encodes texts on several CPU worker processes, each with its own copy of the model.
+
+    Every worker gets an equal share of the physical cores as torch threads,
+    so the workers do not oversubscribe the CPU. Texts are split into
+    contiguous shards and the embeddings are concatenated in input order, so
+    results do not depend on which worker finishes first.
+
+    Attributes:
+        model_name (str): Name of the sentence transformer model
+        workers (int): Number of worker processes
+        threads_per_worker (int): Number of torch threads per worker
+        shards_per_worker (int): Number of shards each ``encode`` call gives each
+            worker, to even out texts of different lengths
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        workers: int,
+        normalize_embeddings: bool = False,
+        threads_per_worker: Optional[int] = None,
+        shards_per_worker: int = 4,
+    ):
+        self.model_name = model_name
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, get_physical_cores() // workers)
+        self.shards_per_worker = shards_per_worker
+        logger.info(
+            f"Starting {workers} encoder processes with {self.threads_per_worker} threads each"
+        )
+        # Forking a process that already initialized torch can deadlock, so workers are spawned
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, normalize_embeddings, self.threads_per_worker),
+        )
+
+    def encode(
+        self, texts: List[str], batch_size: int = DEFAULT_ENCODE_BATCH_SIZE
+    ) -> np.ndarray:
+        """Embed texts on the worker processes.
+
+        Args:
+            texts (list): Texts to embed
+            batch_size (int): Number of texts per inference batch within a worker
+
+        Returns:
+            numpy.ndarray: Embeddings with one row per text, in input order
+        """
+        num_shards = min(len(texts), self.workers * self.shards_per_worker)
+        if num_shards == 0:
+            return np.empty((0, 0), dtype=np.float32)
+        shard_size = -(-len(texts) // num_shards)
+        shards = [texts[i : i + shard_size] for i in range(0, len(texts), shard_size)]
+        return np.concatenate(
+            list(self._executor.map(_encode_in_worker, shards, [batch_size] * len(shards)))
+        )
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        self._executor.shutdown()
+
+    def __enter__(self) -> "EncoderPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,415 @@
+import argparse
+import base64
+import email
+import mmap
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import timezone
+from email.header import decode_header, make_header
+from email.message import Message
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from tqdm import tqdm
+
+from llm_email_search.extract_emails_to_sqlite import parse_message_data
+from llm_email_search.logger import setup_logger
+from llm_email_search.models import ARCHIVE_SOURCE, bulk_insert_emails, compute_content_hash, init_database
+from llm_email_search.profiling import get_peak_rss_mb
+
+logger = setup_logger(__name__)
+
+# Archive formats: a single mbox file, a Maildir tree (one file per message in
+# cur/ and new/ directories), or a directory tree of .eml files
+MBOX_FORMAT = "mbox"
+MAILDIR_FORMAT = "maildir"
+EML_FORMAT = "eml"
+AUTO_FORMAT = "auto"
+ARCHIVE_FORMATS = (AUTO_FORMAT, MBOX_FORMAT, MAILDIR_FORMAT, EML_FORMAT)
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Bytes of an mbox parsed per task; memory use depends on this, not on the size of the file
+DEFAULT_SHARD_BYTES = 16 * 1024 * 1024
+# Maildir or EML files parsed per task
+DEFAULT_FILES_PER_SHARD = 500
+# Emails inserted per transaction
+DEFAULT_BATCH_SIZE = 5000
+# Tasks queued per worker process, so results never pile up faster than they are inserted
+TASKS_PER_WORKER = 2
+
+# Every message of an mbox starts with a "From " line
+MBOX_SEPARATOR = b"\nFrom "
+# "From " at the start of a body line is escaped as ">From " (and ">From " as ">>From ")
+MBOX_ESCAPED_FROM_PATTERN = re.compile(rb"^>(>*From )", re.M)
+
+# A range of bytes of an mbox file, or a list of message files
+Shard = Union[Tuple[int, int], List[str]]
+
+
+def find_mbox_shards(path: str, shard_bytes: int = DEFAULT_SHARD_BYTES) -> List[Tuple[int, int]]:
+    """Split an mbox file into byte ranges that start and end at message boundaries.
+
+    The file is memory-mapped, and only the bytes after each multiple of
+    ``shard_bytes`` are scanned, up to the next "From " line, so splitting a
+    file of many gigabytes reads a tiny part of it.
+
+    Args:
+        path (str): Path to the mbox file
+        shard_bytes (int): Approximate size of each range
+
+    Returns:
+        list: Start and end offset of each range, covering the whole file
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    boundaries = [0]
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        while boundaries[-1] + shard_bytes < size:
+            separator = data.find(MBOX_SEPARATOR, boundaries[-1] + shard_bytes)
+            if separator == -1:
+                break
+            boundaries.append(separator + 1)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def find_message_files(path: str, archive_format: str) -> List[str]:
+    """List the message files of a Maildir tree or a directory of .eml files.
+
+    Args:
+        path (str): Root directory of the archive
+        archive_format (str): ``MAILDIR_FORMAT`` or ``EML_FORMAT``
+
+    Returns:
+        list: Paths of the message files, sorted so imports are repeatable
+    """
+    paths = []
+    for root, directories, names in os.walk(path):
+        directories.sort()
+        if archive_format == MAILDIR_FORMAT:
+            # Messages still being delivered are in tmp/
+            if os.path.basename(root) in ("cur", "new"):
+                paths.extend(os.path.join(root, name) for name in sorted(names) if not name.startswith("."))
+        else:
+            paths.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(".eml"))
+    return paths
+
+
+def detect_archive_format(path: str) -> str:
+    """Tell the format of an archive: a file is an mbox, unless it is a single .eml file."""
+    if os.path.isfile(path):
+        return EML_FORMAT if path.lower().endswith(".eml") else MBOX_FORMAT
+    for root, directories, _ in os.walk(path):
+        if {"cur", "new"} <= set(directories):
+            return MAILDIR_FORMAT
+    return EML_FORMAT
+
+
+def decode_header_value(value: Optional[str]) -> Optional[str]:
+    """Decode RFC 2047 encoded words, such as "=?utf-8?q?...?=", in a header."""
+    if value is None:
+        return None
+    try:
+        return str(make_header(decode_header(value)))
+    except (LookupError, UnicodeError, ValueError):
+        return str(value)
+
+
+def part_to_payload(part: Message) -> Dict:
+    """Convert a MIME part to the shape of a Gmail API message payload.
+
+    Only text parts keep their content, decoded with their charset and
+    re-encoded as base64 UTF-8 like the Gmail API does; attachments keep
+    only their filename, which is all ``parse_message_data`` reads.
+
+    Args:
+        part (Message): The message, or one of its parts
+
+    Returns:
+        dict: Payload with mimeType, filename, body and, for multipart parts, parts
+    """
+    filename = decode_header_value(part.get_filename())
+    payload = {"mimeType": part.get_content_type(), "filename": filename or "", "body": {}}
+    if part.is_multipart():
+        payload["parts"] = [part_to_payload(subpart) for subpart in part.get_payload()]
+    elif part.get_content_maintype() == "text" and not filename:
+        data = part.get_payload(decode=True) or b""
+        try:
+            text = data.decode(part.get_content_charset() or "utf-8", errors="replace")
+        except LookupError:
+            text = data.decode("utf-8", errors="replace")
+        if text:
+            payload["body"]["data"] = base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+    return payload
+
+
+def message_to_gmail_format(message: Message) -> Dict:
+    """Convert a parsed email to the shape of a Gmail API message resource.
+
+    This lets offline archives go through ``parse_message_data``, so bodies
+    and attachments are extracted exactly as for emails downloaded from Gmail.
+
+    Args:
+        message (Message): Parsed email
+
+    Returns:
+        dict: Message resource with an id of None, and the Date header as internalDate
+    """
+    payload = part_to_payload(message)
+    payload["headers"] = [
+        {"name": name, "value": decode_header_value(message[name])}
+        for name in ("From", "Subject")
+        if message[name] is not None
+    ]
+    internal_date = None
+    try:
+        sent = parsedate_to_datetime(message["Date"])
+        if sent.tzinfo is None:
+            sent = sent.replace(tzinfo=timezone.utc)
+        internal_date = str(int(sent.timestamp() * 1000))
+    except (TypeError, ValueError, IndexError, OverflowError):
+        pass
+    return {"id": None, "internalDate": internal_date, "payload": payload}
+
+
+def parse_message_bytes(data: bytes) -> Dict[str, Union[str, int, None]]:
+    """Parse a raw email into the column values of the emails table."""
+    row = parse_message_data(message_to_gmail_format(email.message_from_bytes(data)))
+    row["content_hash"] = compute_content_hash(row)
+    row["source"] = ARCHIVE_SOURCE
+    return row
+
+
+def iter_mbox_messages(data: bytes) -> Iterator[bytes]:
+    """Split mbox content that starts at a message boundary into raw messages.
+
+    Args:
+        data (bytes): Content of one or more messages, each starting with its "From " line
+
+    Yields:
+        bytes: Each message without its "From " line and the blank line after it,
+            with escaped "From " lines restored
+    """
+    starts = [0] + [match.start() + 1 for match in re.finditer(re.escape(MBOX_SEPARATOR), data)]
+    for start, end in zip(starts, starts[1:] + [len(data)]):
+        header_end = data.find(b"\n", start, end)
+        if header_end == -1:
+            continue
+        message = data[header_end + 1 : end]
+        # The blank line before the next "From " line separates messages
+        if message.endswith(b"\r\n\r\n"):
+            message = message[:-2]
+        elif message.endswith(b"\n\n"):
+            message = message[:-1]
+        yield MBOX_ESCAPED_FROM_PATTERN.sub(rb"\1", message)
+
+
+def parse_shard(path: str, shard: Shard) -> List[Dict[str, Union[str, int, None]]]:
+    """Parse the emails of one shard; run in the worker processes.
+
+    Args:
+        path (str): Path to the mbox file, ignored for lists of message files
+        shard (tuple or list): Byte range of the mbox, or paths of message files
+
+    Returns:
+        list: Column values of each email of the shard
+    """
+    if isinstance(shard, tuple):
+        start, end = shard
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            messages = list(iter_mbox_messages(data[start:end]))
+    else:
+        messages = []
+        for message_path in shard:
+            with open(message_path, "rb") as file:
+                messages.append(file.read())
+    rows = []
+    for message in messages:
+        try:
+            rows.append(parse_message_bytes(message))
+        except Exception as e:
+            logger.warning(f"Skipping a message that could not be parsed: {e}")
+    return rows
+
+
+def get_shard_bytes(path: str, shard: Shard) -> int:
+    if isinstance(shard, tuple):
+        return shard[1] - shard[0]
+    return sum(os.path.getsize(message_path) for message_path in shard)
+
+
+def map_bounded(
+    function: Callable, path: str, shards: List[Shard], workers: int
+) -> Iterator[Tuple[Shard, List[Dict[str, Union[str, int, None]]]]]:
+    """Parse shards on worker processes, keeping few results in memory.
+
+    At most ``TASKS_PER_WORKER`` shards per worker are queued or finished but
+    not yet consumed, so memory stays bounded however large the archive is.
+    Results are yielded in the order they finish.
+
+    Args:
+        function (Callable): Function parsing a shard, called with ``path`` and the shard
+        path (str): Path to the archive
+        shards (list): Shards to parse
+        workers (int): Number of worker processes; with 1 shards are parsed in this process
+
+    Yields:
+        tuple: Each shard and its parsed emails
+    """
+    if workers <= 1:
+        for shard in shards:
+            yield shard, function(path, shard)
+        return
+    remaining = iter(shards)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: Dict[Future, Shard] = {}
+        while True:
+            for shard in remaining:
+                pending[executor.submit(function, path, shard)] = shard
+                if len(pending) >= workers * TASKS_PER_WORKER:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+def extract_archive_to_sqlite(
+    path: str,
+    database: str = "emails.db",
+    archive_format: str = AUTO_FORMAT,
+    workers: int = DEFAULT_WORKERS,
+    shard_bytes: int = DEFAULT_SHARD_BYTES,
+    files_per_shard: int = DEFAULT_FILES_PER_SHARD,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """Import an offline archive of emails (mbox, Maildir or .eml files) into SQLite.
+
+    An mbox is split at message boundaries into byte ranges (see
+    ``find_mbox_shards``), and a Maildir or .eml tree into lists of files.
+    Shards are parsed on a process pool with the same body and attachment
+    extraction as emails downloaded from Gmail (see ``message_to_gmail_format``),
+    and the emails are bulk inserted into the emails table a batch at a time.
+    Emails whose content hash is already stored are skipped, so an archive
+    can be imported again, or overlap with another archive. Copies synced
+    from Gmail are not recognised, since their timestamp is the time Gmail
+    received them rather than the Date header; imported emails are marked
+    with ``ARCHIVE_SOURCE`` so the Gmail sync never takes them for legacy
+    emails (see ``has_legacy_emails``).
+
+    Args:
+        path (str): Path to the mbox file, or the root directory of a Maildir or .eml tree
+        database (str): Path to SQLite database file
+        archive_format (str): Format of the archive, see ``ARCHIVE_FORMATS``;
+            detected from the path by default
+        workers (int): Number of processes parsing emails in parallel
+        shard_bytes (int): Approximate bytes of an mbox parsed per task
+        files_per_shard (int): Number of Maildir or .eml files parsed per task
+        batch_size (int): Number of emails inserted per transaction
+
+    Returns:
+        int: Number of emails inserted
+
+    Raises:
+        FileNotFoundError: If the archive does not exist
+        ValueError: If the format is not one of ``ARCHIVE_FORMATS``
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Archive not found at {path}")
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown format {archive_format}, expected one of {', '.join(ARCHIVE_FORMATS)}")
+    if archive_format == AUTO_FORMAT:
+        archive_format = detect_archive_format(path)
+
+    if archive_format == MBOX_FORMAT:
+        shards: List[Shard] = list(find_mbox_shards(path, shard_bytes))
+    else:
+        files = [path] if os.path.isfile(path) else find_message_files(path, archive_format)
+        shards = [files[i : i + files_per_shard] for i in range(0, len(files), files_per_shard)]
+    total_bytes = sum(get_shard_bytes(path, shard) for shard in shards)
+    logger.info(
+        f"Importing {total_bytes / (1024 * 1024):.0f} MB of {archive_format} in {len(shards)} shards "
+        f"with {workers} workers"
+    )
+
+    engine = init_database(database)
+    num_parsed = 0
+    num_inserted = 0
+    rows: List[Dict[str, Union[str, int, None]]] = []
+    with tqdm(total=total_bytes, unit="B", unit_scale=True) as progress:
+        for shard, shard_rows in map_bounded(parse_shard, path, shards, workers):
+            rows.extend(shard_rows)
+            num_parsed += len(shard_rows)
+            while len(rows) >= batch_size:
+                num_inserted += bulk_insert_emails(engine, rows[:batch_size])
+                del rows[:batch_size]
+            progress.update(get_shard_bytes(path, shard))
+        if rows:
+            num_inserted += bulk_insert_emails(engine, rows)
+
+    logger.info(
+        f"Parsed {num_parsed} emails, inserted {num_inserted} and skipped "
+        f"{num_parsed - num_inserted} already stored"
+    )
+    peak_rss_mb = get_peak_rss_mb()
+    if peak_rss_mb is not None:
+        logger.info(f"Peak memory usage (RSS): {peak_rss_mb:.0f} MB")
+    return num_inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import an mbox, Maildir or .eml archive to SQLite database")
+    parser.add_argument("path", type=str, help="mbox file, or root directory of a Maildir or .eml files")
+    parser.add_argument(
+        "--database",
+        type=str,
+        default="emails.db",
+        help="SQLite database file path (default: emails.db)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=ARCHIVE_FORMATS,
+        default=AUTO_FORMAT,
+        help="Format of the archive; auto treats files as mbox and detects Maildir trees (default: auto)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Number of processes parsing emails in parallel (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--shard-mb",
+        type=int,
+        default=DEFAULT_SHARD_BYTES // (1024 * 1024),
+        help=f"Megabytes of an mbox parsed per task (default: {DEFAULT_SHARD_BYTES // (1024 * 1024)})",
+    )
+    parser.add_argument(
+        "--files-per-shard",
+        type=int,
+        default=DEFAULT_FILES_PER_SHARD,
+        help=f"Number of Maildir or .eml files parsed per task (default: {DEFAULT_FILES_PER_SHARD})",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Number of emails inserted per transaction (default: {DEFAULT_BATCH_SIZE})",
+    )
+    args = parser.parse_args()
+    extract_archive_to_sqlite(
+        args.path,
+        args.database,
+        args.format,
+        args.workers,
+        args.shard_mb * 1024 * 1024,
+        args.files_per_shard,
+        args.batch_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,42 @@
 import argparse
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from typing import Dict, Optional
 
-import pandas as pd
-
-from llm_email_search.extract_emails_to_sqlite import Email, Base
-from llm_email_search.logger import setup_logger
-
-logger = setup_logger(__name__)
+from llm_email_search.csv_loader import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_CSV_PATH,
+    add_csv_arguments,
+    get_column_mapping,
+    load_csv_to_sqlite,
+)
 
 # Demo is based on the csv here:
 # https://www.kaggle.com/datasets/subhajournal/phishingemails
 
-def extract_demo_emails_to_sqlite(database: str = "demo_emails.db") -> None:
-    engine = create_engine(f"sqlite:///{database}")
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    Base.metadata.create_all(engine)
-
-    # Read the CSV file
-    df = pd.read_csv("data/Phishing_email.csv").drop_duplicates(subset=["Email Text"])
-    all_emails = []
-    for row in df["Email Text"]:
-        if row is None or row == "" or pd.isna(row):
-            continue
-        email = Email(
-            sender=None,
-            subject=None,
-            body=row,
-            timestamp=None,
-            attachment_types=None,
-        )
-        all_emails.append(email)
-    session.add_all(all_emails)
-    logger.info(f"Added {len(all_emails)} emails to the database")
-    session.commit()
-    session.close()
+def extract_demo_emails_to_sqlite(
+    database: str = "demo_emails.db",
+    csv_path: str = DEFAULT_CSV_PATH,
+    columns: Optional[Dict[str, str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Load the demo CSV into a SQLite database, skipping duplicate emails.
+
+    Args:
+        database (str): Path to SQLite database file
+        csv_path (str): Path to the CSV file
+        columns (dict, optional): CSV column of each email field, see ``load_csv_to_sqlite``
+        chunk_size (int): Number of CSV rows read and inserted at a time
+
+    Returns:
+        int: Number of emails inserted
+    """
+    return load_csv_to_sqlite(database, csv_path, columns, chunk_size, drop_duplicates=True)
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Extract public emails to SQLite database")
-    parser.add_argument("--database", type=str, default="demo_emails.db", help="Path to SQLite database file")
+    parser = argparse.ArgumentParser(description="Extract demo emails to SQLite database")
+    add_csv_arguments(parser, "demo_emails.db")
     args = parser.parse_args()
-    extract_demo_emails_to_sqlite(args.database)
+    extract_demo_emails_to_sqlite(args.database, args.csv_path, get_column_mapping(args), args.chunk_size)
 
 if __name__ == "__main__":
     main()
@@ -2,45 +2,102 @@ import argparse
 import base64
 import os
 import pickle
-from typing import Dict, List, Optional, Union
-
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build, Resource
-from sqlalchemy import Column, Integer, String, create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from googleapiclient.errors import HttpError
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from llm_email_search.gmail_fetch import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_WORKERS,
+    LIST_PAGE_SIZE,
+    METADATA_MESSAGE_FIELDS,
+    MessageFetcher,
+    QuotaLimiter,
+    chunked,
+    get_history_id,
+    is_not_found_error,
+    list_history_changes,
+    list_message_pages,
+)
 from llm_email_search.logger import setup_logger
+from llm_email_search.models import (  # noqa: F401 (re-exported for existing imports)
+    COLUMN_BACKFILLS,
+    CONTENT_HASH_FIELDS,
+    Base,
+    Email,
+    SyncState,
+    backfill_content_hashes,
+    compute_content_hash,
+    init_database,
+    upgrade_schema,
+)
+from llm_email_search.text_cleaning import clean_text
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import Resource
 
 logger = setup_logger(__name__)
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
 
-Base = declarative_base()
+# Keys of the resume cursor stored in the sync_state table
+CURSOR_PAGE_TOKEN = "list_page_token"
+CURSOR_PAGE_OFFSET = "list_page_offset"
+CURSOR_PROCESSED = "list_processed"
+CURSOR_START_HISTORY_ID = "list_start_history_id"
+# Set when the listing stopped at max_emails rather than being interrupted
+CURSOR_AT_LIMIT = "list_at_limit"
+CURSOR_KEYS = (
+    CURSOR_PAGE_TOKEN,
+    CURSOR_PAGE_OFFSET,
+    CURSOR_PROCESSED,
+    CURSOR_START_HISTORY_ID,
+    CURSOR_AT_LIMIT,
+)
+# History id of the mailbox at the last completed sync
+HISTORY_ID = "history_id"
+
+
+def get_sync_state(session: Session, key: str) -> Optional[str]:
+    """Read a sync state value.
+
+    Args:
+        session (Session): SQLAlchemy session
+        key (str): Name of the state entry
+
+    Returns:
+        str: Stored value, or None if the key is not set
+    """
+    state = session.get(SyncState, key)
+    return state.value if state is not None else None
 
 
-class Email(Base):
-    """SQLAlchemy model representing an email in the database.
+def set_sync_state(session: Session, key: str, value: Optional[str]) -> None:
+    """Write a sync state value. The change is committed with the session.
 
-    Attributes:
-        id (int): Primary key identifier for the email
-        sender (str): Email address of the sender
-        subject (str): Subject line of the email
-        body (str): Full text content of the email
-        timestamp (int): Epoch timestamp in milliseconds
-        attachment_types (str): Comma-separated list of file extensions for any attachments
+    Args:
+        session (Session): SQLAlchemy session
+        key (str): Name of the state entry
+        value (str): Value to store
     """
+    session.merge(SyncState(key=key, value=value))
+
 
-    __tablename__ = "emails"
-    id = Column(Integer, primary_key=True)
-    sender = Column(String, nullable=True)
-    subject = Column(String, nullable=True)
-    body = Column(String, nullable=False)
-    timestamp = Column(Integer, nullable=True)  # Store as epoch milliseconds
-    attachment_types = Column(String, nullable=True)
+def clear_sync_state(session: Session, keys: Iterable[str]) -> None:
+    """Delete sync state values. The change is committed with the session.
+
+    Args:
+        session (Session): SQLAlchemy session
+        keys (iterable): Names of the state entries to delete
+    """
+    session.query(SyncState).filter(SyncState.key.in_(list(keys))).delete(
+        synchronize_session=False
+    )
 
 
 def get_header(headers: List[Dict[str, str]], name: str) -> Optional[str]:
@@ -59,10 +116,31 @@ def get_header(headers: List[Dict[str, str]], name: str) -> Optional[str]:
     return None
 
 
+def iter_text_parts(payload: Dict) -> Iterator[Tuple[str, str]]:
+    """Walk a message payload and its nested multipart parts depth first.
+
+    Parts with a filename are attachments and are skipped.
+
+    Args:
+        payload (dict): The message payload, or one of its parts
+
+    Yields:
+        tuple: MIME type and decoded text of each text part with content
+    """
+    mime_type = payload.get("mimeType", "text/plain")
+    data = payload.get("body", {}).get("data")
+    if data and not payload.get("filename") and mime_type.startswith("text/"):
+        yield mime_type, base64.urlsafe_b64decode(data).decode("utf-8", errors="replace")
+    for part in payload.get("parts", []):
+        yield from iter_text_parts(part)
+
+
 def extract_message_body(payload: Dict) -> str:
     """Extract the text content from an email message payload.
 
-    Attempts to find and decode either plain text or HTML content from the message payload.
+    Nested multipart parts (such as a multipart/alternative inside a
+    multipart/mixed message) are searched too. Plain text is preferred, so
+    HTML is only returned for messages without a plain text part.
 
     Args:
         payload (dict): The message payload portion of a Gmail API message response
@@ -70,15 +148,13 @@ def extract_message_body(payload: Dict) -> str:
     Returns:
         str: Decoded text content of the email, or "No body text found" if no content could be extracted
     """
-    if "parts" in payload:
-        for part in payload["parts"]:
-            if part["mimeType"] == "text/plain" and "body" in part:
-                return base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8")
-            elif part["mimeType"] == "text/html" and "body" in part:
-                return base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8")
-    elif "body" in payload and "data" in payload["body"]:
-        return base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8")
-    return "No body text found."
+    html_body = None
+    for mime_type, text in iter_text_parts(payload):
+        if mime_type == "text/plain":
+            return text
+        if mime_type == "text/html" and html_body is None:
+            html_body = text
+    return html_body if html_body is not None else "No body text found."
 
 
 def extract_attachment_types(parts: List[Dict]) -> str:
@@ -102,27 +178,25 @@ def extract_attachment_types(parts: List[Dict]) -> str:
     return ",".join(attachment_types) if attachment_types else ""
 
 
-def extract_message_data(service: Resource, message_id: str) -> Dict[str, Union[str, int]]:
-    """Extract relevant data from a Gmail message.
+def parse_message_data(msg: Dict) -> Dict[str, Union[str, int]]:
+    """Extract relevant data from a Gmail API message resource.
 
     Args:
-        service: Authenticated Gmail API service object
-        message_id (str): ID of the Gmail message to process
+        msg (dict): Message resource returned by ``messages().get(format="full")``
 
     Returns:
         dict: Contains extracted message data with keys:
             - sender: Email address of sender
             - subject: Email subject line
             - body: Email content
+            - clean_body: Email content reduced to the text worth embedding, see ``clean_text``
             - attachment_types: Comma-separated list of attachment extensions
-            - timestamp: Datetime object of when message was sent/received
+            - timestamp: Epoch timestamp in milliseconds of when message was sent/received,
+              None if the message has no internalDate
+            - gmail_id: Gmail message id
+            - thread_id: Gmail thread id
+            - history_id: Gmail history id of the last change to the message
     """
-    msg = (
-        service.users()
-        .messages()
-        .get(userId="me", id=message_id, format="full")
-        .execute()
-    )
     payload = msg["payload"]
     headers = payload.get("headers", [])
 
@@ -134,19 +208,43 @@ def extract_message_data(service: Resource, message_id: str) -> Dict[str, Union[
     if "parts" in payload:
         attachment_types = extract_attachment_types(payload["parts"])
 
-    # Store raw epoch timestamp in milliseconds
-    timestamp = int(msg["internalDate"])
+    # Store raw epoch timestamp in milliseconds; imported archives may not have one
+    internal_date = msg.get("internalDate")
+    timestamp = int(internal_date) if internal_date is not None else None
 
     return {
         "sender": sender,
         "subject": subject,
         "body": body_text,
+        "clean_body": clean_text(body_text),
         "attachment_types": attachment_types,
         "timestamp": timestamp,
+        "gmail_id": msg["id"],
+        "thread_id": msg.get("threadId"),
+        "history_id": msg.get("historyId"),
     }
 
 
-def authenticate() -> Credentials:
+def extract_message_data(service: "Resource", message_id: str) -> Dict[str, Union[str, int]]:
+    """Extract relevant data from a Gmail message.
+
+    Args:
+        service: Authenticated Gmail API service object
+        message_id (str): ID of the Gmail message to process
+
+    Returns:
+        dict: Extracted message data, see ``parse_message_data``
+    """
+    msg = (
+        service.users()
+        .messages()
+        .get(userId="me", id=message_id, format="full")
+        .execute()
+    )
+    return parse_message_data(msg)
+
+
+def authenticate() -> "Credentials":
     """Authenticate with the Gmail API.
 
     Attempts to load cached credentials from token.pickle, refreshes expired credentials,
@@ -155,6 +253,10 @@ def authenticate() -> Credentials:
     Returns:
         google.oauth2.credentials.Credentials: Valid credentials for accessing Gmail API
     """
+    # The Google auth libraries are slow to import, so only load them when authenticating
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     creds = None
     # Load previously saved credentials
     if os.path.exists("token.pickle"):
@@ -176,45 +278,436 @@ def authenticate() -> Credentials:
     return creds
 
 
-def extract_emails(max_emails: int = 1000, database: str = "emails.db") -> None:
-    engine = create_engine(f"sqlite:///{database}")
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    Base.metadata.create_all(engine)
+def filter_unstored_message_ids(session: Session, message_ids: List[str]) -> List[str]:
+    """Drop the ids of messages that are already stored in the database.
 
-    creds = authenticate()
+    Args:
+        session (Session): SQLAlchemy session
+        message_ids (list): Gmail message ids
 
-    # Build the Gmail service
-    service = build("gmail", "v1", credentials=creds)
+    Returns:
+        list: Ids from ``message_ids`` without a stored email, in their original order
+    """
+    stored_ids = {
+        gmail_id
+        for (gmail_id,) in session.query(Email.gmail_id).filter(Email.gmail_id.in_(message_ids))
+    }
+    return [message_id for message_id in message_ids if message_id not in stored_ids]
+
+
+def has_legacy_emails(session: Session) -> bool:
+    """Check for emails downloaded from Gmail before message ids were stored.
+
+    Emails imported from archives or CSV files (see ``Email.source``) have no
+    Gmail id either, but are never legacy emails.
 
-    # Fetch messages
-    results = (
-        service.users().messages().list(userId="me", maxResults=max_emails).execute()
+    Args:
+        session (Session): SQLAlchemy session
+
+    Returns:
+        bool: True if any email from Gmail has a timestamp but no Gmail id
+    """
+    legacy_email = (
+        session.query(Email.id)
+        .filter(Email.gmail_id.is_(None), Email.source.is_(None), Email.timestamp.isnot(None))
+        .first()
     )
-    messages = results.get("messages", [])
-    logger.info(f"Found {len(messages)} emails")
-    all_emails = []
-    for message in messages:
-        message_data = extract_message_data(service, message["id"])
-        # Check if email with the same timestamp, sender, subject, body, and attachment types already exists
-        existing_email = (
-            session.query(Email)
-            .filter(
-                Email.timestamp == message_data["timestamp"],
-                Email.sender == message_data["sender"],
-                Email.subject == message_data["subject"],
-                Email.body == message_data["body"],
-                Email.attachment_types == message_data["attachment_types"],
+    return legacy_email is not None
+
+
+def adopt_legacy_emails(
+    session: Session, metadata_fetcher: MessageFetcher, message_ids: List[str]
+) -> List[str]:
+    """Match messages to legacy emails using only their metadata.
+
+    Emails stored before Gmail ids were recorded are matched on timestamp,
+    sender and subject, and get their Gmail ids assigned without downloading
+    the message bodies again.
+
+    Args:
+        session (Session): SQLAlchemy session, committed by the caller
+        metadata_fetcher (MessageFetcher): Fetcher requesting messages in "metadata" format
+        message_ids (list): Gmail message ids without a stored email
+
+    Returns:
+        list: Ids from ``message_ids`` that did not match a legacy email
+    """
+    messages = list(metadata_fetcher.fetch(message_ids))
+    timestamps = [int(msg["internalDate"]) for msg in messages]
+    legacy_emails = {
+        (timestamp, sender, subject): email_id
+        for email_id, timestamp, sender, subject in session.query(
+            Email.id, Email.timestamp, Email.sender, Email.subject
+        ).filter(Email.gmail_id.is_(None), Email.source.is_(None), Email.timestamp.in_(timestamps))
+    }
+
+    updates = []
+    for msg in messages:
+        headers = msg.get("payload", {}).get("headers", [])
+        key = (int(msg["internalDate"]), get_header(headers, "From"), get_header(headers, "Subject"))
+        email_id = legacy_emails.pop(key, None)
+        if email_id is not None:
+            updates.append(
+                {
+                    "id": email_id,
+                    "gmail_id": msg["id"],
+                    "thread_id": msg.get("threadId"),
+                    "history_id": msg.get("historyId"),
+                }
+            )
+    if updates:
+        session.execute(update(Email), updates)
+    adopted_ids = {row["gmail_id"] for row in updates}
+    return [message_id for message_id in message_ids if message_id not in adopted_ids]
+
+
+def store_new_messages(
+    session: Session,
+    fetcher: MessageFetcher,
+    message_ids: List[str],
+    metadata_fetcher: Optional[MessageFetcher] = None,
+) -> int:
+    """Download the messages not yet in the database and insert them.
+
+    Ids that are already stored are skipped before anything is downloaded. If
+    a ``metadata_fetcher`` is given, the remaining messages are first matched
+    to legacy emails by their metadata (see ``adopt_legacy_emails``). Only the
+    rest are downloaded in full and written with a single bulk
+    ``INSERT ... ON CONFLICT DO NOTHING``, so emails whose content hash is
+    already stored are skipped by the unique index.
+
+    Args:
+        session (Session): SQLAlchemy session, committed by the caller
+        fetcher (MessageFetcher): Fetcher used to download full messages
+        message_ids (list): Gmail message ids to store
+        metadata_fetcher (MessageFetcher, optional): Fetcher requesting messages in
+            "metadata" format, used to match legacy emails
+
+    Returns:
+        int: Number of emails inserted
+    """
+    new_ids = filter_unstored_message_ids(session, message_ids)
+    if new_ids and metadata_fetcher is not None:
+        new_ids = adopt_legacy_emails(session, metadata_fetcher, new_ids)
+    logger.debug(f"Downloading {len(new_ids)} of {len(message_ids)} listed messages")
+
+    rows = []
+    for msg in fetcher.fetch(new_ids):
+        message_data = parse_message_data(msg)
+        message_data["content_hash"] = compute_content_hash(message_data)
+        rows.append(message_data)
+    if not rows:
+        return 0
+    result = session.execute(insert(Email.__table__).on_conflict_do_nothing(), rows)
+    return result.rowcount
+
+
+def full_sync(
+    session: Session,
+    service: "Resource",
+    fetcher: MessageFetcher,
+    max_emails: Optional[int] = None,
+    chunk_size: int = LIST_PAGE_SIZE,
+    restart: bool = False,
+    metadata_fetcher: Optional[MessageFetcher] = None,
+) -> int:
+    """Walk the whole mailbox listing and store any new emails.
+
+    The mailbox is walked page by page and new emails are committed every
+    ``chunk_size`` messages, so memory stays flat regardless of mailbox size.
+    After each commit a resume cursor is saved in the ``sync_state`` table; an
+    interrupted sync continues from that cursor on the next run. A sync that
+    stops at ``max_emails`` keeps its cursor too, so the next run continues the
+    listing past it with a new allowance of ``max_emails``. Since the listing
+    walks from the newest message back, such a run first applies the changes
+    made to the mailbox since the listing started (see ``apply_history_changes``),
+    so new mail is downloaded on every run; if that history has expired, the
+    listing starts over from the newest message. Only once the listing
+    reaches the end of the mailbox is the history id from its start saved
+    for incremental syncs.
+
+    Args:
+        session (Session): SQLAlchemy session
+        service (Resource): Gmail API service object
+        fetcher (MessageFetcher): Fetcher used to download the messages
+        max_emails (int, optional): Maximum number of emails to list per run, counting those
+            listed before an interruption but not new emails found in the history;
+            None for the whole mailbox
+        chunk_size (int): Number of messages fetched and committed at a time
+        restart (bool): Ignore a saved resume cursor and start from the newest message
+        metadata_fetcher (MessageFetcher, optional): Fetcher requesting messages in
+            "metadata" format, used to match legacy emails
+
+    Returns:
+        int: Number of emails added to the database
+    """
+    if restart:
+        clear_sync_state(session, CURSOR_KEYS)
+        session.commit()
+    num_added = 0
+    start_history_id = get_sync_state(session, CURSOR_START_HISTORY_ID)
+    if start_history_id is not None and get_sync_state(session, CURSOR_AT_LIMIT):
+        # The listing resumes behind the messages that arrived since it started
+        try:
+            num_added, start_history_id = apply_history_changes(
+                session,
+                service,
+                fetcher,
+                start_history_id,
+                chunk_size=chunk_size,
+                metadata_fetcher=metadata_fetcher,
+            )
+        except HttpError as e:
+            if not is_not_found_error(e):
+                raise
+            session.rollback()
+            logger.warning(
+                f"History id {start_history_id} has expired, listing the mailbox from the newest message"
             )
-            .first()
+            clear_sync_state(session, CURSOR_KEYS)
+        else:
+            set_sync_state(session, CURSOR_START_HISTORY_ID, start_history_id)
+            clear_sync_state(session, (CURSOR_AT_LIMIT,))
+        session.commit()
+    start_page_token = get_sync_state(session, CURSOR_PAGE_TOKEN)
+    start_offset = int(get_sync_state(session, CURSOR_PAGE_OFFSET) or 0)
+    processed = int(get_sync_state(session, CURSOR_PROCESSED) or 0)
+    start_history_id = get_sync_state(session, CURSOR_START_HISTORY_ID)
+    if start_history_id is None:
+        # Changes made while the listing is walked are picked up by the next incremental sync
+        start_history_id = get_history_id(service, quota=fetcher.quota)
+    else:
+        logger.info(f"Resuming the mailbox listing from its saved cursor, {processed} emails into this run")
+
+    remaining = None if max_emails is None else max(0, max_emails - processed)
+    # The cursor page may be partially processed, so one extra stub is requested per skipped message
+    list_limit = None if remaining is None else remaining + start_offset
+    num_listed = 0
+    pages = list_message_pages(
+        service, max_emails=list_limit, page_token=start_page_token, quota=fetcher.quota
+    )
+    for page_index, (page_token, messages) in enumerate(pages):
+        num_listed += len(messages)
+        offset = start_offset if page_index == 0 else 0
+        message_ids = [message["id"] for message in messages[offset:]]
+        for chunk in chunked(message_ids, chunk_size):
+            num_added += store_new_messages(
+                session, fetcher, chunk, metadata_fetcher=metadata_fetcher
+            )
+            offset += len(chunk)
+            processed += len(chunk)
+            set_sync_state(session, CURSOR_PAGE_TOKEN, page_token)
+            set_sync_state(session, CURSOR_PAGE_OFFSET, str(offset))
+            set_sync_state(session, CURSOR_PROCESSED, str(processed))
+            set_sync_state(session, CURSOR_START_HISTORY_ID, start_history_id)
+            session.commit()
+            logger.info(f"Processed {processed} emails, added {num_added} new emails")
+
+    if list_limit is not None and num_listed >= list_limit:
+        # The listing stopped at max_emails rather than at the end of the mailbox
+        set_sync_state(session, CURSOR_PROCESSED, "0")
+        set_sync_state(session, CURSOR_AT_LIMIT, "1")
+        session.commit()
+        logger.info(f"Stopped after {max_emails} emails, the next run continues the listing from here")
+        return num_added
+    clear_sync_state(session, CURSOR_KEYS)
+    set_sync_state(session, HISTORY_ID, start_history_id)
+    session.commit()
+    return num_added
+
+
+def apply_history_changes(
+    session: Session,
+    service: "Resource",
+    fetcher: MessageFetcher,
+    start_history_id: str,
+    chunk_size: int = LIST_PAGE_SIZE,
+    metadata_fetcher: Optional[MessageFetcher] = None,
+) -> Tuple[int, str]:
+    """Apply the changes made to the mailbox since a history id.
+
+    Uses ``users.history.list`` to find messages added or deleted since
+    ``start_history_id``. Only the added messages are downloaded, and deleted
+    messages are removed from the database.
+
+    Args:
+        session (Session): SQLAlchemy session
+        service (Resource): Gmail API service object
+        fetcher (MessageFetcher): Fetcher used to download the messages
+        start_history_id (str): History id to apply the changes since
+        chunk_size (int): Number of messages fetched and committed at a time
+        metadata_fetcher (MessageFetcher, optional): Fetcher requesting messages in
+            "metadata" format, used to match legacy emails
+
+    Returns:
+        tuple: Number of emails added to the database and the current history id
+
+    Raises:
+        HttpError: With status 404 if ``start_history_id`` is too old to be listed
+    """
+    added_ids, deleted_ids, history_id = list_history_changes(
+        service, start_history_id, quota=fetcher.quota
+    )
+    logger.info(
+        f"Found {len(added_ids)} added and {len(deleted_ids)} deleted emails "
+        f"since history id {start_history_id}"
+    )
+
+    num_deleted = 0
+    for chunk in chunked(deleted_ids, chunk_size):
+        num_deleted += (
+            session.query(Email)
+            .filter(Email.gmail_id.in_(chunk))
+            .delete(synchronize_session=False)
         )
-        if not existing_email:
-            all_emails.append(Email(**message_data))
+    session.commit()
 
-    logger.info(f"Found {len(all_emails)} new emails to add to database")
-    if all_emails:
-        session.add_all(all_emails)
+    num_added = 0
+    for chunk in chunked(added_ids, chunk_size):
+        num_added += store_new_messages(
+            session, fetcher, chunk, metadata_fetcher=metadata_fetcher
+        )
         session.commit()
+    logger.info(f"Removed {num_deleted} deleted emails from database")
+    return num_added, history_id
+
+
+def incremental_sync(
+    session: Session,
+    service: "Resource",
+    fetcher: MessageFetcher,
+    start_history_id: str,
+    chunk_size: int = LIST_PAGE_SIZE,
+    metadata_fetcher: Optional[MessageFetcher] = None,
+) -> int:
+    """Apply the changes made to the mailbox since the last sync, see ``apply_history_changes``.
+
+    Args:
+        session (Session): SQLAlchemy session
+        service (Resource): Gmail API service object
+        fetcher (MessageFetcher): Fetcher used to download the messages
+        start_history_id (str): History id saved by the last sync
+        chunk_size (int): Number of messages fetched and committed at a time
+        metadata_fetcher (MessageFetcher, optional): Fetcher requesting messages in
+            "metadata" format, used to match legacy emails
+
+    Returns:
+        int: Number of emails added to the database
+
+    Raises:
+        HttpError: With status 404 if ``start_history_id`` is too old to be listed
+    """
+    num_added, history_id = apply_history_changes(
+        session,
+        service,
+        fetcher,
+        start_history_id,
+        chunk_size=chunk_size,
+        metadata_fetcher=metadata_fetcher,
+    )
+    set_sync_state(session, HISTORY_ID, history_id)
+    session.commit()
+    return num_added
+
+
+def extract_emails(
+    max_emails: Optional[int] = 1000,
+    database: str = "emails.db",
+    workers: int = DEFAULT_WORKERS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    chunk_size: int = LIST_PAGE_SIZE,
+    restart: bool = False,
+    incremental: bool = False,
+    service: Optional["Resource"] = None,
+    quota: Optional[QuotaLimiter] = None,
+) -> None:
+    """Download emails from Gmail and store any new ones in a SQLite database.
+
+    By default the mailbox listing is walked (see ``full_sync``). With
+    ``incremental`` set, only the changes since the last completed sync are
+    applied (see ``incremental_sync``); if no sync has completed yet, or the
+    saved history id has expired, a full sync is run instead.
+
+    Args:
+        max_emails (int, optional): Maximum number of emails to download, None for the whole mailbox
+        database (str): Path to SQLite database file
+        workers (int): Number of threads fetching messages concurrently
+        batch_size (int): Number of messages requested per Gmail batch request
+        chunk_size (int): Number of messages fetched and committed at a time
+        restart (bool): Ignore a saved resume cursor and start from the newest message
+        incremental (bool): Only apply changes since the last completed sync
+        service (Resource, optional): Gmail API service to use instead of
+            authenticating, e.g. a fake service in tests
+        quota (QuotaLimiter, optional): Quota limiter for Gmail API requests,
+            defaults to the per-user Gmail quota
+    """
+    engine = init_database(database)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    service_factory = None
+    if service is None:
+        creds = authenticate()
+
+        # Build the Gmail service, one per worker thread since httplib2 is not thread safe
+        def service_factory():
+            from googleapiclient.discovery import build
+
+            return build("gmail", "v1", credentials=creds)
+
+        service = service_factory()
+
+    fetcher = MessageFetcher(
+        service=service,
+        service_factory=service_factory,
+        workers=workers,
+        batch_size=batch_size,
+        quota=quota or QuotaLimiter(),
+    )
+    metadata_fetcher = None
+    if has_legacy_emails(session):
+        logger.info("Matching legacy emails without Gmail ids by their metadata")
+        metadata_fetcher = MessageFetcher(
+            service=service,
+            service_factory=service_factory,
+            workers=workers,
+            batch_size=batch_size,
+            quota=fetcher.quota,
+            message_format="metadata",
+            metadata_headers=["From", "Subject"],
+            fields=METADATA_MESSAGE_FIELDS,
+        )
+
+    num_added = None
+    history_id = get_sync_state(session, HISTORY_ID)
+    if incremental and history_id is None:
+        logger.info("No completed sync found, running a full sync")
+    elif incremental:
+        try:
+            num_added = incremental_sync(
+                session,
+                service,
+                fetcher,
+                history_id,
+                chunk_size=chunk_size,
+                metadata_fetcher=metadata_fetcher,
+            )
+        except HttpError as e:
+            if not is_not_found_error(e):
+                raise
+            session.rollback()
+            logger.warning(f"History id {history_id} has expired, running a full sync")
+    if num_added is None:
+        num_added = full_sync(
+            session,
+            service,
+            fetcher,
+            max_emails=max_emails,
+            chunk_size=chunk_size,
+            restart=restart,
+            metadata_fetcher=metadata_fetcher,
+        )
+    logger.info(f"Sync complete. Added {num_added} new emails to database")
 
     session.close()
 
@@ -231,10 +724,46 @@ def main():
         "--max_emails",
         type=int,
         default=1000,
-        help="Maximum number of emails to download (default: 1000)",
+        help="Maximum number of emails to download, 0 for the whole mailbox (default: 1000)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Number of threads fetching messages concurrently (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Number of messages per Gmail batch request, 1 disables batching (default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=LIST_PAGE_SIZE,
+        help=f"Number of emails fetched and committed at a time (default: {LIST_PAGE_SIZE})",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the resume cursor of an interrupted sync and start over",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only download changes since the last completed sync",
     )
     args = parser.parse_args()
-    extract_emails(max_emails=args.max_emails)
+    extract_emails(
+        max_emails=args.max_emails or None,
+        database=args.database,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        restart=args.restart,
+        incremental=args.incremental,
+    )
 
 
 if __name__ == "__main__":
@@ -1,45 +1,40 @@
 import argparse
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-
-import pandas as pd
-
-from llm_email_search.extract_emails_to_sqlite import Email
-from llm_email_search.logger import setup_logger
-
-logger = setup_logger(__name__)
-
-Base = declarative_base()
-def extract_public_emails_to_sqlite(database: str = "demo_emails.db") -> None:
-    engine = create_engine(f"sqlite:///{database}")
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    Base.metadata.create_all(engine)
-
-    # Read the CSV file
-    df = pd.read_csv("data/Phishing_email.csv")
-    all_emails = []
-    for row in df["Email Text"]:
-        email = Email(
-            sender=None,
-            subject=None,
-            body=row,
-            timestamp=None,
-            attachment_types=None,
-        )
-        all_emails.append(email)
-    session.add_all(all_emails)
-    logger.info(f"Added {len(all_emails)} emails to the database")
-    session.commit()
-    session.close()
+from typing import Dict, Optional
+
+from llm_email_search.csv_loader import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_CSV_PATH,
+    add_csv_arguments,
+    get_column_mapping,
+    load_csv_to_sqlite,
+)
+
+
+def extract_public_emails_to_sqlite(
+    database: str = "demo_emails.db",
+    csv_path: str = DEFAULT_CSV_PATH,
+    columns: Optional[Dict[str, str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Load a public CSV of emails into a SQLite database, keeping every row with a body.
+
+    Args:
+        database (str): Path to SQLite database file
+        csv_path (str): Path to the CSV file
+        columns (dict, optional): CSV column of each email field, see ``load_csv_to_sqlite``
+        chunk_size (int): Number of CSV rows read and inserted at a time
+
+    Returns:
+        int: Number of emails inserted
+    """
+    return load_csv_to_sqlite(database, csv_path, columns, chunk_size, drop_duplicates=False)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Extract public emails to SQLite database")
-    parser.add_argument("--database", type=str, default="demo_emails.db", help="Path to SQLite database file")
+    add_csv_arguments(parser, "demo_emails.db")
     args = parser.parse_args()
-    extract_public_emails_to_sqlite(args.database)
+    extract_public_emails_to_sqlite(args.database, args.csv_path, get_column_mapping(args), args.chunk_size)
 
 if __name__ == "__main__":
     main()
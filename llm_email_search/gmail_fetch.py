@@ -0,0 +1,499 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from llm_email_search.logger import setup_logger
+
+if TYPE_CHECKING:
+    # The discovery module is slow to import and only needed for type hints here
+    from googleapiclient.discovery import Resource
+
+logger = setup_logger(__name__)
+
+# Gmail API quota costs (see https://developers.google.com/gmail/api/reference/quota)
+MESSAGES_GET_QUOTA_UNITS = 5
+MESSAGES_LIST_QUOTA_UNITS = 5
+HISTORY_LIST_QUOTA_UNITS = 2
+GET_PROFILE_QUOTA_UNITS = 1
+DEFAULT_QUOTA_UNITS_PER_SECOND = 250
+
+# Gmail starts rate limiting batches larger than 50 requests
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+# Largest page size accepted by messages.list
+LIST_PAGE_SIZE = 500
+
+# Partial responses (fields=) that drop everything the sync does not store
+LIST_FIELDS = "messages(id,threadId),nextPageToken"
+FULL_MESSAGE_FIELDS = "id,threadId,historyId,internalDate,payload"
+METADATA_MESSAGE_FIELDS = "id,threadId,historyId,internalDate,payload/headers"
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Messages with these labels are not returned by messages.list, so moving a
+# message into them counts as a deletion
+EXCLUDED_LABELS = {"SPAM", "TRASH"}
+
+
+class QuotaLimiter:
+    """Token bucket that keeps requests under the per-user Gmail quota.
+
+    The refill rate adapts to the server: it is halved whenever a request is
+    throttled and grows back additively after successful requests.
+
+    Attributes:
+        max_units_per_second (float): Upper bound for the refill rate
+        min_units_per_second (float): Lower bound for the refill rate
+        units_per_second (float): Current refill rate
+    """
+
+    def __init__(
+        self,
+        units_per_second: float = DEFAULT_QUOTA_UNITS_PER_SECOND,
+        min_units_per_second: float = MESSAGES_GET_QUOTA_UNITS,
+    ):
+        self.max_units_per_second = units_per_second
+        self.min_units_per_second = min_units_per_second
+        self.units_per_second = units_per_second
+        self._available = units_per_second
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, units: float) -> None:
+        """Block until the requested number of quota units is available.
+
+        Args:
+            units (float): Number of quota units the next request will consume
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(
+                    self.units_per_second,
+                    self._available + (now - self._last_refill) * self.units_per_second,
+                )
+                self._last_refill = now
+                # Requests larger than one second of quota are let through on a full bucket
+                needed = min(units, self.units_per_second)
+                if self._available >= needed:
+                    self._available -= units
+                    return
+                wait = (needed - self._available) / self.units_per_second
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        """Additively increase the refill rate after a successful request."""
+        with self._lock:
+            self.units_per_second = min(
+                self.max_units_per_second,
+                self.units_per_second + self.max_units_per_second * 0.05,
+            )
+
+    def on_throttle(self) -> None:
+        """Halve the refill rate after the server rejected a request."""
+        with self._lock:
+            self.units_per_second = max(
+                self.min_units_per_second, self.units_per_second / 2
+            )
+            logger.warning(
+                f"Gmail API throttled requests, reducing rate to "
+                f"{self.units_per_second:.0f} quota units/sec"
+            )
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Check whether a Gmail API error is worth retrying.
+
+    Args:
+        error (Exception): Exception raised by (or returned for) a Gmail API request
+
+    Returns:
+        bool: True for rate limit (429) and server side (5xx) errors
+    """
+    return isinstance(error, HttpError) and error.resp.status in RETRYABLE_STATUS_CODES
+
+
+def is_not_found_error(error: Exception) -> bool:
+    """Check whether a Gmail API error means the requested resource does not exist.
+
+    Args:
+        error (Exception): Exception raised by (or returned for) a Gmail API request
+
+    Returns:
+        bool: True for 404 errors
+    """
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+
+def _backoff(attempt: int, initial_backoff: float, max_backoff: float) -> float:
+    delay = min(max_backoff, initial_backoff * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def execute_with_retry(
+    request,
+    quota: Optional[QuotaLimiter] = None,
+    units: float = MESSAGES_LIST_QUOTA_UNITS,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    initial_backoff: float = 1.0,
+    max_backoff: float = 32.0,
+) -> Dict:
+    """Execute a single Gmail API request, retrying throttled and failed attempts.
+
+    Args:
+        request: Gmail API request object with an ``execute`` method
+        quota (QuotaLimiter, optional): Quota limiter to acquire units from before each attempt
+        units (float): Quota units consumed by the request
+        max_retries (int): Number of retries before giving up
+        initial_backoff (float): Backoff in seconds before the first retry
+        max_backoff (float): Upper bound for the backoff between retries
+
+    Returns:
+        dict: Response of the request
+
+    Raises:
+        HttpError: If the request fails with a non-retryable error or retries are exhausted
+    """
+    attempt = 0
+    while True:
+        if quota is not None:
+            quota.acquire(units)
+        try:
+            response = request.execute()
+        except HttpError as e:
+            attempt += 1
+            if not is_retryable_error(e) or attempt > max_retries:
+                raise
+            if quota is not None:
+                quota.on_throttle()
+            time.sleep(_backoff(attempt, initial_backoff, max_backoff))
+            continue
+        if quota is not None:
+            quota.on_success()
+        return response
+
+
+def list_message_pages(
+    service: "Resource",
+    max_emails: Optional[int] = None,
+    page_token: Optional[str] = None,
+    page_size: int = LIST_PAGE_SIZE,
+    quota: Optional[QuotaLimiter] = None,
+) -> Iterator[Tuple[Optional[str], List[Dict]]]:
+    """Walk every page of ``messages().list``, following ``nextPageToken``.
+
+    Args:
+        service (Resource): Gmail API service object
+        max_emails (int, optional): Stop after this many messages, None for the whole mailbox
+        page_token (str, optional): Page token to start from, e.g. a saved resume cursor
+        page_size (int): Number of messages requested per page (at most 500)
+        quota (QuotaLimiter, optional): Quota limiter shared with the message fetcher
+
+    Yields:
+        tuple: The page token the page was requested with (None for the first page)
+            and the list of message stubs (``id`` and ``threadId``) on that page
+    """
+    remaining = max_emails
+    while remaining is None or remaining > 0:
+        request_kwargs = {
+            "userId": "me",
+            "maxResults": page_size if remaining is None else min(page_size, remaining),
+            "fields": LIST_FIELDS,
+        }
+        if page_token:
+            request_kwargs["pageToken"] = page_token
+        response = execute_with_retry(
+            service.users().messages().list(**request_kwargs), quota=quota
+        )
+        messages = response.get("messages", [])
+        if remaining is not None:
+            messages = messages[:remaining]
+            remaining -= len(messages)
+        yield page_token, messages
+
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+
+def get_history_id(service: "Resource", quota: Optional[QuotaLimiter] = None) -> str:
+    """Get the current history id of the mailbox.
+
+    Args:
+        service (Resource): Gmail API service object
+        quota (QuotaLimiter, optional): Quota limiter shared with the message fetcher
+
+    Returns:
+        str: History id of the most recent change to the mailbox
+    """
+    profile = execute_with_retry(
+        service.users().getProfile(userId="me"),
+        quota=quota,
+        units=GET_PROFILE_QUOTA_UNITS,
+    )
+    return str(profile["historyId"])
+
+
+def list_history_changes(
+    service: "Resource",
+    start_history_id: str,
+    quota: Optional[QuotaLimiter] = None,
+) -> Tuple[List[str], List[str], str]:
+    """Collect the messages added to and deleted from the mailbox since a history id.
+
+    Changes are replayed in order, so a message that was added and later
+    deleted within the window is only reported as deleted. Messages moved to
+    spam or trash (see ``EXCLUDED_LABELS``) count as deleted, and messages
+    taken out of them again count as added.
+
+    Args:
+        service (Resource): Gmail API service object
+        start_history_id (str): History id of the last sync
+        quota (QuotaLimiter, optional): Quota limiter shared with the message fetcher
+
+    Returns:
+        tuple: Ids of added messages (oldest first), ids of deleted messages,
+            and the history id to start the next sync from
+
+    Raises:
+        HttpError: With status 404 if ``start_history_id`` is too old to be listed
+    """
+    changes = {}
+    history_id = start_history_id
+    page_token = None
+    while True:
+        request_kwargs = {
+            "userId": "me",
+            "startHistoryId": start_history_id,
+            "historyTypes": ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"],
+        }
+        if page_token:
+            request_kwargs["pageToken"] = page_token
+        response = execute_with_retry(
+            service.users().history().list(**request_kwargs),
+            quota=quota,
+            units=HISTORY_LIST_QUOTA_UNITS,
+        )
+        for record in response.get("history", []):
+            for added in record.get("messagesAdded", []):
+                message = added["message"]
+                if EXCLUDED_LABELS.isdisjoint(message.get("labelIds", [])):
+                    changes.pop(message["id"], None)
+                    changes[message["id"]] = True
+            for deleted in record.get("messagesDeleted", []):
+                changes[deleted["message"]["id"]] = False
+            for labeled in record.get("labelsAdded", []):
+                if not EXCLUDED_LABELS.isdisjoint(labeled.get("labelIds", [])):
+                    changes[labeled["message"]["id"]] = False
+            for unlabeled in record.get("labelsRemoved", []):
+                message = unlabeled["message"]
+                restored = not EXCLUDED_LABELS.isdisjoint(unlabeled.get("labelIds", []))
+                # A message taken out of trash may still be in spam, and the other way round
+                if restored and EXCLUDED_LABELS.isdisjoint(message.get("labelIds", [])):
+                    changes.pop(message["id"], None)
+                    changes[message["id"]] = True
+        history_id = str(response.get("historyId", history_id))
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+    added_ids = [message_id for message_id, added in changes.items() if added]
+    deleted_ids = [message_id for message_id, added in changes.items() if not added]
+    return added_ids, deleted_ids, history_id
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """Split an iterable into lists of at most ``size`` items without materializing it.
+
+    Args:
+        items (iterable): Items to split
+        size (int): Maximum number of items per chunk
+
+    Yields:
+        list: Consecutive chunks of items
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class MessageFetcher:
+    """Fetches Gmail messages concurrently using batch requests and a worker pool.
+
+    Message ids are split into chunks of ``batch_size``. Each chunk is sent as a
+    single Gmail batch HTTP request (or as individual requests when
+    ``batch_size`` is 1) on one of ``workers`` threads. Messages are yielded in
+    the same order as the ids they were requested with.
+
+    Attributes:
+        service (Resource): Gmail API service used when no service factory is given
+        service_factory (callable): Builds a separate service per worker thread, since
+            the underlying httplib2 connections are not thread safe
+        workers (int): Number of worker threads
+        batch_size (int): Number of messages fetched per batch request
+        max_retries (int): Number of retries for throttled or failed requests
+        initial_backoff (float): Backoff in seconds before the first retry
+        max_backoff (float): Upper bound for the backoff between retries
+        quota (QuotaLimiter): Shared quota limiter for all worker threads
+        message_format (str): Format passed to ``messages().get``
+        metadata_headers (list): Headers returned when ``message_format`` is "metadata"
+        fields (str): Partial response selector passed to ``messages().get``
+    """
+
+    def __init__(
+        self,
+        service: Optional["Resource"] = None,
+        service_factory: Optional[Callable[[], "Resource"]] = None,
+        workers: int = DEFAULT_WORKERS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 32.0,
+        quota: Optional[QuotaLimiter] = None,
+        message_format: str = "full",
+        metadata_headers: Optional[List[str]] = None,
+        fields: Optional[str] = FULL_MESSAGE_FIELDS,
+    ):
+        if service is None and service_factory is None:
+            raise ValueError("Either service or service_factory must be provided")
+        if not 1 <= batch_size <= 100:
+            raise ValueError("batch_size must be between 1 and 100")
+        self.service = service
+        self.service_factory = service_factory
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.quota = quota or QuotaLimiter()
+        self.message_format = message_format
+        self.metadata_headers = metadata_headers
+        self.fields = fields
+        self._local = threading.local()
+
+    def _get_service(self) -> "Resource":
+        if self.service_factory is None:
+            return self.service
+        if not hasattr(self._local, "service"):
+            self._local.service = self.service_factory()
+        return self._local.service
+
+    def _get_request(self, service: "Resource", message_id: str):
+        request_kwargs = {"userId": "me", "id": message_id, "format": self.message_format}
+        if self.metadata_headers:
+            request_kwargs["metadataHeaders"] = self.metadata_headers
+        if self.fields:
+            request_kwargs["fields"] = self.fields
+        return service.users().messages().get(**request_kwargs)
+
+    def _execute_once(
+        self, message_ids: List[str]
+    ) -> Tuple[Dict[str, Dict], Dict[str, Exception]]:
+        service = self._get_service()
+        responses = {}
+        errors = {}
+
+        if self.batch_size == 1:
+            for message_id in message_ids:
+                try:
+                    responses[message_id] = self._get_request(service, message_id).execute()
+                except HttpError as e:
+                    errors[message_id] = e
+            return responses, errors
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = exception
+            else:
+                responses[request_id] = response
+
+        batch = service.new_batch_http_request(callback=callback)
+        for message_id in message_ids:
+            batch.add(self._get_request(service, message_id), request_id=message_id)
+        try:
+            batch.execute()
+        except HttpError as e:
+            # The whole batch was rejected, so every message in it has to be retried
+            return {}, {message_id: e for message_id in message_ids}
+        return responses, errors
+
+    def fetch_chunk(self, message_ids: List[str]) -> List[Dict]:
+        """Fetch a chunk of messages, retrying throttled and failed requests.
+
+        Messages that no longer exist (404) are skipped with a warning.
+
+        Args:
+            message_ids (list): Gmail message ids to fetch
+
+        Returns:
+            list: Gmail API message resources, in the order of ``message_ids``
+
+        Raises:
+            HttpError: If a request fails with a non-retryable error or retries are exhausted
+        """
+        results = {}
+        pending = list(message_ids)
+        attempt = 0
+        while pending:
+            self.quota.acquire(MESSAGES_GET_QUOTA_UNITS * len(pending))
+            responses, errors = self._execute_once(pending)
+            results.update(responses)
+
+            retry = []
+            for message_id, error in errors.items():
+                if is_retryable_error(error):
+                    retry.append(message_id)
+                elif is_not_found_error(error):
+                    logger.warning(f"Message {message_id} no longer exists, skipping")
+                else:
+                    raise error
+
+            if not retry:
+                self.quota.on_success()
+                break
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise errors[retry[0]]
+            self.quota.on_throttle()
+            delay = _backoff(attempt, self.initial_backoff, self.max_backoff)
+            logger.info(
+                f"Retrying {len(retry)} messages in {delay:.1f}s "
+                f"(attempt {attempt}/{self.max_retries})"
+            )
+            time.sleep(delay)
+            pending = [message_id for message_id in pending if message_id in retry]
+
+        return [results[message_id] for message_id in message_ids if message_id in results]
+
+    def fetch(self, message_ids: Iterable[str]) -> Iterator[Dict]:
+        """Fetch messages concurrently, yielding them in the order they were requested.
+
+        At most ``2 * workers`` chunks are in flight at any time, so ids can be
+        streamed in lazily without buffering the whole mailbox.
+
+        Args:
+            message_ids (iterable): Gmail message ids to fetch
+
+        Yields:
+            dict: Gmail API message resources
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = deque()
+            for chunk in chunked(message_ids, self.batch_size):
+                in_flight.append(executor.submit(self.fetch_chunk, chunk))
+                if len(in_flight) >= 2 * self.workers:
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
@@ -0,0 +1,101 @@
+import re
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from llm_email_search.logger import setup_logger
+from llm_email_search.models import FTS_TABLE, init_database
+
+logger = setup_logger(__name__)
+
+# Number of candidates each leg of a hybrid search contributes before fusion
+DEFAULT_LEXICAL_DEPTH = 50
+DEFAULT_VECTOR_DEPTH = 50
+
+# Damping constant of reciprocal rank fusion; 60 is the value from the original paper
+DEFAULT_RRF_K = 60
+
+
+def to_fts_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query matching any of its words.
+
+    Each word is quoted, so characters with a meaning in the FTS5 query
+    syntax (such as ``-``, ``:`` or ``*``) are matched literally. Emails
+    matching more of the words rank higher under BM25.
+
+    Args:
+        query (str): Search query text
+
+    Returns:
+        str: FTS5 query, or None if the query has no words
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+class LexicalIndex:
+    """BM25 keyword search over the SQLite full-text index of the emails.
+
+    Attributes:
+        sql_path (str): Path to SQLite database containing emails
+    """
+
+    def __init__(self, sql_path: str):
+        """Open the database, building the full-text index if it does not exist yet.
+
+        Args:
+            sql_path (str): Path to SQLite database containing emails
+        """
+        self.sql_path = sql_path
+        init_database(sql_path).dispose()
+
+    def search(self, query: str, limit: int = DEFAULT_LEXICAL_DEPTH) -> List[Tuple[str, float]]:
+        """Find the emails that best match the words of a query.
+
+        Args:
+            query (str): Search query text
+            limit (int): Largest number of emails to return
+
+        Returns:
+            list: Email ids (as strings, like the ids of the vector store) and
+                their BM25 scores, best match first. Lower scores are better
+        """
+        fts_query = to_fts_query(query)
+        if fts_query is None:
+            return []
+        # A connection per search, so searches can run on any thread
+        connection = sqlite3.connect(self.sql_path)
+        try:
+            rows = connection.execute(
+                f"SELECT rowid, bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH ? ORDER BY score LIMIT ?",
+                (fts_query, limit),
+            ).fetchall()
+        finally:
+            connection.close()
+        return [(str(email_id), score) for email_id, score in rows]
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], k: int = DEFAULT_RRF_K
+) -> List[Tuple[str, float]]:
+    """Merge rankings by reciprocal rank fusion.
+
+    Each id scores ``1 / (k + rank)`` in every ranking it appears in, with
+    ranks starting at 1, and the scores are summed. Only ranks are used, so
+    BM25 scores and vector distances do not need to be comparable.
+
+    Args:
+        rankings (sequence): Rankings of ids, best first
+        k (int): Damping constant; larger values flatten the difference
+            between top and lower ranks
+
+    Returns:
+        list: Ids and fused scores, best first; ties keep first-seen order
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
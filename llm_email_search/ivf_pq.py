@@ -0,0 +1,562 @@
+import argparse
+import json
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from llm_email_search.logger import setup_logger
+from llm_email_search.numpy_store import NumpyCollection, make_temp_directory, replace_directory
+from llm_email_search.vector_store import (
+    DEFAULT_MODEL_NAME,
+    bump_collection_version,
+    get_collection_name,
+    get_ivf_pq_path,
+    get_numpy_store_path,
+)
+
+logger = setup_logger(__name__)
+
+# Number of inverted lists searched per query; more lists find more of the
+# true nearest neighbours at the cost of latency
+DEFAULT_NPROBE = 16
+# Number of candidates re-scored with their stored vectors before the top k are returned
+DEFAULT_SHORTLIST = 100
+# Filtered queries search this many times more candidates, of which only those
+# passing the filter are re-scored
+FILTERED_SHORTLIST_FACTOR = 10
+# Number of sub-vectors each vector is split into; each is stored as one byte
+DEFAULT_SUBQUANTIZERS = 48
+# Centroids per sub-vector codebook, so each code fits in a byte
+CODEBOOK_SIZE = 256
+DEFAULT_KMEANS_ITERATIONS = 20
+# Training points per inverted list; more gives better centroids but slower training
+TRAINING_POINTS_PER_LIST = 64
+MAX_CODEBOOK_TRAINING_POINTS = 65536
+# An index is trained again when the store grows so much that the default
+# number of lists for it is more than this many times that of the trained index
+RETRAIN_GROWTH_FACTOR = 2
+
+MANIFEST_FILE = "manifest.json"
+
+
+def get_default_nlist(count: int) -> int:
+    """Number of inverted lists for a number of vectors, about 4 * sqrt(count)."""
+    return max(1, min(count, int(4 * math.sqrt(count))))
+
+
+def nearest_centroids(points: np.ndarray, centroids: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+    """Index of the nearest centroid of every point, computed in batches to bound memory."""
+    nearest = np.empty(len(points), dtype=np.int64)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    for start in range(0, len(points), batch_size):
+        batch = points[start : start + batch_size]
+        # The squared norm of the point is the same for every centroid, so it is left out
+        nearest[start : start + batch_size] = (centroid_norms - 2 * batch @ centroids.T).argmin(axis=1)
+    return nearest
+
+
+def squared_distances(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Squared L2 distances between every point and every centroid."""
+    distances = (
+        (points ** 2).sum(axis=1)[:, None]
+        - 2 * points @ centroids.T
+        + (centroids ** 2).sum(axis=1)[None, :]
+    )
+    return np.maximum(distances, 0)
+
+
+def kmeans(
+    points: np.ndarray,
+    num_clusters: int,
+    iterations: int = DEFAULT_KMEANS_ITERATIONS,
+    seed: int = 0,
+) -> np.ndarray:
+    """Cluster points with Lloyd's algorithm.
+
+    Centroids start at randomly chosen points; a centroid that loses all of
+    its points is moved to a random point.
+
+    Args:
+        points (np.ndarray): Points to cluster, one per row
+        num_clusters (int): Number of clusters, at most the number of points
+        iterations (int): Number of assignment and update rounds
+        seed (int): Seed of the random choices
+
+    Returns:
+        np.ndarray: Centroids, one per row
+    """
+    rng = np.random.default_rng(seed)
+    points = np.asarray(points, dtype=np.float32)
+    centroids = points[rng.choice(len(points), num_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroids(points, centroids)
+        counts = np.bincount(assignments, minlength=num_clusters)
+        # Sum the points of each cluster by sorting them into contiguous runs
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(points[order], starts[~empty], axis=0)
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = points[rng.choice(len(points), int(empty.sum()))]
+    return centroids
+
+
+def exact_rerank(
+    query: np.ndarray, ids: Sequence[str], vectors: np.ndarray, k: int
+) -> Tuple[List[str], List[float]]:
+    """Rank candidates by their exact squared L2 distance to a query.
+
+    Args:
+        query (np.ndarray): Query embedding
+        ids (sequence): Ids of the candidates
+        vectors (np.ndarray): Vector of each candidate
+        k (int): Number of candidates to keep
+
+    Returns:
+        tuple: Ids and distances of the k nearest candidates, nearest first
+    """
+    if not len(ids):
+        return [], []
+    distances = ((np.asarray(vectors, dtype=np.float32) - query) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return [ids[i] for i in order], distances[order].tolist()
+
+
+class IVFPQIndex:
+    """Approximate nearest neighbour index with inverted lists and product quantization.
+
+    A coarse k-means quantizer splits the vectors into ``nlist`` inverted
+    lists. Within a list, each vector is stored as the residual from its
+    list's centroid, compressed by product quantization: the residual is
+    split into ``m`` sub-vectors, and each is replaced by the index of the
+    nearest of 256 centroids of its codebook, so a vector takes ``m`` bytes.
+
+    A search visits the ``nprobe`` lists whose centroids are nearest to the
+    query and estimates distances from the codes with one lookup table per
+    list. New vectors are added to the trained lists without retraining.
+
+    Attributes:
+        coarse_centroids (np.ndarray): Centroid of each inverted list
+        codebooks (np.ndarray): Sub-vector centroids, shaped (m, 256, dimensions / m)
+        ids (np.ndarray): Id of each stored vector, grouped by list
+        codes (np.ndarray): Codes of each stored vector, shaped (count, m)
+        offsets (np.ndarray): Start of each list in ``ids`` and ``codes``, plus the end
+        trained_count (int): Number of vectors the index was trained on
+    """
+
+    def __init__(self, coarse_centroids: np.ndarray, codebooks: np.ndarray, trained_count: int = 0):
+        self.coarse_centroids = np.asarray(coarse_centroids, dtype=np.float32)
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+        self.trained_count = trained_count
+        self.ids = np.empty(0, dtype=str)
+        self.codes = np.empty((0, self.num_subquantizers), dtype=np.uint8)
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.coarse_centroids)
+
+    @property
+    def num_subquantizers(self) -> int:
+        return len(self.codebooks)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def train(
+        cls,
+        embeddings: np.ndarray,
+        nlist: Optional[int] = None,
+        num_subquantizers: int = DEFAULT_SUBQUANTIZERS,
+        iterations: int = DEFAULT_KMEANS_ITERATIONS,
+        seed: int = 0,
+    ) -> "IVFPQIndex":
+        """Train the coarse quantizer and the codebooks on a sample of embeddings.
+
+        Args:
+            embeddings (np.ndarray): Training embeddings, one per row
+            nlist (int, optional): Number of inverted lists; defaults to ``get_default_nlist``
+            num_subquantizers (int): Number of sub-vectors per vector; lowered to the
+                nearest divisor of the number of dimensions
+            iterations (int): k-means rounds
+            seed (int): Seed of the random choices
+
+        Returns:
+            IVFPQIndex: Empty index, ready for ``add``
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        count, dimensions = embeddings.shape
+        nlist = min(nlist or get_default_nlist(count), count)
+        while dimensions % num_subquantizers:
+            num_subquantizers -= 1
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(count, nlist * TRAINING_POINTS_PER_LIST)
+        sample = embeddings[np.sort(rng.choice(count, sample_size, replace=False))]
+        coarse_centroids = kmeans(sample, nlist, iterations, seed)
+
+        sample_size = min(count, MAX_CODEBOOK_TRAINING_POINTS)
+        sample = embeddings[np.sort(rng.choice(count, sample_size, replace=False))]
+        residuals = sample - coarse_centroids[nearest_centroids(sample, coarse_centroids)]
+        sub_vectors = residuals.reshape(sample_size, num_subquantizers, -1)
+        codebook_size = min(CODEBOOK_SIZE, sample_size)
+        codebooks = np.zeros(
+            (num_subquantizers, CODEBOOK_SIZE, dimensions // num_subquantizers), dtype=np.float32
+        )
+        for i in range(num_subquantizers):
+            codebooks[i, :codebook_size] = kmeans(sub_vectors[:, i], codebook_size, iterations, seed)
+        if codebook_size < CODEBOOK_SIZE:
+            # Unused entries are never the nearest, so no code points to them
+            codebooks[:, codebook_size:] = np.inf
+        return cls(coarse_centroids, codebooks, count)
+
+    def needs_retraining(self, count: int) -> bool:
+        """Whether a store of ``count`` vectors outgrew the lists trained for it, see ``RETRAIN_GROWTH_FACTOR``."""
+        return get_default_nlist(count) > RETRAIN_GROWTH_FACTOR * get_default_nlist(max(self.trained_count, 1))
+
+    def _encode(self, embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        lists = nearest_centroids(embeddings, self.coarse_centroids)
+        residuals = embeddings - self.coarse_centroids[lists]
+        sub_vectors = residuals.reshape(len(embeddings), self.num_subquantizers, -1)
+        codes = np.empty((len(embeddings), self.num_subquantizers), dtype=np.uint8)
+        for i, codebook in enumerate(self.codebooks):
+            finite = np.isfinite(codebook[:, 0])
+            codes[:, i] = nearest_centroids(sub_vectors[:, i], codebook[finite])
+        return lists, codes
+
+    def _lists(self) -> np.ndarray:
+        return np.repeat(np.arange(self.nlist), np.diff(self.offsets))
+
+    def _regroup(self, lists: np.ndarray, ids: np.ndarray, codes: np.ndarray) -> None:
+        order = np.argsort(lists, kind="stable")
+        self.ids = ids[order]
+        self.codes = codes[order]
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(lists, minlength=self.nlist))]
+        ).astype(np.int64)
+
+    def add(self, ids: Sequence[str], embeddings: np.ndarray, batch_size: int = 8192) -> None:
+        """Add vectors to the lists of their nearest coarse centroids, without retraining.
+
+        Args:
+            ids (sequence): Ids of the vectors
+            embeddings (np.ndarray): Vectors, one per row
+            batch_size (int): Number of vectors encoded at a time, which bounds memory use
+        """
+        if not len(ids):
+            return
+        new_lists, new_codes = [], []
+        for i in range(0, len(ids), batch_size):
+            lists, codes = self._encode(np.asarray(embeddings[i : i + batch_size], dtype=np.float32))
+            new_lists.append(lists)
+            new_codes.append(codes)
+        self._regroup(
+            np.concatenate([self._lists(), *new_lists]),
+            np.concatenate([np.asarray(self.ids), np.asarray(ids, dtype=str)]),
+            np.concatenate([np.asarray(self.codes), *new_codes]),
+        )
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """Remove vectors by id; unknown ids are ignored.
+
+        Returns:
+            int: Number of vectors removed
+        """
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype=str))
+        removed = int((~keep).sum())
+        if removed:
+            self._regroup(self._lists()[keep], np.asarray(self.ids)[keep], np.asarray(self.codes)[keep])
+        return removed
+
+    def search(
+        self, queries: np.ndarray, shortlist: int, nprobe: int = DEFAULT_NPROBE
+    ) -> List[Tuple[List[str], np.ndarray]]:
+        """Find the candidates nearest to each query by their compressed codes.
+
+        Args:
+            queries (np.ndarray): Query embeddings, one per row
+            shortlist (int): Number of candidates to return per query
+            nprobe (int): Number of inverted lists visited per query
+
+        Returns:
+            list: Per query, the ids of the candidates and their estimated squared
+                L2 distances, nearest first
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = min(nprobe, self.nlist)
+        coarse = squared_distances(queries, self.coarse_centroids)
+        probed = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+        subspaces = np.arange(self.num_subquantizers)
+
+        results = []
+        for query, lists in zip(queries, probed):
+            distances, rows = [], []
+            for list_id in lists:
+                start, end = self.offsets[list_id], self.offsets[list_id + 1]
+                if start == end:
+                    continue
+                residual = (query - self.coarse_centroids[list_id]).reshape(self.num_subquantizers, 1, -1)
+                # Distance from each sub-vector of the residual to every codebook entry
+                table = ((residual - self.codebooks) ** 2).sum(axis=2)
+                codes = self.codes[start:end]
+                distances.append(table[subspaces, codes].sum(axis=1))
+                rows.append(np.arange(start, end))
+            if not distances:
+                results.append(([], np.empty(0, dtype=np.float32)))
+                continue
+            distances = np.concatenate(distances)
+            rows = np.concatenate(rows)
+            if len(distances) > shortlist:
+                nearest = np.argpartition(distances, shortlist - 1)[:shortlist]
+                distances, rows = distances[nearest], rows[nearest]
+            order = np.argsort(distances, kind="stable")
+            results.append(([str(self.ids[row]) for row in rows[order]], distances[order]))
+        return results
+
+    def save(self, path: str) -> None:
+        """Write the index to a directory, replacing a previous one atomically."""
+        temp_path = make_temp_directory(path)
+        np.save(os.path.join(temp_path, "coarse_centroids.npy"), self.coarse_centroids)
+        np.save(os.path.join(temp_path, "codebooks.npy"), self.codebooks)
+        np.save(os.path.join(temp_path, "ids.npy"), np.asarray(self.ids))
+        np.save(os.path.join(temp_path, "codes.npy"), np.asarray(self.codes))
+        np.save(os.path.join(temp_path, "offsets.npy"), self.offsets)
+        with open(os.path.join(temp_path, MANIFEST_FILE), "w") as file:
+            json.dump(
+                {
+                    "count": len(self),
+                    "trained_count": self.trained_count,
+                    "nlist": self.nlist,
+                    "num_subquantizers": self.num_subquantizers,
+                    "dimensions": int(self.coarse_centroids.shape[1]),
+                },
+                file,
+            )
+        replace_directory(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFPQIndex":
+        """Open an index written by ``save``; the codes are memory-mapped."""
+        with open(os.path.join(path, MANIFEST_FILE)) as file:
+            manifest = json.load(file)
+        index = cls(
+            np.load(os.path.join(path, "coarse_centroids.npy")),
+            np.load(os.path.join(path, "codebooks.npy")),
+            # Indexes saved before the training size was kept were trained on all their vectors
+            manifest.get("trained_count", manifest["count"]),
+        )
+        index.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        index.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+        index.offsets = np.load(os.path.join(path, "offsets.npy"))
+        return index
+
+    def size_bytes(self) -> int:
+        """Memory taken by the centroids, codebooks and codes, without the ids."""
+        return (
+            self.coarse_centroids.nbytes
+            + int(np.isfinite(self.codebooks).sum()) * self.codebooks.itemsize
+            + np.asarray(self.codes).nbytes
+            + self.offsets.nbytes
+        )
+
+
+def read_vectors(
+    collection: NumpyCollection, entry_ids: Optional[Sequence[str]] = None, page_size: int = 50000
+) -> Tuple[List[str], np.ndarray]:
+    """Read the ids and vectors of the entries of a store, page by page.
+
+    Args:
+        collection (NumpyCollection): Store to read
+        entry_ids (sequence, optional): Ids of the entries to read; all entries by default
+        page_size (int): Number of vectors read at a time
+
+    Returns:
+        tuple: Ids and vectors of the entries found
+    """
+    ids, vectors = [], []
+    offset = 0
+    while entry_ids is None or offset < len(entry_ids):
+        if entry_ids is None:
+            page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        else:
+            page = collection.get(ids=list(entry_ids[offset : offset + page_size]), include=["embeddings"])
+        ids.extend(page["ids"])
+        if page["ids"]:
+            vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        if entry_ids is None and len(page["ids"]) < page_size:
+            break
+        offset += page_size
+    if not vectors:
+        return ids, np.empty((0, 0), dtype=np.float32)
+    return ids, np.concatenate(vectors)
+
+
+class IndexedCollection:
+    """NumPy store searched through an IVF/PQ index.
+
+    Behaves like the ``NumpyCollection`` it wraps, except that queries visit
+    ``nprobe`` inverted lists of the index and re-score the ``shortlist``
+    best candidates exactly with their stored vectors. Filtered queries
+    search ``FILTERED_SHORTLIST_FACTOR`` times more candidates and re-score
+    those passing the filter; when fewer than ``n_results`` of them pass,
+    the filter is selective enough for the store's exact search over the
+    passing entries to answer instead.
+
+    ``save`` writes the store and brings the index up to date: entries
+    deleted from the store are removed from the lists, and new entries, as
+    well as entries deleted and added again with a new vector (see
+    ``NumpyCollection.added_ids``), are encoded into the trained lists. Only
+    the vectors of those entries are read from the store. An index is
+    trained when there is none yet, and trained again once the store has
+    grown enough to need more lists (see ``IVFPQIndex.needs_retraining``).
+
+    Attributes:
+        store (NumpyCollection): Store holding vectors, documents and metadata
+        index_path (str): Directory holding the index
+        index (IVFPQIndex): Index, or None if it was not built yet
+        name (str): Name of the collection
+        nprobe (int): Number of inverted lists visited per query
+        shortlist (int): Number of candidates re-scored exactly per query
+    """
+
+    def __init__(
+        self,
+        store: NumpyCollection,
+        index_path: str,
+        name: str,
+        nprobe: int = DEFAULT_NPROBE,
+        shortlist: int = DEFAULT_SHORTLIST,
+    ):
+        self.store = store
+        self.index_path = index_path
+        self.name = name
+        self.nprobe = nprobe
+        self.shortlist = shortlist
+        self.index = IVFPQIndex.load(index_path) if os.path.exists(index_path) else None
+
+    def __getattr__(self, attribute: str) -> Any:
+        # Everything but querying and saving is handled by the store
+        return getattr(self.store, attribute)
+
+    def save(self) -> None:
+        self.store.save()
+        if self.index is None or self.index.needs_retraining(self.store.count()):
+            ids, vectors = read_vectors(self.store)
+            if not ids:
+                return
+            start = time.perf_counter()
+            self.index = IVFPQIndex.train(vectors)
+            logger.info(
+                f"Trained an index with {self.index.nlist} lists in {time.perf_counter() - start:.1f} s"
+            )
+            self.index.add(ids, vectors)
+        else:
+            stored = np.asarray(self.store.get(include=[])["ids"], dtype=str)
+            indexed = np.asarray(self.index.ids)
+            # Rewritten entries are removed too, and encoded again with the new entries
+            rewritten = np.asarray(sorted(self.store.added_ids), dtype=str)
+            removed = self.index.remove(np.concatenate([indexed[~np.isin(indexed, stored)], rewritten]))
+            ids, vectors = read_vectors(self.store, stored[~np.isin(stored, np.asarray(self.index.ids))])
+            self.index.add(ids, vectors)
+            logger.info(f"Added {len(ids)} and removed {removed} vectors from the index")
+        self.store.added_ids.clear()
+        self.index.save(self.index_path)
+
+    def query(
+        self,
+        query_embeddings: Any,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = ("metadatas", "documents", "distances"),
+    ) -> Dict[str, Any]:
+        """Find the stored entries nearest to query embeddings, in the same format as Chroma."""
+        if self.index is None or not len(self.index):
+            return self.store.query(query_embeddings, n_results, where, include)
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        shortlist = max(self.shortlist, n_results) * (FILTERED_SHORTLIST_FACTOR if where else 1)
+        shortlists = self.index.search(queries, shortlist, self.nprobe)
+        # The filter is evaluated over the store once, and each shortlist is checked against it
+        mask = self.store.where_mask(where) if where else None
+        results: Dict[str, Any] = {key: [None] * len(queries) for key in ("ids", *include)}
+        unanswered = []
+        for i, (query, (candidate_ids, _)) in enumerate(zip(queries, shortlists)):
+            candidates = self.store.get(ids=candidate_ids, include=["embeddings"], mask=mask)
+            if where and len(candidates["ids"]) < n_results:
+                unanswered.append(i)
+                continue
+            ids, distances = exact_rerank(query, candidates["ids"], candidates["embeddings"], n_results)
+            entries = self.store.get(ids=ids, include=[key for key in include if key != "distances"])
+            results["ids"][i] = ids
+            for key in include:
+                results[key][i] = distances if key == "distances" else entries[key]
+        if unanswered:
+            exact = self.store.query(queries[unanswered], n_results, where, include)
+            for key in ("ids", *include):
+                for i, values in zip(unanswered, exact[key]):
+                    results[key][i] = values
+        results["included"] = list(include)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build an IVF/PQ index over the NumPy store of embed_emails --backend numpy"
+    )
+    parser.add_argument(
+        "--embeddings-path",
+        type=str,
+        default="embedded_emails.db",
+        help="Path to store embeddings database (default: embedded_emails.db)",
+    )
+    parser.add_argument(
+        "--model-name",
+        type=str,
+        default=DEFAULT_MODEL_NAME,
+        help=f"Name of sentence transformer model (default: {DEFAULT_MODEL_NAME})",
+    )
+    parser.add_argument(
+        "--nlist",
+        type=int,
+        help="Number of inverted lists (default: about 4 * sqrt(number of emails))",
+    )
+    parser.add_argument(
+        "--subquantizers",
+        type=int,
+        default=DEFAULT_SUBQUANTIZERS,
+        help=f"Bytes per stored vector; must divide the number of dimensions (default: {DEFAULT_SUBQUANTIZERS})",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=DEFAULT_KMEANS_ITERATIONS,
+        help=f"Number of k-means rounds when training (default: {DEFAULT_KMEANS_ITERATIONS})",
+    )
+    args = parser.parse_args()
+
+    store_path = get_numpy_store_path(args.embeddings_path, args.model_name)
+    if not os.path.exists(store_path):
+        raise FileNotFoundError(
+            f"NumPy store not found at {store_path}; run embed_emails with --backend numpy first"
+        )
+    store = NumpyCollection(store_path, get_collection_name(args.model_name), args.model_name)
+    ids, vectors = read_vectors(store)
+    start = time.perf_counter()
+    index = IVFPQIndex.train(vectors, args.nlist, args.subquantizers, args.iterations)
+    trained = time.perf_counter()
+    index.add(ids, vectors)
+    index.save(get_ivf_pq_path(args.embeddings_path, args.model_name))
+    bump_collection_version(args.embeddings_path, args.model_name)
+    logger.info(
+        f"Indexed {len(index)} vectors in {index.nlist} lists with {index.num_subquantizers} "
+        f"bytes per vector: trained in {trained - start:.1f} s, added in "
+        f"{time.perf_counter() - trained:.1f} s, {index.size_bytes() / (1024 * 1024):.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,25 @@
 import logging
 import sys
+from typing import List, TextIO
+
+# Stream log messages are written to, and the handlers created by setup_logger
+_log_stream: TextIO = sys.stdout
+_handlers: List[logging.StreamHandler] = []
+
+
+def set_log_stream(stream: TextIO) -> None:
+    """Send log messages of all loggers created by setup_logger to another stream.
+
+    Useful when stdout is reserved for output, e.g. JSONL results.
+
+    Args:
+        stream (TextIO): Stream to write log messages to, e.g. sys.stderr
+    """
+    global _log_stream
+    _log_stream = stream
+    for handler in _handlers:
+        handler.setStream(stream)
+
 
 def setup_logger(name: str) -> logging.Logger:
     """Set up and configure logger.
@@ -17,7 +37,8 @@ def setup_logger(name: str) -> logging.Logger:
         logger.setLevel(logging.INFO)
         
         # Console handler
-        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler = logging.StreamHandler(_log_stream)
+        _handlers.append(console_handler)
         console_handler.setLevel(logging.INFO)
         
         # Format
@@ -0,0 +1,342 @@
+import hashlib
+from typing import Dict, List, Union
+
+from sqlalchemy import Column, Integer, String, create_engine, event, inspect, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.declarative import declarative_base
+
+from llm_email_search.logger import setup_logger
+from llm_email_search.text_cleaning import clean_text
+
+logger = setup_logger(__name__)
+
+
+Base = declarative_base()
+
+
+class Email(Base):
+    """SQLAlchemy model representing an email in the database.
+
+    Attributes:
+        id (int): Primary key identifier for the email
+        sender (str): Email address of the sender
+        subject (str): Subject line of the email
+        body (str): Full text content of the email
+        clean_body (str): Body reduced to the text worth embedding: HTML converted to
+            text, quoted replies and signatures removed, see ``clean_text``
+        timestamp (int): Epoch timestamp in milliseconds
+        attachment_types (str): Comma-separated list of file extensions for any attachments
+        gmail_id (str): Gmail message id, None for emails not downloaded from Gmail
+        thread_id (str): Gmail thread id
+        history_id (str): Gmail history id of the last change to the message
+        content_hash (str): SHA-256 of the timestamp, sender, subject, body and
+            attachment types, used to skip duplicate emails on insert
+        source (str): Where an email not downloaded from Gmail was imported from,
+            ``ARCHIVE_SOURCE`` or ``CSV_SOURCE``; None for emails from Gmail
+    """
+
+    __tablename__ = "emails"
+    id = Column(Integer, primary_key=True)
+    sender = Column(String, nullable=True)
+    subject = Column(String, nullable=True)
+    body = Column(String, nullable=False)
+    clean_body = Column(String, nullable=True)
+    timestamp = Column(Integer, nullable=True, index=True)  # Store as epoch milliseconds
+    attachment_types = Column(String, nullable=True)
+    gmail_id = Column(String, nullable=True, unique=True, index=True)
+    thread_id = Column(String, nullable=True)
+    history_id = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True, unique=True, index=True)
+    source = Column(String, nullable=True)
+
+
+class SyncState(Base):
+    """SQLAlchemy model storing key/value state of the Gmail sync, such as the resume cursor.
+
+    Attributes:
+        key (str): Name of the state entry
+        value (str): Value of the state entry
+    """
+
+    __tablename__ = "sync_state"
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
+
+
+CONTENT_HASH_FIELDS = ("timestamp", "sender", "subject", "body", "attachment_types")
+
+# Sources of emails that were not downloaded from Gmail, which the Gmail sync
+# never matches to its messages
+ARCHIVE_SOURCE = "archive"
+CSV_SOURCE = "csv"
+
+
+def compute_content_hash(email_data: Dict[str, Union[str, int, None]]) -> str:
+    """Compute the deduplication hash of an email.
+
+    Args:
+        email_data (dict): Email fields, at least those in ``CONTENT_HASH_FIELDS``
+
+    Returns:
+        str: Hex-encoded SHA-256 of the timestamp, sender, subject, body and attachment types
+    """
+    # Fields are length-prefixed so that values cannot bleed into each other
+    digest = hashlib.sha256()
+    for field in CONTENT_HASH_FIELDS:
+        value = email_data.get(field)
+        if value is None:
+            digest.update(b"-1:")
+        else:
+            encoded = str(value).encode("utf-8")
+            digest.update(f"{len(encoded)}:".encode() + encoded)
+    return digest.hexdigest()
+
+
+def backfill_content_hashes(connection: Connection, chunk_size: int = 5000) -> None:
+    """Compute content hashes for existing emails and remove duplicate rows.
+
+    Runs once, when the ``content_hash`` column is added to an existing
+    database. Of each group of duplicates the oldest row is kept, so the
+    unique index can be created afterwards.
+
+    Args:
+        connection (Connection): Connection with an open transaction
+        chunk_size (int): Number of rows hashed per round trip
+    """
+    columns = ", ".join(("id",) + CONTENT_HASH_FIELDS)
+    last_id = -1
+    num_hashed = 0
+    while True:
+        rows = connection.execute(
+            text(f"SELECT {columns} FROM emails WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": chunk_size},
+        ).mappings().all()
+        if not rows:
+            break
+        connection.execute(
+            text("UPDATE emails SET content_hash = :content_hash WHERE id = :id"),
+            [{"id": row["id"], "content_hash": compute_content_hash(row)} for row in rows],
+        )
+        last_id = rows[-1]["id"]
+        num_hashed += len(rows)
+
+    num_duplicates = connection.execute(
+        text(
+            "DELETE FROM emails WHERE content_hash IS NOT NULL AND id NOT IN "
+            "(SELECT MIN(id) FROM emails WHERE content_hash IS NOT NULL GROUP BY content_hash)"
+        )
+    ).rowcount
+    logger.info(f"Hashed {num_hashed} existing emails and removed {num_duplicates} duplicates")
+
+
+def backfill_clean_bodies(connection: Connection, chunk_size: int = 5000) -> None:
+    """Clean the bodies of existing emails, see ``clean_text``.
+
+    Runs once, when the ``clean_body`` column is added to an existing
+    database. Rows are read and written a chunk at a time, so memory use
+    does not grow with the size of the mailbox.
+
+    Args:
+        connection (Connection): Connection with an open transaction
+        chunk_size (int): Number of rows cleaned per round trip
+    """
+    last_id = -1
+    num_cleaned = 0
+    num_characters = 0
+    num_clean_characters = 0
+    while True:
+        rows = connection.execute(
+            text("SELECT id, body FROM emails WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": chunk_size},
+        ).all()
+        if not rows:
+            break
+        updates = [{"id": email_id, "clean_body": clean_text(body)} for email_id, body in rows]
+        connection.execute(text("UPDATE emails SET clean_body = :clean_body WHERE id = :id"), updates)
+        last_id = rows[-1][0]
+        num_cleaned += len(rows)
+        num_characters += sum(len(body or "") for _, body in rows)
+        num_clean_characters += sum(len(row["clean_body"]) for row in updates)
+    logger.info(
+        f"Cleaned the bodies of {num_cleaned} existing emails, "
+        f"{num_characters - num_clean_characters} characters shorter in total"
+    )
+
+
+# One-time data migrations, run right after the column is added to an existing table
+COLUMN_BACKFILLS = {
+    ("emails", "content_hash"): backfill_content_hashes,
+    ("emails", "clean_body"): backfill_clean_bodies,
+}
+
+
+def upgrade_schema(engine: Engine) -> None:
+    """Bring the tables of an existing database up to date with the models.
+
+    Columns added to the models after a database was created are added with
+    ``ALTER TABLE`` and backfilled where needed (see ``COLUMN_BACKFILLS``),
+    and any missing indexes are created.
+
+    Args:
+        engine (Engine): SQLAlchemy engine of the database
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                logger.info(f"Adding column {column.name} to table {table.name}")
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(
+                    text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                )
+                backfill = COLUMN_BACKFILLS.get((table.name, column.name))
+                if backfill is not None:
+                    backfill(connection)
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+# Full-text index over the emails table, kept in sync by triggers
+FTS_TABLE = "emails_fts"
+FTS_COLUMNS = ("subject", "body", "sender")
+
+
+FTS_INSERT_TRIGGER = f"{FTS_TABLE}_insert"
+
+
+def get_fts_triggers() -> Dict[str, str]:
+    """Get the statements creating the triggers that keep the full-text index in sync.
+
+    Returns:
+        dict: CREATE TRIGGER statement per trigger name
+    """
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"new.{column}" for column in FTS_COLUMNS)
+    old_values = ", ".join(f"old.{column}" for column in FTS_COLUMNS)
+    delete_old = (
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+    )
+    insert_new = f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});"
+    return {
+        FTS_INSERT_TRIGGER: f"CREATE TRIGGER {FTS_INSERT_TRIGGER} AFTER INSERT ON emails BEGIN {insert_new} END",
+        f"{FTS_TABLE}_delete": f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON emails BEGIN {delete_old} END",
+        f"{FTS_TABLE}_update": (
+            f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF {columns} ON emails "
+            f"BEGIN {delete_old} {insert_new} END"
+        ),
+    }
+
+
+def create_fts_index(engine: Engine) -> None:
+    """Create the FTS5 full-text index over the emails table, if it does not exist yet.
+
+    The index is an external-content table: it stores only the inverted
+    index and reads the text from the emails table, so it adds little to the
+    database size. Triggers keep it in sync with inserts, updates and deletes.
+    When the index is created for a database that already holds emails, it
+    is built from them once.
+
+    Args:
+        engine (Engine): SQLAlchemy engine of the database
+    """
+    columns = ", ".join(FTS_COLUMNS)
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE},
+        ).first()
+        if exists:
+            return
+        connection.execute(
+            text(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({columns}, "
+                "content='emails', content_rowid='id')"
+            )
+        )
+        for statement in get_fts_triggers().values():
+            connection.execute(text(statement))
+        logger.info("Building the full-text index over existing emails")
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def bulk_insert_emails(engine: Engine, rows: List[Dict[str, Union[str, int, None]]]) -> int:
+    """Insert emails with a single bulk ``INSERT ... ON CONFLICT DO NOTHING``.
+
+    The insert trigger of the full-text index indexes rows one at a time,
+    which takes most of the time of a bulk insert. It is dropped for the
+    insert, the new rows are indexed with one statement, and the trigger is
+    created again, all in one transaction, so other connections never see
+    the emails table without it.
+
+    Args:
+        engine (Engine): SQLAlchemy engine of a database created by ``init_database``
+        rows (list): Column values of each email
+
+    Returns:
+        int: Number of emails inserted; emails whose content hash is already stored are skipped
+    """
+    columns = ", ".join(FTS_COLUMNS)
+    # The transaction is managed here, since pysqlite commits before DDL statements
+    # outside of one; BEGIN IMMEDIATE takes the write lock up front
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            last_id = connection.execute(text("SELECT coalesce(max(id), 0) FROM emails")).scalar()
+            connection.execute(text(f"DROP TRIGGER {FTS_INSERT_TRIGGER}"))
+            num_inserted = connection.execute(insert(Email.__table__).on_conflict_do_nothing(), rows).rowcount
+            # New rows get ids above the largest existing one
+            connection.execute(
+                text(
+                    f"INSERT INTO {FTS_TABLE}(rowid, {columns}) "
+                    f"SELECT id, {columns} FROM emails WHERE id > :last_id"
+                ),
+                {"last_id": last_id},
+            )
+            connection.execute(text(get_fts_triggers()[FTS_INSERT_TRIGGER]))
+        except BaseException:
+            connection.exec_driver_sql("ROLLBACK")
+            raise
+        connection.exec_driver_sql("COMMIT")
+    return num_inserted
+
+
+# Applied to every connection. In WAL mode readers, such as searches, do not
+# block on writers, and synchronous=NORMAL is safe from corruption while
+# syncing once per checkpoint rather than once per transaction
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    # Negative sizes are in KiB: 64 MiB of page cache per connection
+    "cache_size": -65536,
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def init_database(database: str) -> Engine:
+    """Create an engine for a SQLite database, creating or upgrading its tables and full-text index.
+
+    Every connection of the engine is tuned with ``SQLITE_PRAGMAS``.
+
+    Args:
+        database (str): Path to SQLite database file
+
+    Returns:
+        Engine: SQLAlchemy engine of the database
+    """
+    engine = create_engine(f"sqlite:///{database}")
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    create_fts_index(engine)
+    return engine
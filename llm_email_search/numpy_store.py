@@ -0,0 +1,648 @@
+import json
+import os
+import shutil
+from operator import eq, ge, gt, le, lt, ne
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from llm_email_search.logger import setup_logger
+from llm_email_search.vector_store import DEFAULT_NUMPY_DTYPE, NUMPY_DTYPES
+
+logger = setup_logger(__name__)
+
+# Number of stored vectors scored per matrix multiplication, which bounds the
+# memory used by a search whatever the size of the store
+SEARCH_BLOCK_SIZE = 16384
+
+MANIFEST_FILE = "manifest.json"
+DEFAULT_INCLUDE = ("metadatas", "documents")
+DEFAULT_QUERY_INCLUDE = ("metadatas", "documents", "distances")
+
+# Metadata keys also stored as columns, so filters on them (see build_where) are
+# evaluated with array operations rather than by reading the metadata of every
+# entry; each has the type of its column and the value stored when the key is missing
+METADATA_COLUMNS = {"timestamp": (np.int64, 0), "sender_address": (str, ""), "has_attachment": (bool, False)}
+COLUMN_OPERATORS = {
+    "$eq": eq,
+    "$ne": ne,
+    "$gt": gt,
+    "$gte": ge,
+    "$lt": lt,
+    "$lte": le,
+    "$in": np.isin,
+    "$nin": lambda values, operand: ~np.isin(values, operand),
+}
+
+
+def quantize(embeddings: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Convert float32 embeddings to a storage type.
+
+    int8 quantization is symmetric per vector: each vector is divided by its
+    largest absolute value over 127 and rounded, and that scale is kept to
+    restore it.
+
+    Args:
+        embeddings (np.ndarray): Embeddings, one per row
+        dtype (str): Storage type, one of ``NUMPY_DTYPES``
+
+    Returns:
+        tuple: Stored vectors and, for int8, the scale of each vector
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dtype != "int8":
+        return embeddings.astype(dtype), None
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(embeddings / scales[:, None]).clip(-127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(vectors: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    """Restore float32 embeddings from stored vectors, see ``quantize``."""
+    embeddings = np.asarray(vectors, dtype=np.float32)
+    if scales is not None:
+        embeddings = embeddings * np.asarray(scales)[:, None]
+    return embeddings
+
+
+def matches_where(metadata: Optional[Dict[str, Any]], where: Dict[str, Any]) -> bool:
+    """Check whether metadata passes a Chroma ``where`` filter.
+
+    Supports ``$and``, ``$or``, plain equality and the ``$eq``, ``$ne``,
+    ``$gt``, ``$gte``, ``$lt``, ``$lte``, ``$in`` and ``$nin`` operators.
+    Like in Chroma, entries without a key never pass a condition on it.
+
+    Args:
+        metadata (dict): Metadata of an entry
+        where (dict): Chroma metadata filter
+
+    Returns:
+        bool: Whether the entry passes the filter
+
+    Raises:
+        ValueError: If the filter uses an unsupported operator
+    """
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        if key not in metadata:
+            return False
+        value = metadata[key]
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                passed = value == operand
+            elif operator == "$ne":
+                passed = value != operand
+            elif operator == "$gt":
+                passed = value > operand
+            elif operator == "$gte":
+                passed = value >= operand
+            elif operator == "$lt":
+                passed = value < operand
+            elif operator == "$lte":
+                passed = value <= operand
+            elif operator == "$in":
+                passed = value in operand
+            elif operator == "$nin":
+                passed = value not in operand
+            else:
+                raise ValueError(f"Unsupported filter operator {operator}")
+            if not passed:
+                return False
+    return True
+
+
+def get_column_names() -> List[str]:
+    """Names of the column arrays: the values of each of ``METADATA_COLUMNS`` and whether it is set."""
+    return [name for key in METADATA_COLUMNS for name in (key, f"{key}.present")]
+
+
+def build_columns(metadatas: Sequence[Optional[Dict[str, Any]]]) -> Dict[str, np.ndarray]:
+    """Build the columns of ``METADATA_COLUMNS`` from the metadata of entries.
+
+    Args:
+        metadatas (sequence): Metadata of each entry
+
+    Returns:
+        dict: Array of each column name, see ``get_column_names``
+    """
+    columns = {}
+    for key, (dtype, missing) in METADATA_COLUMNS.items():
+        values = [(metadata or {}).get(key) for metadata in metadatas]
+        columns[key] = np.array([missing if value is None else value for value in values], dtype=dtype)
+        columns[f"{key}.present"] = np.array([value is not None for value in values], dtype=bool)
+    return columns
+
+
+def append_rows(buffer: Optional[np.ndarray], count: int, rows: np.ndarray) -> np.ndarray:
+    """Write rows after the first rows of a buffer, growing it geometrically when full.
+
+    Growing to at least twice the rows in use means adding n rows a batch at
+    a time copies O(n) rows in total, rather than O(n²) when every batch is
+    concatenated to the whole array.
+
+    Args:
+        buffer (np.ndarray, optional): Buffer whose first ``count`` rows are in use
+        count (int): Number of rows in use
+        rows (np.ndarray): Rows to write after them
+
+    Returns:
+        np.ndarray: The buffer, or a larger copy of it, holding ``count + len(rows)`` rows
+    """
+    rows = np.asarray(rows)
+    needed = count + len(rows)
+    dtype = rows.dtype if buffer is None else np.result_type(buffer.dtype, rows.dtype)
+    if buffer is None or len(buffer) < needed or dtype != buffer.dtype or not buffer.flags.writeable:
+        grown = np.empty((max(needed, 2 * count),) + rows.shape[1:], dtype=dtype)
+        if buffer is not None:
+            grown[:count] = buffer[:count]
+        buffer = grown
+    buffer[count:needed] = rows
+    return buffer
+
+
+def make_temp_directory(path: str) -> str:
+    """Create an empty directory next to a path, to be moved there by ``replace_directory``."""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+    return temp_path
+
+
+def replace_directory(temp_path: str, path: str) -> None:
+    """Move a fully written directory to a path, replacing what is there.
+
+    The old directory is moved aside rather than deleted first, so the path
+    is only missing for the moment between two renames, and processes that
+    memory-mapped its files keep reading them.
+
+    Args:
+        temp_path (str): Directory holding the new files
+        path (str): Path to move it to
+    """
+    old_path = f"{path}.{os.getpid()}.old"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(temp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class JsonLines:
+    """JSON values stored one per line, read individually through a table of line offsets.
+
+    Attributes:
+        path (str): Path to the JSON lines file; offsets are stored next to it
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offsets = np.load(f"{path}.offsets.npy", mmap_mode="r")
+        self._values: Optional[List[Any]] = None
+
+    @staticmethod
+    def write(path: str, values: Iterable[Any]) -> None:
+        offsets = [0]
+        with open(path, "wb") as file:
+            for value in values:
+                file.write(json.dumps(value).encode("utf-8") + b"\n")
+                offsets.append(file.tell())
+        np.save(f"{path}.offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def read(self, rows: Sequence[int]) -> List[Any]:
+        """Read the values of some rows, without loading the others."""
+        if self._values is not None:
+            return [self._values[row] for row in rows]
+        values = []
+        with open(self.path, "rb") as file:
+            for row in rows:
+                file.seek(self._offsets[row])
+                values.append(json.loads(file.read(self._offsets[row + 1] - self._offsets[row])))
+        return values
+
+    def read_all(self) -> List[Any]:
+        """Read all values, keeping them in memory for later reads."""
+        if self._values is None:
+            with open(self.path, "rb") as file:
+                self._values = [json.loads(line) for line in file]
+        return self._values
+
+
+class NumpyCollection:
+    """Read-mostly vector store kept in memory-mapped NumPy files.
+
+    Implements the subset of Chroma's ``Collection`` interface used by this
+    package (``add``, ``delete``, ``get``, ``query`` and ``count``), so it can
+    stand in for a Chroma collection, see ``open_collection``.
+
+    Vectors are stored as a float32, float16 or int8 matrix in a ``.npy``
+    file that is memory-mapped, so opening the store costs milliseconds and
+    only the pages touched by searches are read into memory. Searches are
+    exact: stored vectors are scored block by block with a matrix
+    multiplication, and the nearest ones are picked with ``argpartition``.
+    Distances are squared L2 distances, like those of a Chroma collection.
+    The metadata keys of ``METADATA_COLUMNS`` are also stored as columns, so
+    filters on them are evaluated with vectorized masks; conditions on other
+    keys read the metadata of every entry.
+
+    Writes are kept in memory until ``save`` is called, which rewrites the
+    store atomically; searchers that already opened the store keep reading
+    the previous files. Added rows are written into arrays that grow
+    geometrically (see ``append_rows``), so adding a store a batch at a
+    time takes time linear in its size. Deleted rows are only marked as
+    deleted, and left out of searches and reads, until ``save`` compacts the
+    arrays, so replacing entries a batch at a time is linear too.
+
+    Attributes:
+        path (str): Directory holding the store
+        name (str): Name of the collection
+        metadata (dict): Collection metadata, as for Chroma collections
+        dtype (str): Storage type of the vectors, one of ``NUMPY_DTYPES``
+        added_ids (set): Ids added since the store was opened, or since the set
+            was last cleared; an index over the store uses them to find entries
+            that were deleted and added again with a new vector
+    """
+
+    def __init__(
+        self, path: str, name: str, model_name: str, dtype: str = DEFAULT_NUMPY_DTYPE
+    ):
+        """Open the store at a path, or start an empty one if there is none.
+
+        Args:
+            path (str): Directory holding the store
+            name (str): Name of the collection
+            model_name (str): Name of the sentence transformer model of the embeddings
+            dtype (str): Storage type of the vectors of a new store; an existing
+                store keeps its own
+
+        Raises:
+            ValueError: If the storage type is not one of ``NUMPY_DTYPES``
+        """
+        if dtype not in NUMPY_DTYPES:
+            raise ValueError(f"Unsupported dtype {dtype}, expected one of {', '.join(NUMPY_DTYPES)}")
+        self.path = path
+        self.name = name
+        self.dtype = dtype
+        self.metadata = {"model_name": model_name, "hnsw:space": "l2"}
+        self._ids = np.empty(0, dtype=str)
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._squared_norms = np.empty(0, dtype=np.float32)
+        # Rows deleted since the store was last saved
+        self._deleted = np.zeros(0, dtype=bool)
+        self._num_deleted = 0
+        self._documents: Any = []
+        self._metadatas: Any = []
+        # Columns of METADATA_COLUMNS; None until built for stores saved without them
+        self._columns: Optional[Dict[str, np.ndarray]] = build_columns([])
+        # Arrays with room for more rows, of which the arrays above are views
+        self._buffers: Dict[str, np.ndarray] = {}
+        self._rows: Optional[Dict[str, int]] = None
+        self._dirty = False
+        self.added_ids: Set[str] = set()
+
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        if manifest["dtype"] != dtype:
+            logger.info(f"Opening {manifest['dtype']} store {path}, which keeps its storage type")
+        self.dtype = manifest["dtype"]
+        if manifest["count"]:
+            self._ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+            self._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            self._squared_norms = np.load(os.path.join(path, "squared_norms.npy"), mmap_mode="r")
+            self._deleted = np.zeros(len(self._ids), dtype=bool)
+            if self.dtype == "int8":
+                self._scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+            self._documents = JsonLines(os.path.join(path, "documents.jsonl"))
+            self._metadatas = JsonLines(os.path.join(path, "metadatas.jsonl"))
+            column_paths = {name: os.path.join(path, f"{name}.npy") for name in get_column_names()}
+            if all(os.path.exists(column_path) for column_path in column_paths.values()):
+                self._columns = {
+                    name: np.load(column_path, mmap_mode="r") for name, column_path in column_paths.items()
+                }
+            else:
+                self._columns = None
+
+    def count(self) -> int:
+        return len(self._ids) - self._num_deleted
+
+    def _row_of(self) -> Dict[str, int]:
+        if self._rows is None:
+            self._rows = {
+                str(entry_id): row for row, entry_id in enumerate(self._ids) if not self._deleted[row]
+            }
+        return self._rows
+
+    def _live_rows(self) -> np.ndarray:
+        """Rows that are not deleted."""
+        return np.flatnonzero(~self._deleted)
+
+    def _get_columns(self) -> Dict[str, np.ndarray]:
+        if self._columns is None:
+            logger.info(f"Building the metadata columns of {self.path}, which was saved without them")
+            self._columns = build_columns(self._read_all(self._metadatas))
+        return self._columns
+
+    def _append(self, name: str, current: Optional[np.ndarray], rows: np.ndarray) -> np.ndarray:
+        """Append rows to one of the stored arrays, returning the longer array."""
+        buffer = self._buffers.get(name)
+        if buffer is None or current is None or current.base is not buffer:
+            # The array was loaded or rewritten since rows were last appended to it
+            buffer = current
+        count = 0 if current is None else len(current)
+        self._buffers[name] = append_rows(buffer, count, rows)
+        return self._buffers[name][: count + len(rows)]
+
+    @staticmethod
+    def _read_all(values: Any) -> List[Any]:
+        return values.read_all() if isinstance(values, JsonLines) else values
+
+    def _read(self, values: Any, rows: Sequence[int]) -> List[Any]:
+        if isinstance(values, JsonLines):
+            return values.read(rows)
+        return [values[row] for row in rows]
+
+    def _load_for_write(self) -> None:
+        """Copy the memory-mapped store into memory, so it can be changed."""
+        if self._dirty:
+            return
+        self._ids = np.array(self._ids)
+        if self._vectors is not None:
+            self._vectors = np.array(self._vectors)
+            self._squared_norms = np.array(self._squared_norms)
+            if self._scales is not None:
+                self._scales = np.array(self._scales)
+        self._documents = list(self._read_all(self._documents))
+        self._metadatas = list(self._read_all(self._metadatas))
+        self._get_columns()
+        self._dirty = True
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: Any,
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """Add entries; they are searchable at once and stored by ``save``.
+
+        Args:
+            ids (list): Ids of the entries, which must not be stored yet
+            embeddings (array-like): Embedding of each entry
+            documents (list, optional): Document of each entry
+            metadatas (list, optional): Metadata of each entry
+
+        Raises:
+            ValueError: If an id is already stored
+        """
+        self._load_for_write()
+        existing = self._row_of()
+        duplicates = [entry_id for entry_id in ids if entry_id in existing]
+        if duplicates:
+            raise ValueError(f"Ids already stored: {', '.join(duplicates[:5])}")
+        count = len(self._ids)
+        vectors, scales = quantize(embeddings, self.dtype)
+        squared_norms = (dequantize(vectors, scales) ** 2).sum(axis=1)
+        self._vectors = self._append("vectors", self._vectors, vectors)
+        if scales is not None:
+            self._scales = self._append("scales", self._scales, scales)
+        self._squared_norms = self._append("squared_norms", self._squared_norms, squared_norms)
+        self._ids = self._append("ids", self._ids, np.asarray(ids, dtype=str))
+        self._deleted = self._append("deleted", self._deleted, np.zeros(len(ids), dtype=bool))
+        metadatas = metadatas or [None] * len(ids)
+        columns = build_columns(metadatas)
+        self._columns = {
+            name: self._append(name, values, columns[name]) for name, values in self._columns.items()
+        }
+        self._documents.extend(documents or [None] * len(ids))
+        self._metadatas.extend(metadatas)
+        existing.update((entry_id, count + i) for i, entry_id in enumerate(ids))
+        self.added_ids.update(ids)
+
+    def delete(self, ids: List[str]) -> None:
+        """Delete entries by id; unknown ids are ignored.
+
+        Rows are marked as deleted, and removed from the arrays by ``save``.
+        """
+        rows = self._row_of()
+        removed = [rows.pop(entry_id) for entry_id in set(ids) if entry_id in rows]
+        if not removed:
+            return
+        self._load_for_write()
+        self._deleted[removed] = True
+        self._num_deleted += len(removed)
+
+    def _compact(self) -> None:
+        """Remove the rows marked as deleted from the arrays."""
+        keep = ~self._deleted
+        self._ids = self._ids[keep]
+        self._vectors = self._vectors[keep]
+        self._squared_norms = self._squared_norms[keep]
+        if self._scales is not None:
+            self._scales = self._scales[keep]
+        self._documents = [value for value, kept in zip(self._documents, keep) if kept]
+        self._metadatas = [value for value, kept in zip(self._metadatas, keep) if kept]
+        self._columns = {name: values[keep] for name, values in self._columns.items()}
+        self._deleted = np.zeros(len(self._ids), dtype=bool)
+        self._num_deleted = 0
+        # Rows after a deleted one have moved, so the map is built again when needed
+        self._rows = None
+
+    def save(self) -> None:
+        """Compact the deleted rows and write the store, replacing the previous files atomically."""
+        if not self._dirty:
+            return
+        if self._num_deleted:
+            self._compact()
+        temp_path = make_temp_directory(self.path)
+        if self.count():
+            np.save(os.path.join(temp_path, "ids.npy"), self._ids)
+            np.save(os.path.join(temp_path, "vectors.npy"), self._vectors)
+            np.save(os.path.join(temp_path, "squared_norms.npy"), self._squared_norms)
+            if self._scales is not None:
+                np.save(os.path.join(temp_path, "scales.npy"), self._scales)
+            JsonLines.write(os.path.join(temp_path, "documents.jsonl"), self._documents)
+            JsonLines.write(os.path.join(temp_path, "metadatas.jsonl"), self._metadatas)
+            for name, values in self._columns.items():
+                np.save(os.path.join(temp_path, f"{name}.npy"), values)
+        with open(os.path.join(temp_path, MANIFEST_FILE), "w") as file:
+            json.dump(
+                {
+                    "dtype": self.dtype,
+                    "count": self.count(),
+                    "dimensions": 0 if self._vectors is None else self._vectors.shape[1],
+                    "model_name": self.metadata["model_name"],
+                },
+                file,
+            )
+        replace_directory(temp_path, self.path)
+        self._dirty = False
+        logger.info(f"Saved {self.count()} {self.dtype} vectors to {self.path}")
+
+    def _where_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Mask of the rows passing a filter, with the same semantics as ``matches_where``."""
+        columns = self._get_columns()
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause)
+            elif key == "$or":
+                mask &= np.logical_or.reduce([self._where_mask(clause) for clause in condition])
+            elif key in METADATA_COLUMNS:
+                mask &= columns[f"{key}.present"]
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                for operator_name, operand in condition.items():
+                    if operator_name not in COLUMN_OPERATORS:
+                        raise ValueError(f"Unsupported filter operator {operator_name}")
+                    mask &= COLUMN_OPERATORS[operator_name](columns[key], operand)
+            else:
+                # Keys without a column, such as attachment type flags
+                metadatas = self._read_all(self._metadatas)
+                mask &= np.fromiter(
+                    (matches_where(metadata, {key: condition}) for metadata in metadatas), bool, len(metadatas)
+                )
+        return mask
+
+    def where_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Mask of the rows passing a filter and not deleted, to pass to ``get`` for many reads with one filter."""
+        return self._where_mask(where) & ~self._deleted
+
+    def _filter_rows(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Rows passing a filter and not deleted, or None if every row is a candidate."""
+        if not where:
+            return self._live_rows() if self._num_deleted else None
+        return np.flatnonzero(self.where_mask(where))
+
+    def _result(
+        self, rows: Sequence[int], include: Sequence[str], distances: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        result = {"ids": [str(self._ids[row]) for row in rows]}
+        if "embeddings" in include:
+            rows_array = np.asarray(rows, dtype=np.int64)
+            scales = None if self._scales is None else self._scales[rows_array]
+            result["embeddings"] = (
+                dequantize(self._vectors[rows_array], scales) if len(rows) else []
+            )
+        if "documents" in include:
+            result["documents"] = self._read(self._documents, rows)
+        if "metadatas" in include:
+            result["metadatas"] = self._read(self._metadatas, rows)
+        if distances is not None and "distances" in include:
+            result["distances"] = distances
+        return result
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = DEFAULT_INCLUDE,
+        mask: Optional[np.ndarray] = None,
+    ) -> Dict[str, Any]:
+        """Get entries by id and/or filter, in the same format as Chroma.
+
+        Args:
+            ids (list, optional): Ids of the entries; unknown ids are left out
+            where (dict, optional): Chroma metadata filter
+            limit (int, optional): Largest number of entries to return
+            offset (int, optional): Number of entries to skip
+            include (sequence): Any of "embeddings", "documents" and "metadatas"
+            mask (np.ndarray, optional): Result of ``where_mask``, used instead of ``where``
+
+        Returns:
+            dict: Ids and the included fields of the entries, one list each
+        """
+        if mask is None and where:
+            mask = self.where_mask(where)
+        if ids is not None:
+            known = self._row_of()
+            rows = [known[entry_id] for entry_id in ids if entry_id in known]
+            if mask is not None:
+                rows = [row for row in rows if mask[row]]
+        elif mask is not None:
+            rows = np.flatnonzero(mask).tolist()
+        else:
+            filtered = self._filter_rows(None)
+            rows = list(range(len(self._ids))) if filtered is None else filtered.tolist()
+        start = offset or 0
+        rows = rows[start : None if limit is None else start + limit]
+        return {**self._result(rows, include), "included": list(include)}
+
+    def query(
+        self,
+        query_embeddings: Any,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = DEFAULT_QUERY_INCLUDE,
+    ) -> Dict[str, Any]:
+        """Find the stored entries nearest to query embeddings, in the same format as Chroma.
+
+        Args:
+            query_embeddings (array-like): Query embeddings, one per row
+            n_results (int): Number of entries to return per query
+            where (dict, optional): Chroma metadata filter applied before searching
+            include (sequence): Any of "embeddings", "documents", "metadatas" and "distances"
+
+        Returns:
+            dict: Per query, the ids and included fields of the nearest entries, nearest first
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        candidates = self._filter_rows(where)
+        num_candidates = len(self._ids) if candidates is None else len(candidates)
+        k = min(n_results, num_candidates)
+
+        best_distances = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        if k:
+            query_norms = (queries ** 2).sum(axis=1)
+            for start in range(0, num_candidates, SEARCH_BLOCK_SIZE):
+                if candidates is None:
+                    rows = np.arange(start, min(start + SEARCH_BLOCK_SIZE, num_candidates))
+                    block = self._vectors[start : start + SEARCH_BLOCK_SIZE]
+                else:
+                    rows = candidates[start : start + SEARCH_BLOCK_SIZE]
+                    block = self._vectors[rows]
+                products = queries @ np.asarray(block, dtype=np.float32).T
+                if self._scales is not None:
+                    products *= np.asarray(self._scales[rows])
+                distances = query_norms[:, None] - 2 * products + self._squared_norms[rows]
+                # Keep the k nearest of this block together with the best so far
+                distances = np.concatenate([best_distances, distances], axis=1)
+                block_rows = np.concatenate(
+                    [best_rows, np.broadcast_to(rows, (len(queries), len(rows)))], axis=1
+                )
+                if distances.shape[1] > k:
+                    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                    distances = np.take_along_axis(distances, nearest, axis=1)
+                    block_rows = np.take_along_axis(block_rows, nearest, axis=1)
+                best_distances, best_rows = distances, block_rows
+
+        results: Dict[str, Any] = {"ids": []}
+        results.update((key, []) for key in include)
+        for query_distances, query_rows in zip(best_distances, best_rows):
+            order = np.argsort(query_distances, kind="stable")
+            # Rounding can make the distance of an identical vector slightly negative
+            distances = np.maximum(query_distances[order], 0).tolist()
+            result = self._result(query_rows[order].tolist(), include, distances)
+            for key, values in result.items():
+                results[key].append(values)
+        results["included"] = list(include)
+        return results
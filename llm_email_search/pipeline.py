@@ -0,0 +1,179 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from llm_email_search.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Marks the end of the stream in a stage's input queue
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Throughput and queue statistics of one pipeline stage.
+
+    Attributes:
+        name (str): Name of the stage
+        items (int): Number of items (e.g. emails) the stage processed
+        busy_seconds (float): Time spent doing work
+        wait_seconds (float): Time spent waiting for input or for room downstream
+        queue_depth_total (int): Sum of input queue depths sampled whenever the stage took a batch
+        queue_samples (int): Number of input queue depth samples
+        max_queue_depth (int): Largest sampled input queue depth
+    """
+
+    name: str
+    items: int = 0
+    busy_seconds: float = 0.0
+    wait_seconds: float = 0.0
+    queue_depth_total: int = 0
+    queue_samples: int = 0
+    max_queue_depth: int = 0
+
+    @property
+    def items_per_second(self) -> float:
+        """Throughput while busy, i.e. the rate the stage could sustain on its own."""
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    @property
+    def mean_queue_depth(self) -> float:
+        """Average number of batches waiting in the stage's input queue."""
+        return self.queue_depth_total / self.queue_samples if self.queue_samples else 0.0
+
+    def sample_queue(self, depth: int) -> None:
+        self.queue_depth_total += depth
+        self.queue_samples += 1
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.items} items, busy {self.busy_seconds:.1f}s "
+            f"({self.items_per_second:.1f} items/s), waited {self.wait_seconds:.1f}s, "
+            f"input queue depth mean {self.mean_queue_depth:.1f} max {self.max_queue_depth}"
+        )
+
+
+class _Stopped(Exception):
+    """Raised in a stage thread when another stage failed."""
+
+
+def run_pipeline(
+    source: Tuple[str, Callable[[], Iterator[Any]]],
+    stages: List[Tuple[str, Callable[[Any], Any]]],
+    queue_size: int = 2,
+    size: Callable[[Any], int] = len,
+) -> List[StageStats]:
+    """Run a producer/consumer pipeline with one thread per stage and bounded queues.
+
+    The source produces batches, and each stage transforms the batches it
+    receives and hands its result to the next stage. Queues between stages
+    hold at most ``queue_size`` batches, so a slow stage applies backpressure
+    instead of letting memory grow. If any stage raises, the other stages
+    are stopped and the exception is re-raised.
+
+    Input queue depths show where the bottleneck is. A stage whose input
+    queue is usually full is slower than the stage before it. A stage whose
+    input queue is usually empty is waiting on its upstream.
+
+    Args:
+        source (tuple): Name of the source stage and a callable returning an iterator of batches
+        stages (list): Names and functions of the downstream stages; the last
+            stage's return value is discarded
+        queue_size (int): Maximum number of batches waiting between two stages
+        size (callable): Returns the number of items in a batch, for throughput stats
+
+    Returns:
+        list: Statistics of the source and of every stage, in pipeline order
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    stats = [StageStats(name) for name, _ in [source] + stages]
+
+    def put(output: Optional[queue.Queue], item: Any, stage_stats: StageStats) -> None:
+        if output is None:
+            return
+        start = time.perf_counter()
+        while True:
+            if stop.is_set():
+                raise _Stopped()
+            try:
+                output.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stage_stats.wait_seconds += time.perf_counter() - start
+
+    def get(input_queue: queue.Queue, stage_stats: StageStats) -> Any:
+        start = time.perf_counter()
+        stage_stats.sample_queue(input_queue.qsize())
+        while True:
+            if stop.is_set():
+                raise _Stopped()
+            try:
+                item = input_queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stage_stats.wait_seconds += time.perf_counter() - start
+        return item
+
+    def run_source() -> None:
+        source_stats = stats[0]
+        output = queues[0] if queues else None
+        try:
+            batches = source[1]()
+            while True:
+                start = time.perf_counter()
+                batch = next(batches, _DONE)
+                source_stats.busy_seconds += time.perf_counter() - start
+                if batch is _DONE:
+                    break
+                source_stats.items += size(batch)
+                put(output, batch, source_stats)
+            put(output, _DONE, source_stats)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    def run_stage(index: int) -> None:
+        stage_stats = stats[index + 1]
+        func = stages[index][1]
+        input_queue = queues[index]
+        output = queues[index + 1] if index + 1 < len(queues) else None
+        try:
+            while True:
+                batch = get(input_queue, stage_stats)
+                if batch is _DONE:
+                    put(output, _DONE, stage_stats)
+                    break
+                start = time.perf_counter()
+                result = func(batch)
+                stage_stats.busy_seconds += time.perf_counter() - start
+                stage_stats.items += size(batch)
+                put(output, result, stage_stats)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=run_source, name=source[0], daemon=True)]
+    threads += [
+        threading.Thread(target=run_stage, args=(i,), name=name, daemon=True)
+        for i, (name, _) in enumerate(stages)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return stats
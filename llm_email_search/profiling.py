@@ -0,0 +1,22 @@
+import sys
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """Get the peak resident set size of the current process.
+
+    Returns:
+        float: Peak RSS in megabytes, or None if it cannot be measured on this platform
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak_rss / (1024 * 1024)
+    return peak_rss / 1024
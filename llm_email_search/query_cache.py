@@ -0,0 +1,187 @@
+import json
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from llm_email_search.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_MAX_EMBEDDINGS = 10000
+DEFAULT_MAX_RESULTS = 1000
+
+# Returned by LRUCache.get when a key is not cached, since None may be a cached value
+MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so trivially different spellings share cache entries.
+
+    Args:
+        query (str): Search query text
+
+    Returns:
+        str: Lower-cased query with surrounding whitespace removed and inner
+            whitespace collapsed to single spaces
+    """
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class LRUCache:
+    """Thread-safe, size-bounded cache that evicts the least recently used entry.
+
+    Attributes:
+        max_size (int): Largest number of entries kept
+        hits (int): Number of lookups that found an entry
+        misses (int): Number of lookups that found nothing
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups that found an entry."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: Hashable) -> Any:
+        """Look up an entry and mark it as recently used.
+
+        Args:
+            key (Hashable): Cache key
+
+        Returns:
+            Any: Cached value, or ``MISSING`` if the key is not cached
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Add or replace an entry, evicting the least recently used ones if full.
+
+        Args:
+            key (Hashable): Cache key
+            value (Any): Value to cache
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def items(self) -> list:
+        """Entries from least to most recently used."""
+        with self._lock:
+            return list(self._entries.items())
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+class QueryCache:
+    """Two-level cache for searches.
+
+    Query embeddings are cached by (model, normalized query), so repeated
+    searches skip encoding. Search results are cached by (collection,
+    normalized query, number of results, filters, collection version), so
+    repeated searches also skip the nearest neighbour lookup. The collection
+    version changes whenever ``embed_emails`` writes to the collection,
+    which makes cached results of older versions unreachable; they are
+    evicted as new results come in.
+
+    Attributes:
+        embeddings (LRUCache): Query embeddings
+        results (LRUCache): Search results of single queries
+        path (str): File the caches are persisted to by ``save``, if any
+    """
+
+    def __init__(
+        self,
+        max_embeddings: int = DEFAULT_MAX_EMBEDDINGS,
+        max_results: int = DEFAULT_MAX_RESULTS,
+        path: Optional[str] = None,
+    ):
+        self.embeddings = LRUCache(max_embeddings)
+        self.results = LRUCache(max_results)
+        self.path = path
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def embedding_key(model_name: str, query: str) -> tuple:
+        return model_name, normalize_query(query)
+
+    @staticmethod
+    def result_key(
+        collection_name: str,
+        query: str,
+        num_results: int,
+        where: Optional[Dict[str, Any]],
+        version: str,
+    ) -> tuple:
+        filters = json.dumps(where, sort_keys=True) if where else None
+        return collection_name, normalize_query(query), num_results, filters, version
+
+    def stats(self) -> Dict[str, float]:
+        """Sizes and hit rates of both caches.
+
+        Returns:
+            dict: Entry counts, hits, misses and hit rates
+        """
+        stats = {}
+        for name, cache in (("embedding", self.embeddings), ("result", self.results)):
+            stats[f"{name}_entries"] = len(cache)
+            stats[f"{name}_hits"] = cache.hits
+            stats[f"{name}_misses"] = cache.misses
+            stats[f"{name}_hit_rate"] = cache.hit_rate
+        return stats
+
+    def save(self) -> None:
+        """Persist both caches to ``path``, replacing the file atomically."""
+        if self.path is None:
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump(
+                {"embeddings": self.embeddings.items(), "results": self.results.items()},
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(temp_path, self.path)
+        logger.info(
+            f"Saved {len(self.embeddings)} query embeddings and {len(self.results)} results to {self.path}"
+        )
+
+    def load(self) -> None:
+        """Load both caches from ``path``; a corrupt file is ignored."""
+        try:
+            with open(self.path, "rb") as file:
+                saved = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logger.warning(f"Could not load query cache from {self.path}: {e}")
+            return
+        for key, value in saved["embeddings"]:
+            self.embeddings.put(key, value)
+        for key, value in saved["results"]:
+            self.results.put(key, value)
+        logger.info(
+            f"Loaded {len(self.embeddings)} query embeddings and {len(self.results)} results from {self.path}"
+        )
@@ -0,0 +1,424 @@
+import re
+import sqlite3
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm_email_search.logger import setup_logger
+from llm_email_search.vector_store import build_where, normalize_sender, to_epoch_ms
+
+logger = setup_logger(__name__)
+
+# Plans chosen by QueryPlanner
+PLAN_SEMANTIC = "semantic"
+PLAN_SQL_FIRST = "sql_first"
+PLAN_ANN_FIRST = "ann_first"
+
+# Up to this many matching emails, candidates are taken from SQLite and scored
+# exactly; beyond it, the filter is applied inside the vector index instead
+DEFAULT_MAX_SQL_FIRST_CANDIDATES = 2000
+
+# Most sender addresses a sender name may resolve to for the vector index filter
+MAX_SENDER_ADDRESSES = 1000
+
+# Attachment words that stand for several file types
+ATTACHMENT_CATEGORIES = {
+    "image": ("jpg", "jpeg", "png", "gif", "bmp", "heic", "webp", "tiff"),
+    "photo": ("jpg", "jpeg", "png", "heic"),
+    "picture": ("jpg", "jpeg", "png", "gif", "bmp", "heic", "webp"),
+    "document": ("pdf", "doc", "docx", "odt", "rtf", "txt"),
+    "spreadsheet": ("xls", "xlsx", "ods", "csv"),
+    "presentation": ("ppt", "pptx", "odp", "key"),
+}
+ATTACHMENT_EXTENSIONS = (
+    "pdf", "doc", "docx", "xls", "xlsx", "csv", "ppt", "pptx", "txt", "zip",
+    "jpg", "jpeg", "png", "gif", "heic", "ics", "mp3", "mp4", "mov",
+)
+
+DAYS_PER_UNIT = {"day": 1, "week": 7, "month": 30, "year": 365}
+MONTHS = (
+    "january", "february", "march", "april", "may", "june",
+    "july", "august", "september", "october", "november", "december",
+)
+
+# Words that carry no meaning for semantic search once the constraints are removed
+FILLER_WORDS = {
+    "a", "all", "an", "and", "any", "contain", "containing", "contains", "email",
+    "emails", "find", "for", "from", "get", "in", "mail", "mails", "me", "message",
+    "messages", "of", "received", "sent", "show", "that", "the", "were", "which", "with",
+}
+
+# Pronouns, and determiners that start a description of a sender rather than a
+# name, as in "from my boss" or "from our accountant"
+SENDER_STOP_WORDS = {
+    "a", "an", "any", "anyone", "every", "everyone", "her", "him", "his", "its", "my",
+    "our", "some", "someone", "that", "the", "their", "them", "these", "this", "those",
+    "us", "you", "your",
+}
+
+# Longest first, so "docx" is not matched as "doc"
+_TYPE_WORD = "|".join(
+    sorted((*ATTACHMENT_CATEGORIES, *ATTACHMENT_EXTENSIONS), key=len, reverse=True)
+)
+_DATE = r"(\d{4}-\d{2}-\d{2})"
+_UNIT = r"(day|week|month|year)s?"
+
+
+@dataclass
+class ParsedQuery:
+    """Constraints parsed out of a natural-language query.
+
+    Attributes:
+        query (str): Original query text
+        text (str): What is left for semantic search once the constraints are removed
+        sender (str): Sender name or address the query asks for, if any
+        after (int): Only emails sent at or after this epoch timestamp in milliseconds
+        before (int): Only emails sent before this epoch timestamp in milliseconds
+        has_attachment (bool): Whether the query asks for emails with an attachment
+        attachment_types (list): File extensions the attachment may have; empty
+            if any attachment will do
+        matched (list): Phrases recognised as constraints
+    """
+
+    query: str
+    text: str = ""
+    sender: Optional[str] = None
+    after: Optional[int] = None
+    before: Optional[int] = None
+    has_attachment: bool = False
+    attachment_types: List[str] = field(default_factory=list)
+    matched: List[str] = field(default_factory=list)
+
+    @property
+    def has_constraints(self) -> bool:
+        return bool(
+            self.sender or self.after is not None or self.before is not None or self.has_attachment
+        )
+
+
+def _start_of_day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _month_range(year: int, month: int) -> Tuple[datetime, datetime]:
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+
+def _time_rules(now: datetime) -> List[Tuple[str, Any]]:
+    """Patterns of time constraints and functions mapping a match to (after, before)."""
+    today = _start_of_day(now)
+
+    def last_units(match):
+        count = int(match.group(1) or 1)
+        return now - timedelta(days=count * DAYS_PER_UNIT[match.group(2).lower()]), None
+
+    def this_unit(match):
+        unit = match.group(1).lower()
+        if unit == "day":
+            return today, None
+        if unit == "week":
+            return today - timedelta(days=today.weekday()), None
+        if unit == "month":
+            return today.replace(day=1), None
+        return today.replace(month=1, day=1), None
+
+    def in_month(match):
+        month = MONTHS.index(match.group(1).lower()) + 1
+        year = int(match.group(2)) if match.group(2) else now.year
+        if not match.group(2) and month > now.month:
+            # A month later than the current one means last year's
+            year -= 1
+        return _month_range(year, month)
+
+    def in_year(match):
+        year = int(match.group(1))
+        return (
+            datetime(year, 1, 1, tzinfo=timezone.utc),
+            datetime(year + 1, 1, 1, tzinfo=timezone.utc),
+        )
+
+    return [
+        (rf"\b(?:since|after)\s+{_DATE}\b", lambda match: (to_epoch_ms(match.group(1)), None)),
+        (rf"\bbefore\s+{_DATE}\b", lambda match: (None, to_epoch_ms(match.group(1)))),
+        (
+            rf"\b(?:(?:in|during|within|over|from)\s+)?(?:the\s+)?(?:last|past)\s+(\d+\s+)?{_UNIT}\b",
+            last_units,
+        ),
+        (r"\btoday\b", lambda match: (today, None)),
+        (r"\byesterday\b", lambda match: (today - timedelta(days=1), today)),
+        (rf"\b(?:(?:in|during|from)\s+)?this\s+{_UNIT}\b", this_unit),
+        (rf"\b(?:in|during|from)\s+({'|'.join(MONTHS)})(?:\s+((?:19|20)\d{{2}}))?\b", in_month),
+        (r"\b(?:in|during|from)\s+((?:19|20)\d{2})\b", in_year),
+    ]
+
+
+def parse_query(query: str, now: Optional[datetime] = None) -> ParsedQuery:
+    """Parse sender, time and attachment constraints out of a natural-language query.
+
+    The parser is rule based and runs offline. It understands phrases such as
+    "from John", "from john@example.com", "in the last week", "in the past 3
+    days", "yesterday", "this month", "in March 2024", "since 2024-05-01",
+    "with an attachment", "with a pdf" and "with an image attachment".
+    Relative periods count back from ``now``: "last week" is the past 7 days,
+    a month is 30 days and a year 365 days.
+
+    Args:
+        query (str): Natural-language search query
+        now (datetime, optional): Time relative periods count back from;
+            defaults to the current time. Naive datetimes are taken as UTC
+
+    Returns:
+        ParsedQuery: Constraints and the remaining text for semantic search
+    """
+    now = now or datetime.now(timezone.utc)
+    if now.tzinfo is None:
+        now = now.replace(tzinfo=timezone.utc)
+    parsed = ParsedQuery(query=query)
+    text = query
+
+    def remove(match: "re.Match") -> None:
+        nonlocal text
+        parsed.matched.append(match.group(0).strip())
+        text = text[: match.start()] + " " + text[match.end() :]
+
+    # Time phrases go first, so "from" in "from last week" is not taken for a sender
+    for pattern, to_range in _time_rules(now):
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match is None:
+            continue
+        after, before = to_range(match)
+        if after is not None:
+            after = to_epoch_ms(after)
+            parsed.after = after if parsed.after is None else max(parsed.after, after)
+        if before is not None:
+            before = to_epoch_ms(before)
+            parsed.before = before if parsed.before is None else min(parsed.before, before)
+        remove(match)
+
+    match = re.search(
+        rf"\b(?:(?:with|having|has)\s+)?(?:(?:an?|any|some)\s+)?(?:({_TYPE_WORD})s?\s+)?attach(?:ment|ments|ed)\b",
+        text,
+        re.IGNORECASE,
+    ) or re.search(
+        rf"\b(?:with|having|containing|contains)\s+(?:(?:an?|any|some)\s+)?({_TYPE_WORD})s?\b",
+        text,
+        re.IGNORECASE,
+    )
+    if match is not None:
+        parsed.has_attachment = True
+        if match.group(1):
+            word = match.group(1).lower()
+            parsed.attachment_types = list(ATTACHMENT_CATEGORIES.get(word, (word,)))
+        remove(match)
+
+    match = re.search(
+        r"\b(?:from|sent\s+by)\s+([\w.+-]+@[\w-]+(?:\.[\w-]+)+|[^\W\d_][\w'-]*)",
+        text,
+        re.IGNORECASE,
+    )
+    if match is not None and match.group(1).lower() not in FILLER_WORDS | SENDER_STOP_WORDS:
+        parsed.sender = match.group(1)
+        remove(match)
+
+    words = text.split()
+    # Trim filler words around what is left, e.g. "emails about the budget" -> "about the budget"
+    while words and words[0].lower() in FILLER_WORDS:
+        words.pop(0)
+    while words and words[-1].lower().strip(",.?!") in FILLER_WORDS:
+        words.pop()
+    parsed.text = " ".join(words).strip(" ,.?!")
+    return parsed
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def build_sql_filter(parsed: ParsedQuery) -> Tuple[str, List[Any]]:
+    """Translate the constraints of a parsed query into a SQL condition on the emails table.
+
+    Args:
+        parsed (ParsedQuery): Parsed query
+
+    Returns:
+        tuple: ``WHERE`` clause (without the keyword) and its parameters; the
+            clause is ``1`` if the query has no constraints
+    """
+    conditions, params = [], []
+    if parsed.sender:
+        conditions.append("sender LIKE ? ESCAPE '\\'")
+        params.append(_like_pattern(parsed.sender))
+    if parsed.after is not None:
+        conditions.append("timestamp >= ?")
+        params.append(parsed.after)
+    if parsed.before is not None:
+        conditions.append("timestamp < ?")
+        params.append(parsed.before)
+    if parsed.attachment_types:
+        # Attachment types are stored as ".pdf,.txt", so the list is padded with
+        # commas to match whole entries
+        matches = ["(',' || lower(attachment_types) || ',') LIKE ?"] * len(parsed.attachment_types)
+        conditions.append(f"({' OR '.join(matches)})")
+        params.extend(f"%,.{extension},%" for extension in parsed.attachment_types)
+    elif parsed.has_attachment:
+        conditions.append("attachment_types IS NOT NULL AND attachment_types != ''")
+    return " AND ".join(conditions) or "1", params
+
+
+@dataclass
+class QueryPlan:
+    """How a query is answered.
+
+    Attributes:
+        strategy (str): ``PLAN_SEMANTIC`` (no constraints, plain vector search),
+            ``PLAN_SQL_FIRST`` (candidates from SQLite, scored exactly) or
+            ``PLAN_ANN_FIRST`` (vector search with a ``where`` filter)
+        parsed (ParsedQuery): Parsed query
+        total_emails (int): Number of emails in the database
+        matching_emails (int): Number of emails passing the constraints, counted
+            up to one more than the SQL-first limit, so for ANN-first plans only a
+            lower bound, see ``matching_emails_is_lower_bound``
+        candidate_ids (list): Ids of the emails passing the constraints, for SQL-first plans
+        where (dict): Chroma metadata filter, for ANN-first plans
+        timings (dict): Time spent parsing and estimating, in milliseconds
+    """
+
+    strategy: str
+    parsed: ParsedQuery
+    total_emails: int = 0
+    matching_emails: int = 0
+    candidate_ids: List[str] = field(default_factory=list)
+    where: Optional[Dict[str, Any]] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def matching_emails_is_lower_bound(self) -> bool:
+        """Whether counting stopped before all the emails passing the constraints were found."""
+        return self.strategy == PLAN_ANN_FIRST
+
+    @property
+    def selectivity(self) -> Optional[float]:
+        """Fraction of emails passing the constraints, or None if they were not all counted."""
+        if not self.parsed.has_constraints:
+            return 1.0
+        if self.matching_emails_is_lower_bound:
+            return None
+        return self.matching_emails / self.total_emails if self.total_emails else 0.0
+
+    def describe(self) -> Dict[str, Any]:
+        """Summary of the plan for search results, without the candidate ids."""
+        parsed = asdict(self.parsed)
+        del parsed["query"]
+        return {
+            "strategy": self.strategy,
+            "parsed": parsed,
+            "total_emails": self.total_emails,
+            "matching_emails": self.matching_emails,
+            "matching_emails_is_lower_bound": self.matching_emails_is_lower_bound,
+            "selectivity": self.selectivity,
+            "where": self.where,
+        }
+
+
+class QueryPlanner:
+    """Choose how to answer a query with sender, time or attachment constraints.
+
+    Highly selective constraints leave few candidates, which are found
+    quickly in SQLite and cheaply scored exactly, without approximate
+    nearest neighbour search. Broad constraints leave too many candidates for
+    that, so they are applied as a filter inside the vector index instead.
+
+    Attributes:
+        sql_path (str): Path to SQLite database containing emails
+        max_sql_first_candidates (int): Largest number of candidates scored exactly
+    """
+
+    def __init__(
+        self, sql_path: str, max_sql_first_candidates: int = DEFAULT_MAX_SQL_FIRST_CANDIDATES
+    ):
+        self.sql_path = sql_path
+        self.max_sql_first_candidates = max_sql_first_candidates
+
+    def resolve_senders(self, connection: sqlite3.Connection, sender: str) -> List[str]:
+        """Find the addresses of the senders whose From header contains a name or address.
+
+        Args:
+            connection (sqlite3.Connection): Connection to the emails database
+            sender (str): Sender name or address, e.g. ``"john"``
+
+        Returns:
+            list: Normalized sender addresses, see ``normalize_sender``
+        """
+        rows = connection.execute(
+            "SELECT DISTINCT sender FROM emails WHERE sender LIKE ? ESCAPE '\\' LIMIT ?",
+            (_like_pattern(sender), MAX_SENDER_ADDRESSES),
+        ).fetchall()
+        if len(rows) == MAX_SENDER_ADDRESSES:
+            logger.warning(f"'{sender}' matches more than {MAX_SENDER_ADDRESSES} senders; using the first ones")
+        return sorted({normalize_sender(row[0]) for row in rows} - {None})
+
+    def plan(self, query: str, now: Optional[datetime] = None) -> QueryPlan:
+        """Parse a query and choose between a SQL-first and an ANN-first plan.
+
+        The number of emails passing the constraints is counted in SQLite,
+        stopping one past ``max_sql_first_candidates``, so estimating stays
+        cheap for broad constraints.
+
+        Args:
+            query (str): Natural-language search query, see ``parse_query``
+            now (datetime, optional): Time relative periods count back from
+
+        Returns:
+            QueryPlan: Chosen plan
+        """
+        start = time.perf_counter()
+        parsed = parse_query(query, now)
+        parsed_at = time.perf_counter()
+        if not parsed.has_constraints:
+            return QueryPlan(
+                PLAN_SEMANTIC, parsed, timings={"parse_ms": (parsed_at - start) * 1000}
+            )
+
+        condition, params = build_sql_filter(parsed)
+        # A connection per plan, so plans can be made on any thread
+        connection = sqlite3.connect(self.sql_path)
+        try:
+            total = connection.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+            ids = connection.execute(
+                f"SELECT id FROM emails WHERE {condition} LIMIT ?",
+                (*params, self.max_sql_first_candidates + 1),
+            ).fetchall()
+            if len(ids) <= self.max_sql_first_candidates:
+                plan = QueryPlan(
+                    PLAN_SQL_FIRST, parsed, total, len(ids), [str(row[0]) for row in ids]
+                )
+            else:
+                senders = self.resolve_senders(connection, parsed.sender) if parsed.sender else None
+                where = build_where(
+                    senders,
+                    parsed.after,
+                    parsed.before,
+                    parsed.attachment_types or parsed.has_attachment,
+                )
+                plan = QueryPlan(PLAN_ANN_FIRST, parsed, total, len(ids), where=where)
+        finally:
+            connection.close()
+        end = time.perf_counter()
+        plan.timings = {
+            "parse_ms": (parsed_at - start) * 1000,
+            "estimate_ms": (end - parsed_at) * 1000,
+        }
+        matching = (
+            f"more than {self.max_sql_first_candidates}"
+            if plan.matching_emails_is_lower_bound
+            else str(plan.matching_emails)
+        )
+        logger.info(
+            f"Planned '{query}' as {plan.strategy}: {matching} of {total} emails match "
+            f"{', '.join(parsed.matched)} ({plan.timings['estimate_ms']:.1f} ms)"
+        )
+        return plan
@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm_email_search.document_store import DOCUMENT_MODES, DOCUMENTS_FULL
+from llm_email_search.logger import setup_logger
+from llm_email_search.query_cache import QueryCache
+from llm_email_search.run_query import Searcher, split_results
+from llm_email_search.vector_store import BACKENDS, DEFAULT_BACKEND, DEFAULT_MODEL_NAME, build_where
+
+logger = setup_logger(__name__)
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+
+# Reason phrases of the status codes the server sends
+STATUS_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+@dataclass
+class PendingQuery:
+    """A search waiting to be batched with other concurrent searches."""
+
+    query: str
+    num_results: int
+    where: Optional[Dict[str, Any]]
+    documents: str
+    future: asyncio.Future
+
+
+class QueryBatcher:
+    """Coalesces concurrent searches into batched encodes and Chroma queries.
+
+    The first search to arrive opens a batch, which is run once it holds
+    ``max_batch_size`` searches or ``max_wait_ms`` has passed, whichever
+    comes first. Searches arriving while a batch runs are queued for the
+    next one, so under load batches grow without any added waiting.
+
+    Attributes:
+        searcher (Searcher): Searcher with the model and collection loaded
+        max_batch_size (int): Largest number of searches in one batch
+        max_wait_ms (float): Longest time the first search of a batch waits for others
+        num_batches (int): Number of batches run so far
+        num_queries (int): Number of searches answered so far
+    """
+
+    def __init__(
+        self,
+        searcher: Searcher,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+    ):
+        self.searcher = searcher
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.num_batches = 0
+        self.num_queries = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start batching on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop batching; searches that are still queued are cancelled."""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            self._queue.get_nowait().future.cancel()
+
+    async def search(
+        self,
+        query: str,
+        num_results: int = 2,
+        where: Optional[Dict[str, Any]] = None,
+        documents: str = DOCUMENTS_FULL,
+    ) -> dict:
+        """Search emails, batched with other searches arriving at the same time.
+
+        Args:
+            query (str): The search query text to match against email content
+            num_results (int): Number of most similar results to return
+            where (dict, optional): Chroma metadata filter, see ``build_where``
+            documents (str): Form the bodies are returned in, see ``DOCUMENT_MODES``
+
+        Returns:
+            dict: Query results, see ``run_query``
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(PendingQuery(query, num_results, where, documents, future))
+        return await future
+
+    async def _next_batch(self) -> List[PendingQuery]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Take whatever else is already waiting without delaying the batch further
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run_group(self, group: List[PendingQuery]) -> None:
+        num_results = [pending.num_results for pending in group]
+        try:
+            # Encoding and searching block, so they run off the event loop
+            results = await asyncio.get_running_loop().run_in_executor(
+                None,
+                self.searcher.search_batch,
+                [pending.query for pending in group],
+                max(num_results),
+                group[0].where,
+                group[0].documents,
+            )
+            for pending, result in zip(group, split_results(results, num_results)):
+                if not pending.future.done():
+                    pending.future.set_result(result)
+        except Exception as e:
+            for pending in group:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            # A Chroma query takes one filter, so searches are grouped by filter
+            # (and by the form of the bodies they return)
+            groups: Dict[str, List[PendingQuery]] = {}
+            for pending in batch:
+                key = json.dumps([pending.where, pending.documents], sort_keys=True)
+                groups.setdefault(key, []).append(pending)
+            for group in groups.values():
+                await self._run_group(group)
+            self.num_batches += 1
+            self.num_queries += len(batch)
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Read one HTTP/1.1 request.
+
+    Args:
+        reader (asyncio.StreamReader): Connection to read from
+
+    Returns:
+        tuple: Method, path, lower-cased headers and body, or None if the
+            client closed the connection
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path, headers, body
+
+
+def format_response(status: int, payload: dict, keep_alive: bool = True) -> bytes:
+    """Format a JSON HTTP/1.1 response.
+
+    Args:
+        status (int): HTTP status code
+        payload (dict): JSON body
+        keep_alive (bool): Whether the connection stays open for further requests
+
+    Returns:
+        bytes: Response to write to the connection
+    """
+    body = json.dumps(payload).encode("utf-8")
+    headers = (
+        f"HTTP/1.1 {status} {STATUS_REASONS[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return headers.encode("latin-1") + body
+
+
+class QueryServer:
+    """HTTP/JSON search service with a warm model and micro-batching.
+
+    Endpoints:
+        POST /search with ``{"query": str, "num_results": int}`` returns the
+            results in the same format as ``run_query``. The optional fields
+            sender, after, before and has_attachment filter the results, and
+            documents ("full", "snippet" or "none") sets the form of the
+            bodies, as the arguments of ``run_query`` do
+        GET /health returns the number of searches and batches served, and
+            query cache hit rates
+
+    Attributes:
+        batcher (QueryBatcher): Batches the searches of all connections
+        host (str): Address to listen on
+        port (int): Port to listen on; 0 picks a free port, see ``port`` after ``start``
+    """
+
+    def __init__(self, batcher: QueryBatcher, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self) -> None:
+        """Start accepting connections."""
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Query server listening on http://{self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        """Stop accepting connections and stop batching."""
+        self._server.close()
+        await self._server.wait_closed()
+        await self.batcher.stop()
+
+    async def serve_forever(self) -> None:
+        """Start the server and run until cancelled."""
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _respond(self, method: str, path: str, body: bytes) -> Tuple[int, dict]:
+        if path == "/health":
+            health = {
+                "status": "ok",
+                "queries": self.batcher.num_queries,
+                "batches": self.batcher.num_batches,
+            }
+            if self.batcher.searcher.cache is not None:
+                health.update(self.batcher.searcher.cache.stats())
+            return 200, health
+        if path != "/search":
+            return 404, {"error": f"Unknown path {path}"}
+        if method != "POST":
+            return 405, {"error": "Use POST for /search"}
+        try:
+            request = json.loads(body)
+            query = request["query"]
+            num_results = int(request.get("num_results", 2))
+            documents = request.get("documents", DOCUMENTS_FULL)
+            if not isinstance(query, str) or num_results < 1:
+                raise ValueError("query must be a string and num_results positive")
+            if documents not in DOCUMENT_MODES:
+                raise ValueError(f"documents must be one of {', '.join(DOCUMENT_MODES)}")
+            where = build_where(
+                sender=request.get("sender"),
+                after=request.get("after"),
+                before=request.get("before"),
+                has_attachment=request.get("has_attachment"),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            return 400, {"error": f"Invalid request: {e}"}
+        try:
+            return 200, await self.batcher.search(query, num_results, where, documents)
+        except Exception as e:
+            logger.error(f"Error running query: {str(e)}")
+            return 500, {"error": str(e)}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload = await self._respond(method, path, body)
+                writer.write(format_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve semantic email search over HTTP")
+    parser.add_argument(
+        "--embeddings-path",
+        type=str,
+        default="embedded_emails.db",
+        help="Path to store embeddings database (default: embedded_emails.db)",
+    )
+    parser.add_argument(
+        "--model-name",
+        type=str,
+        default=DEFAULT_MODEL_NAME,
+        help=f"Name of sentence transformer model (default: {DEFAULT_MODEL_NAME})",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=DEFAULT_BACKEND,
+        help=f"Store the embeddings were written to by embed_emails (default: {DEFAULT_BACKEND})",
+    )
+    parser.add_argument(
+        "--sql-path",
+        type=str,
+        default="emails.db",
+        help="SQLite database file path, used to read the bodies of emails embedded with "
+        "--no-documents (default: emails.db)",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=DEFAULT_MAX_BATCH_SIZE,
+        help=f"Largest number of searches encoded and queried together (default: {DEFAULT_MAX_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=DEFAULT_MAX_WAIT_MS,
+        help=f"Longest time a search waits for others to batch with (default: {DEFAULT_MAX_WAIT_MS})",
+    )
+    parser.add_argument(
+        "--cache-path",
+        type=str,
+        help="File to load the query cache from and save it to on shutdown",
+    )
+    args = parser.parse_args()
+
+    cache = QueryCache(path=args.cache_path)
+    searcher = Searcher(
+        args.embeddings_path,
+        args.model_name,
+        cache=cache,
+        sql_path=args.sql_path,
+        backend=args.backend,
+    )
+    # Warm up, so the first request does not pay for lazy initialization
+    searcher.search_batch(["warm up"], 1)
+    server = QueryServer(
+        QueryBatcher(searcher, args.max_batch_size, args.max_wait_ms), args.host, args.port
+    )
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Query server stopped")
+    finally:
+        logger.info(f"Query cache: {cache.stats()}")
+        cache.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,749 @@
 import argparse
+import functools
+import itertools
+import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
 
-import chromadb
-from chromadb.utils import embedding_functions
+import numpy as np
 
-from llm_email_search.logger import setup_logger
+from llm_email_search.document_store import (
+    DOCUMENT_MODES,
+    DOCUMENTS_FULL,
+    DOCUMENTS_NONE,
+    DocumentStore,
+    fill_documents,
+)
+from llm_email_search.hybrid_search import (
+    DEFAULT_LEXICAL_DEPTH,
+    DEFAULT_RRF_K,
+    DEFAULT_VECTOR_DEPTH,
+    LexicalIndex,
+    reciprocal_rank_fusion,
+)
+from llm_email_search.logger import set_log_stream, setup_logger
+from llm_email_search.query_cache import MISSING, QueryCache
+from llm_email_search.query_planner import PLAN_SEMANTIC, PLAN_SQL_FIRST, QueryPlanner
+from llm_email_search.vector_store import (
+    BACKENDS,
+    DEFAULT_BACKEND,
+    DEFAULT_MODEL_NAME,
+    build_where,
+    get_collection_version,
+    open_collection,
+    to_epoch_ms,
+)
+
+# The encoder imports torch and chromadb, so it is only imported once a searcher is created
+if TYPE_CHECKING:
+    from chromadb.api.models.Collection import Collection
 
 logger = setup_logger(__name__)
 
+# Number of queries encoded and sent to Chroma together by run_queries
+DEFAULT_QUERY_BATCH_SIZE = 64
+
+
+def split_results(results: dict, num_results: List[int]) -> List[dict]:
+    """Split the results of a batched Chroma query into one result per query.
+
+    Args:
+        results (dict): Chroma query results with one list per query under each key
+        num_results (list): Number of results each query asked for; the batch
+            was queried with the largest one, so other queries are truncated
+
+    Returns:
+        list: Results of every query, in the same format as ``run_query``
+    """
+    split = []
+    for i, n in enumerate(num_results):
+        split.append(
+            {
+                key: [values[i][:n]]
+                for key, values in results.items()
+                if isinstance(values, list)
+                and len(values) == len(num_results)
+                and isinstance(values[i], list)
+            }
+        )
+    return split
+
+
+class Searcher:
+    """Long-lived semantic search over an embeddings database.
+
+    The model and the collection are loaded once when the searcher is
+    created, so each search only costs encoding the query and the nearest
+    neighbour lookup. With a ``QueryCache``, repeated queries skip encoding,
+    and repeated searches skip the lookup too until the collection changes.
+
+    Attributes:
+        embeddings_path (str): Path to ChromaDB embeddings database
+        model_name (str): Name of sentence transformer model the emails were embedded with
+        encoder (SentenceTransformerEncoder): Encoder for query texts
+        collection (Collection): Collection holding the email embeddings
+        cache (QueryCache): Cache of query embeddings and results, if any
+        lexical_index (LexicalIndex): Full-text index for hybrid search, if an
+            emails database was given; opened on first use
+        planner (QueryPlanner): Planner for queries with constraints in their text,
+            if an emails database was given
+        documents (DocumentStore): Source of the bodies of emails embedded without
+            documents, if an emails database was given
+    """
+
+    def __init__(
+        self,
+        embeddings_path: str = "embedded_emails.db",
+        model_name: str = DEFAULT_MODEL_NAME,
+        cache: Optional[QueryCache] = None,
+        sql_path: Optional[str] = None,
+        backend: str = DEFAULT_BACKEND,
+    ):
+        """Load the model and open the collection.
+
+        Args:
+            embeddings_path (str): Path to ChromaDB embeddings database
+            model_name (str): Name of sentence transformer model the emails were embedded with
+            cache (QueryCache, optional): Cache of query embeddings and results
+            sql_path (str, optional): Path to SQLite database containing emails, needed
+                for hybrid and planned search, and to show the bodies of emails
+                embedded without documents
+            backend (str): Store the embeddings are kept in, see ``BACKENDS``
+
+        Raises:
+            FileNotFoundError: If embeddings database not found at specified path
+        """
+        if not os.path.exists(embeddings_path):
+            logger.error(f"Embeddings database not found at {embeddings_path}")
+            raise FileNotFoundError(f"Embeddings database not found at {embeddings_path}")
+
+        from llm_email_search.encoder import SentenceTransformerEncoder
+
+        logger.info(f"Connecting to embeddings database at {embeddings_path}")
+        self.embeddings_path = embeddings_path
+        self.model_name = model_name
+        self.encoder = SentenceTransformerEncoder(model_name)
+        self.collection: "Collection" = open_collection(
+            embeddings_path, model_name, embedding_function=self.encoder, backend=backend
+        )
+        self.cache = cache
+        self.sql_path = sql_path
+        self.planner = QueryPlanner(sql_path) if sql_path is not None else None
+        self.documents = DocumentStore(sql_path) if sql_path is not None else None
+        # Runs the lexical and vector legs of hybrid searches in parallel
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    @functools.cached_property
+    def lexical_index(self) -> Optional[LexicalIndex]:
+        # Opening it builds the full-text index the first time, so only hybrid searches do
+        return LexicalIndex(self.sql_path) if self.sql_path is not None else None
+
+    def _encode(self, queries: List[str]) -> np.ndarray:
+        if self.cache is None:
+            return self.encoder.encode(queries)
+        embeddings = [
+            self.cache.embeddings.get(QueryCache.embedding_key(self.model_name, query))
+            for query in queries
+        ]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is MISSING]
+        if missing:
+            new_embeddings = self.encoder.encode([queries[i] for i in missing])
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+                self.cache.embeddings.put(QueryCache.embedding_key(self.model_name, queries[i]), embedding)
+        return np.stack(embeddings)
+
+    def _query(self, queries: List[str], num_results: int, where: Optional[Dict[str, Any]]) -> dict:
+        start = time.perf_counter()
+        query_embeddings = self._encode(queries)
+        encoded = time.perf_counter()
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=num_results,
+            where=where,
+        )
+        searched = time.perf_counter()
+        logger.info(
+            f"Searched {len(queries)} queries in {(searched - start) * 1000:.1f} ms "
+            f"(encode {(encoded - start) * 1000:.1f} ms, search {(searched - encoded) * 1000:.1f} ms)"
+        )
+        return results
+
+    def search_batch(
+        self,
+        queries: List[str],
+        num_results: int = 2,
+        where: Optional[Dict[str, Any]] = None,
+        documents: str = DOCUMENTS_FULL,
+    ) -> dict:
+        """Search emails for several queries at once.
+
+        Args:
+            queries (list): Search query texts
+            num_results (int): Number of most similar results to return per query
+            where (dict, optional): Chroma metadata filter applied inside the index,
+                see ``build_where``
+            documents (str): Return the bodies in full, as snippets or not at all,
+                see ``DOCUMENT_MODES``. Bodies the index does not store are read
+                from the emails database
+
+        Returns:
+            dict: Query results in Chroma's format, with one list per query under
+                ids, distances, metadatas and documents
+        """
+        if self.cache is None:
+            results = self._query(queries, num_results, where)
+            return fill_documents(results, documents, store=self.documents)
+
+        version = get_collection_version(self.embeddings_path, self.model_name)
+        keys = [
+            QueryCache.result_key(self.collection.name, query, num_results, where, version)
+            for query in queries
+        ]
+        results = [self.cache.results.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is MISSING]
+        if missing:
+            new_results = split_results(
+                self._query([queries[i] for i in missing], num_results, where),
+                [num_results] * len(missing),
+            )
+            for i, result in zip(missing, new_results):
+                results[i] = result
+                self.cache.results.put(keys[i], result)
+        else:
+            logger.info(f"Answered {len(queries)} queries from the result cache")
+        # Merge the single-query results back into one result per key
+        merged = {key: [result[key][0] for result in results] for key in results[0]}
+        return fill_documents(merged, documents, store=self.documents)
+
+    def search_many(
+        self,
+        queries: Iterable[str],
+        num_results: int = 2,
+        batch_size: int = DEFAULT_QUERY_BATCH_SIZE,
+        where: Optional[Dict[str, Any]] = None,
+        documents: str = DOCUMENTS_FULL,
+    ) -> Iterator[dict]:
+        """Search emails for a stream of queries, encoding and querying them in batches.
+
+        Args:
+            queries (iterable): Search query texts; consumed lazily, so it may be a file
+            num_results (int): Number of most similar results to return per query
+            batch_size (int): Number of queries encoded and queried together
+            where (dict, optional): Chroma metadata filter applied to every query
+            documents (str): Form the bodies are returned in, see ``search_batch``
+
+        Yields:
+            dict: Results of each query, in input order, see ``run_query``
+        """
+        batch = []
+        for query in queries:
+            batch.append(query)
+            if len(batch) == batch_size:
+                yield from split_results(
+                    self.search_batch(batch, num_results, where, documents),
+                    [num_results] * len(batch),
+                )
+                batch = []
+        if batch:
+            yield from split_results(
+                self.search_batch(batch, num_results, where, documents),
+                [num_results] * len(batch),
+            )
+
+    def search(
+        self,
+        query: str,
+        num_results: int = 2,
+        where: Optional[Dict[str, Any]] = None,
+        documents: str = DOCUMENTS_FULL,
+    ) -> dict:
+        """Search emails using semantic similarity to a query string.
+
+        Args:
+            query (str): The search query text to match against email content
+            num_results (int): Number of most similar results to return
+            where (dict, optional): Chroma metadata filter applied inside the index
+            documents (str): Form the bodies are returned in, see ``search_batch``
+
+        Returns:
+            dict: Query results, see ``run_query``
+        """
+        logger.info(
+            f"Running query: '{query}' with {num_results} results requested"
+            + (f" and filter {where}" if where else "")
+        )
+        results = self.search_batch([query], num_results, where, documents)
+        logger.info(f"Found {len(results['ids'][0])} matching results")
+        return results
+
+    def search_hybrid(
+        self,
+        query: str,
+        num_results: int = 2,
+        where: Optional[Dict[str, Any]] = None,
+        lexical_depth: int = DEFAULT_LEXICAL_DEPTH,
+        vector_depth: int = DEFAULT_VECTOR_DEPTH,
+        rrf_k: int = DEFAULT_RRF_K,
+        documents: str = DOCUMENTS_FULL,
+    ) -> dict:
+        """Search emails by keywords and semantic similarity, merging both rankings.
+
+        BM25 search over the full-text index and vector search run in
+        parallel, and their candidates are merged with reciprocal rank
+        fusion. Exact terms such as order numbers and names are found by the
+        lexical leg even when their embeddings are not close to the query.
+
+        Args:
+            query (str): The search query text
+            num_results (int): Number of results to return
+            where (dict, optional): Chroma metadata filter, applied to the candidates of both legs
+            lexical_depth (int): Number of candidates from the full-text index
+            vector_depth (int): Number of candidates from the vector index
+            rrf_k (int): Damping constant of reciprocal rank fusion
+            documents (str): Form the bodies are returned in, see ``search_batch``
+
+        Returns:
+            dict: Query results as from ``search``, with fused scores under ``scores``
+                (higher is better) and the time each step took under ``timings``
+
+        Raises:
+            ValueError: If the searcher was created without an emails database
+        """
+        lexical_index = self.lexical_index
+        if lexical_index is None:
+            raise ValueError("Hybrid search needs the SQLite emails database, see sql_path")
+
+        def lexical_leg() -> Tuple[List[str], float]:
+            start = time.perf_counter()
+            ids = [email_id for email_id, _ in lexical_index.search(query, lexical_depth)]
+            if ids and where:
+                # Keep only candidates that pass the filter, checked inside the index
+                passing = set(self.collection.get(ids=ids, where=where, include=[])["ids"])
+                ids = [email_id for email_id in ids if email_id in passing]
+            return ids, (time.perf_counter() - start) * 1000
+
+        def vector_leg() -> Tuple[List[str], float]:
+            start = time.perf_counter()
+            ids = self.search_batch([query], vector_depth, where, DOCUMENTS_NONE)["ids"][0]
+            return ids, (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        lexical_future = self._executor.submit(lexical_leg)
+        vector_future = self._executor.submit(vector_leg)
+        lexical_ids, lexical_ms = lexical_future.result()
+        vector_ids, vector_ms = vector_future.result()
+
+        fusion_start = time.perf_counter()
+        fused = reciprocal_rank_fusion([lexical_ids, vector_ids], k=rrf_k)[:num_results]
+        ids = [email_id for email_id, _ in fused]
+        # Bodies are only read from the index when they are returned
+        include = ["metadatas"] if documents == DOCUMENTS_NONE else ["documents", "metadatas"]
+        entries = self.collection.get(ids=ids, include=include) if ids else None
+        by_id = {}
+        if entries is not None:
+            for i, email_id in enumerate(entries["ids"]):
+                by_id[email_id] = {key: entries[key][i] for key in include}
+        results = fill_documents(
+            {
+                "ids": [ids],
+                "scores": [[score for _, score in fused]],
+                **{key: [[by_id.get(email_id, {}).get(key) for email_id in ids]] for key in include},
+            },
+            documents,
+            store=self.documents,
+        )
+        end = time.perf_counter()
+
+        timings = {
+            "lexical_ms": lexical_ms,
+            "vector_ms": vector_ms,
+            "fusion_ms": (end - fusion_start) * 1000,
+            "total_ms": (end - start) * 1000,
+        }
+        logger.info(
+            f"Hybrid search for '{query}' took {timings['total_ms']:.1f} ms "
+            f"(lexical {lexical_ms:.1f} ms for {len(lexical_ids)} candidates, "
+            f"vector {vector_ms:.1f} ms for {len(vector_ids)} candidates, "
+            f"fusion {timings['fusion_ms']:.1f} ms)"
+        )
+        results["timings"] = timings
+        return results
+
+    def _score_exactly(self, query: str, ids: List[str], num_results: int) -> dict:
+        """Rank candidate emails by their exact distance to a query.
+
+        Distances use the space of the collection, so they are the ones
+        ``search`` would return for the same emails.
+        """
+        if not ids:
+            return {"ids": [[]], "distances": [[]], "documents": [[]], "metadatas": [[]]}
+        query_embedding = self._encode([query])[0]
+        # Candidates that are not embedded yet are left out by Chroma
+        entries = self.collection.get(ids=ids, include=["embeddings"])
+        found_ids = entries["ids"]
+        if not found_ids:
+            return {"ids": [[]], "distances": [[]], "documents": [[]], "metadatas": [[]]}
+
+        embeddings = np.asarray(entries["embeddings"], dtype=np.float32)
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "l2":
+            distances = ((embeddings - query_embedding) ** 2).sum(axis=1)
+        elif space == "ip":
+            distances = 1.0 - embeddings @ query_embedding
+        else:
+            norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
+            distances = 1.0 - embeddings @ query_embedding / np.maximum(norms, 1e-12)
+        order = np.argsort(distances, kind="stable")[:num_results]
+        top_ids = [found_ids[i] for i in order]
+
+        entries = self.collection.get(ids=top_ids, include=["documents", "metadatas"])
+        by_id = {
+            email_id: (document, metadata)
+            for email_id, document, metadata in zip(
+                entries["ids"], entries["documents"], entries["metadatas"]
+            )
+        }
+        return {
+            "ids": [top_ids],
+            "distances": [[float(distances[i]) for i in order]],
+            "documents": [[by_id[email_id][0] for email_id in top_ids]],
+            "metadatas": [[by_id[email_id][1] for email_id in top_ids]],
+        }
+
+    def search_planned(
+        self,
+        query: str,
+        num_results: int = 2,
+        now: Optional[datetime] = None,
+        documents: str = DOCUMENTS_FULL,
+    ) -> dict:
+        """Search emails with a natural-language query that may contain constraints.
+
+        Sender, time and attachment constraints are parsed out of the query
+        (e.g. "invoices from John with a pdf in the last month"), and the
+        planner picks how to apply them, see ``QueryPlanner``. Only the rest
+        of the query is embedded, or the whole query if nothing is left.
+
+        Args:
+            query (str): The search query text
+            num_results (int): Number of results to return
+            now (datetime, optional): Time relative periods such as "last week" count back from
+            documents (str): Form the bodies are returned in, see ``search_batch``
+
+        Returns:
+            dict: Query results as from ``search``, with the chosen plan under
+                ``plan`` and the time each step took under ``timings``
+
+        Raises:
+            ValueError: If the searcher was created without an emails database
+        """
+        if self.planner is None:
+            raise ValueError("Planned search needs the SQLite emails database, see sql_path")
+
+        start = time.perf_counter()
+        plan = self.planner.plan(query, now)
+        planned = time.perf_counter()
+        # Queries without constraints are searched as typed
+        text = plan.parsed.text if plan.strategy != PLAN_SEMANTIC and plan.parsed.text else query
+        if plan.strategy == PLAN_SQL_FIRST:
+            results = self._score_exactly(text, plan.candidate_ids, num_results)
+            results = fill_documents(results, documents, store=self.documents)
+        else:
+            # Results are always copied from the cache, so they can be changed
+            results = self.search(text, num_results, plan.where, documents)
+        end = time.perf_counter()
+
+        results["plan"] = plan.describe()
+        results["timings"] = {
+            **plan.timings,
+            "search_ms": (end - planned) * 1000,
+            "total_ms": (end - start) * 1000,
+        }
+        logger.info(
+            f"Planned search for '{query}' took {results['timings']['total_ms']:.1f} ms "
+            f"({plan.strategy}, search {results['timings']['search_ms']:.1f} ms)"
+        )
+        return results
+
+
+@functools.lru_cache(maxsize=8)
+def get_searcher(
+    embeddings_path: str = "embedded_emails.db",
+    model_name: str = DEFAULT_MODEL_NAME,
+    cache_path: Optional[str] = None,
+    sql_path: Optional[str] = None,
+    backend: str = DEFAULT_BACKEND,
+) -> Searcher:
+    """Get a searcher for an embeddings database, reusing one from an earlier call.
+
+    Args:
+        embeddings_path (str): Path to ChromaDB embeddings database
+        model_name (str): Name of sentence transformer model the emails were embedded with
+        cache_path (str, optional): File the query cache is loaded from and saved to.
+            Without it, queries are only cached in memory
+        sql_path (str, optional): Path to SQLite database containing emails, needed
+            for hybrid and planned search
+        backend (str): Store the embeddings are kept in, see ``BACKENDS``
+
+    Returns:
+        Searcher: Searcher with the model, collection and query cache loaded
+    """
+    return Searcher(
+        embeddings_path,
+        model_name,
+        cache=QueryCache(path=cache_path),
+        sql_path=sql_path,
+        backend=backend,
+    )
+
+
+def check_planned(where: Optional[Dict[str, Any]], hybrid: bool) -> None:
+    """Check that planned search is not combined with options it does not support.
+
+    Raises:
+        ValueError: If filters or hybrid search are requested too
+    """
+    if where is not None or hybrid:
+        raise ValueError(
+            "Planned search takes its filters from the query text and cannot be "
+            "combined with filter arguments or hybrid search"
+        )
+
 
 def run_query(
     query: str,
     num_results: int = 2,
     embeddings_path: str = "embedded_emails.db",
-    model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+    model_name: str = DEFAULT_MODEL_NAME,
+    cache_path: Optional[str] = None,
+    sender: Optional[str] = None,
+    after: Optional[Union[int, str, date, datetime]] = None,
+    before: Optional[Union[int, str, date, datetime]] = None,
+    has_attachment: Union[bool, str, None] = None,
+    hybrid: bool = False,
+    sql_path: str = "emails.db",
+    lexical_depth: int = DEFAULT_LEXICAL_DEPTH,
+    vector_depth: int = DEFAULT_VECTOR_DEPTH,
+    planned: bool = False,
+    backend: str = DEFAULT_BACKEND,
+    documents: str = DOCUMENTS_FULL,
 ) -> dict:
     """Search emails using semantic similarity to a query string.
 
+    Searchers are cached per embeddings path and model, so only the first
+    call loads the model and opens the collection. Query embeddings and
+    results are cached too, see ``QueryCache``. Filters are applied inside
+    the index, so they narrow the candidates before the nearest neighbours
+    are picked.
+
     Args:
         query (str): The search query text to match against email content
         num_results (int, optional): Number of most similar results to return. Defaults to 2.
         embeddings_path (str, optional): Path to ChromaDB embeddings database. Defaults to "embedded_emails.db".
+        model_name (str, optional): Name of sentence transformer model the emails were embedded with.
+        cache_path (str, optional): File the query cache is loaded from and saved to.
+        sender (str, optional): Only emails from this sender address, e.g. "john@example.com".
+        after (optional): Only emails sent at or after this time, as epoch milliseconds,
+            an ISO 8601 date or datetime string, or a date or datetime.
+        before (optional): Only emails sent before this time, in the same formats as ``after``.
+        has_attachment (bool or str, optional): Only emails with an attachment if True,
+            or with an attachment of this type if a string (e.g. "pdf").
+        hybrid (bool, optional): Merge keyword (BM25) and semantic results, see
+            ``Searcher.search_hybrid``. Defaults to False.
+        sql_path (str, optional): Path to SQLite database containing emails, used by hybrid
+            and planned search, and to read the bodies of emails embedded without documents.
+        lexical_depth (int, optional): Number of keyword search candidates of hybrid search.
+        vector_depth (int, optional): Number of semantic search candidates of hybrid search.
+        planned (bool, optional): Parse sender, time and attachment constraints out of the
+            query text and choose how to apply them, see ``Searcher.search_planned``.
+            Cannot be combined with the filter arguments or hybrid search. Defaults to False.
+        backend (str, optional): Store the embeddings are kept in, "chroma" (default),
+            "numpy" or "ivfpq", see ``BACKENDS``.
+        documents (str, optional): Return the bodies of the results in "full" (default),
+            as a "snippet" or not at all ("none"), see ``DOCUMENT_MODES``.
 
     Returns:
         dict: Query results containing:
             - ids: List of email IDs for matches
             - distances: List of similarity scores
             - metadatas: List of email metadata (sender, subject, timestamp, attachments)
+            - documents: List of email bodies, unless documents is "none"
 
     Raises:
         FileNotFoundError: If embeddings database not found at specified path
+        ValueError: If planned search is combined with filters or hybrid search
     """
-    # Check if the embeddings database exists
+    # Check if the embeddings database exists, also when a searcher for it is cached
     if not os.path.exists(embeddings_path):
         logger.error(f"Embeddings database not found at {embeddings_path}")
         raise FileNotFoundError(f"Embeddings database not found at {embeddings_path}")
 
-    logger.info(f"Connecting to embeddings database at {embeddings_path}")
-    client = chromadb.PersistentClient(path=embeddings_path)
-    sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name=model_name
-    )
-    collection = client.get_or_create_collection(
-        "test_emails", embedding_function=sentence_transformer_ef
-    )
+    where = build_where(sender, after, before, has_attachment)
+    if planned:
+        check_planned(where, hybrid)
+    searcher = get_searcher(embeddings_path, model_name, cache_path, sql_path, backend)
+    if planned:
+        return searcher.search_planned(query, num_results, documents=documents)
+    if hybrid:
+        return searcher.search_hybrid(
+            query, num_results, where, lexical_depth, vector_depth, documents=documents
+        )
+    return searcher.search(query, num_results, where, documents)
 
-    logger.info(f"Running query: '{query}' with {num_results} results requested")
-    results = collection.query(
-        query_texts=[query],
-        n_results=num_results,
-    )
 
-    logger.info(f"Found {len(results['ids'][0])} matching results")
-    return results
+def run_queries(
+    queries: Iterable[str],
+    num_results: int = 2,
+    embeddings_path: str = "embedded_emails.db",
+    model_name: str = DEFAULT_MODEL_NAME,
+    batch_size: int = DEFAULT_QUERY_BATCH_SIZE,
+    cache_path: Optional[str] = None,
+    sender: Optional[str] = None,
+    after: Optional[Union[int, str, date, datetime]] = None,
+    before: Optional[Union[int, str, date, datetime]] = None,
+    has_attachment: Union[bool, str, None] = None,
+    hybrid: bool = False,
+    sql_path: str = "emails.db",
+    lexical_depth: int = DEFAULT_LEXICAL_DEPTH,
+    vector_depth: int = DEFAULT_VECTOR_DEPTH,
+    planned: bool = False,
+    backend: str = DEFAULT_BACKEND,
+    documents: str = DOCUMENTS_FULL,
+) -> Iterator[dict]:
+    """Search emails for many queries, loading the model and collection once.
+
+    Args:
+        queries (iterable): Search query texts
+        num_results (int, optional): Number of most similar results to return per query. Defaults to 2.
+        embeddings_path (str, optional): Path to ChromaDB embeddings database. Defaults to "embedded_emails.db".
+        model_name (str, optional): Name of sentence transformer model the emails were embedded with.
+        batch_size (int, optional): Number of queries encoded and queried together. Defaults to 64.
+        cache_path (str, optional): File the query cache is loaded from and saved to.
+        sender (str, optional): Only emails from this sender address, e.g. "john@example.com".
+        after (optional): Only emails sent at or after this time, as epoch milliseconds,
+            an ISO 8601 date or datetime string, or a date or datetime.
+        before (optional): Only emails sent before this time, in the same formats as ``after``.
+        has_attachment (bool or str, optional): Only emails with an attachment if True,
+            or with an attachment of this type if a string (e.g. "pdf").
+        hybrid (bool, optional): Merge keyword (BM25) and semantic results, see
+            ``Searcher.search_hybrid``. Defaults to False.
+        sql_path (str, optional): Path to SQLite database containing emails, used by hybrid
+            and planned search, and to read the bodies of emails embedded without documents.
+        lexical_depth (int, optional): Number of keyword search candidates of hybrid search.
+        vector_depth (int, optional): Number of semantic search candidates of hybrid search.
+        planned (bool, optional): Parse sender, time and attachment constraints out of the
+            query text and choose how to apply them, see ``Searcher.search_planned``.
+            Cannot be combined with the filter arguments or hybrid search. Defaults to False.
+        backend (str, optional): Store the embeddings are kept in, "chroma" (default),
+            "numpy" or "ivfpq", see ``BACKENDS``.
+        documents (str, optional): Return the bodies of the results in "full" (default),
+            as a "snippet" or not at all ("none"), see ``DOCUMENT_MODES``.
+
+    Returns:
+        iterator: Results of each query, in input order, in the same format as ``run_query``.
+            Batches are searched as the iterator is consumed
+
+    Raises:
+        FileNotFoundError: If embeddings database not found at specified path
+        ValueError: If planned search is combined with filters or hybrid search
+    """
+    if not os.path.exists(embeddings_path):
+        logger.error(f"Embeddings database not found at {embeddings_path}")
+        raise FileNotFoundError(f"Embeddings database not found at {embeddings_path}")
+
+    where = build_where(sender, after, before, has_attachment)
+    if planned:
+        check_planned(where, hybrid)
+    searcher = get_searcher(embeddings_path, model_name, cache_path, sql_path, backend)
+    if planned:
+        return (
+            searcher.search_planned(query, num_results, documents=documents) for query in queries
+        )
+    if hybrid:
+        # The legs of hybrid searches already run in parallel, so queries are not batched
+        return (
+            searcher.search_hybrid(
+                query, num_results, where, lexical_depth, vector_depth, documents=documents
+            )
+            for query in queries
+        )
+    return searcher.search_many(queries, num_results, batch_size, where, documents)
+
+
+def read_queries(file: TextIO) -> Iterator[str]:
+    """Read one query per line, skipping blank lines.
+
+    Args:
+        file (TextIO): File to read queries from
+
+    Yields:
+        str: Query texts
+    """
+    for line in file:
+        query = line.strip()
+        if query:
+            yield query
+
+
+def write_jsonl_results(queries: Iterable[str], results: Iterable[dict], output: TextIO) -> int:
+    """Write one JSON line per query with its results, as soon as each result arrives.
+
+    Args:
+        queries (iterable): Query texts
+        results (iterable): Results of each query, see ``run_queries``
+        output (TextIO): File to write to
+
+    Returns:
+        int: Number of lines written
+    """
+    count = 0
+    for query, result in zip(queries, results):
+        # Each result holds a single query, so its lists are unwrapped
+        line = {
+            "query": query,
+            **{
+                key: values[0] if isinstance(values, list) else values
+                for key, values in result.items()
+            },
+        }
+        output.write(json.dumps(line) + "\n")
+        output.flush()
+        count += 1
+    return count
+
+
+def parse_time(value: str) -> int:
+    """Parse an ISO 8601 date or datetime command line argument into epoch milliseconds."""
+    try:
+        return to_epoch_ms(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date or time: {value}")
 
 
 def main():
     parser = argparse.ArgumentParser(description="Search emails using semantic search")
-    parser.add_argument("query", type=str, help="Search query text")
+    parser.add_argument(
+        "query",
+        type=str,
+        nargs="?",
+        help="Search query text (omit when using --queries-file)",
+    )
+    parser.add_argument(
+        "--queries-file",
+        type=str,
+        help="File with one query per line, or - for stdin. Results are written to stdout as JSON lines",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_QUERY_BATCH_SIZE,
+        help=f"Number of queries from --queries-file searched together (default: {DEFAULT_QUERY_BATCH_SIZE})",
+    )
     parser.add_argument(
         "--num-results",
         type=int,
@@ -73,23 +759,148 @@ def main():
     parser.add_argument(
         "--model-name",
         type=str,
-        default="sentence-transformers/all-MiniLM-L6-v2",
-        help="Name of sentence transformer model (default: sentence-transformers/all-MiniLM-L6-v2)",
+        default=DEFAULT_MODEL_NAME,
+        help=f"Name of sentence transformer model (default: {DEFAULT_MODEL_NAME})",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=DEFAULT_BACKEND,
+        help=f"Store the embeddings were written to by embed_emails (default: {DEFAULT_BACKEND})",
+    )
+    parser.add_argument(
+        "--sender",
+        type=str,
+        help="Only return emails from this sender address",
+    )
+    parser.add_argument(
+        "--after",
+        type=parse_time,
+        help="Only return emails sent at or after this date or time (ISO 8601, e.g. 2024-05-01)",
+    )
+    parser.add_argument(
+        "--before",
+        type=parse_time,
+        help="Only return emails sent before this date or time (ISO 8601, e.g. 2024-06-01)",
+    )
+    parser.add_argument(
+        "--has-attachment",
+        action="store_true",
+        help="Only return emails with an attachment",
+    )
+    parser.add_argument(
+        "--attachment-type",
+        type=str,
+        help="Only return emails with an attachment of this type, e.g. pdf",
+    )
+    parser.add_argument(
+        "--hybrid",
+        action="store_true",
+        help="Merge keyword (BM25) and semantic search results with reciprocal rank fusion",
+    )
+    parser.add_argument(
+        "--sql-path",
+        type=str,
+        default="emails.db",
+        help="SQLite database file path, used by --hybrid and --plan and to read the bodies of "
+        "emails embedded with --no-documents (default: emails.db)",
+    )
+    parser.add_argument(
+        "--lexical-depth",
+        type=int,
+        default=DEFAULT_LEXICAL_DEPTH,
+        help=f"Number of keyword search candidates merged by --hybrid (default: {DEFAULT_LEXICAL_DEPTH})",
+    )
+    parser.add_argument(
+        "--vector-depth",
+        type=int,
+        default=DEFAULT_VECTOR_DEPTH,
+        help=f"Number of semantic search candidates merged by --hybrid (default: {DEFAULT_VECTOR_DEPTH})",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Parse sender, time and attachment constraints out of the query text "
+        '(e.g. "from John with an image attachment in the last week") and pick the '
+        "fastest way to apply them; uses --sql-path",
+    )
+    parser.add_argument(
+        "--documents",
+        choices=DOCUMENT_MODES,
+        default=DOCUMENTS_FULL,
+        help="Return the bodies of the results in full, as short snippets, or not at all "
+        f"(default: {DOCUMENTS_FULL})",
+    )
+    parser.add_argument(
+        "--cache-path",
+        type=str,
+        help="File to load the query cache from and save it to, so it persists between runs",
     )
     args = parser.parse_args()
+    if (args.query is None) == (args.queries_file is None):
+        parser.error("Provide either a query or --queries-file")
+    filter_args = (args.sender, args.after, args.before, args.attachment_type)
+    if args.plan and (args.hybrid or args.has_attachment or any(a is not None for a in filter_args)):
+        parser.error("--plan takes its filters from the query text; drop the other filters and --hybrid")
 
-    try:
-        results = run_query(
-            query=args.query,
-            num_results=args.num_results,
-            embeddings_path=args.embeddings_path,
-            model_name=args.model_name,
-        )
-        logger.info("Query results:")
-        logger.info(results)
-    except Exception as e:
-        logger.error(f"Error running query: {str(e)}")
-        raise
+    filters = {
+        "sender": args.sender,
+        "after": args.after,
+        "before": args.before,
+        "has_attachment": args.attachment_type or args.has_attachment or None,
+        "hybrid": args.hybrid,
+        "sql_path": args.sql_path,
+        "lexical_depth": args.lexical_depth,
+        "vector_depth": args.vector_depth,
+        "planned": args.plan,
+        "backend": args.backend,
+        "documents": args.documents,
+    }
+    if args.queries_file is not None:
+        # Keep stdout for the results
+        set_log_stream(sys.stderr)
+        file = sys.stdin if args.queries_file == "-" else open(args.queries_file)
+        try:
+            # Queries are read as they are searched, and each is echoed next to its results
+            queries, echoed_queries = itertools.tee(read_queries(file))
+            count = write_jsonl_results(
+                echoed_queries,
+                run_queries(
+                    queries,
+                    num_results=args.num_results,
+                    embeddings_path=args.embeddings_path,
+                    model_name=args.model_name,
+                    batch_size=args.batch_size,
+                    cache_path=args.cache_path,
+                    **filters,
+                ),
+                sys.stdout,
+            )
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        logger.info(f"Wrote results of {count} queries")
+    else:
+        try:
+            results = run_query(
+                query=args.query,
+                num_results=args.num_results,
+                embeddings_path=args.embeddings_path,
+                model_name=args.model_name,
+                cache_path=args.cache_path,
+                **filters,
+            )
+            logger.info("Query results:")
+            logger.info(results)
+        except Exception as e:
+            logger.error(f"Error running query: {str(e)}")
+            raise
+
+    cache = get_searcher(
+        args.embeddings_path, args.model_name, args.cache_path, args.sql_path, args.backend
+    ).cache
+    logger.info(f"Query cache: {cache.stats()}")
+    cache.save()
 
 
 if __name__ == "__main__":
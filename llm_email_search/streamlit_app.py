@@ -1,16 +1,31 @@
 import os
+from typing import Optional
 
 import streamlit as st
-import torch
 
 from llm_email_search.embed_emails import embed_emails
 from llm_email_search.extract_emails_to_sqlite import extract_emails
 from llm_email_search.extract_demo_emails_to_sqlite import extract_demo_emails_to_sqlite
-from llm_email_search.run_query import run_query
+from llm_email_search.query_cache import QueryCache
+from llm_email_search.run_query import Searcher, check_planned
+from llm_email_search.vector_store import build_where
+
+
+def import_torch() -> None:
+    """Import torch on first use, so the app starts without waiting for it."""
+    import torch
+
+    # Hack to prevent torch/Streamlit issues
+    # (see here: https://discuss.streamlit.io/t/error-in-torch-with-streamlit/90908/4)
+    torch.classes.__path__ = [os.path.join(torch.__path__[0], torch.classes.__file__)]
+
+
+@st.cache_resource
+def load_searcher(embeddings_path: str, model_name: str, sql_path: Optional[str] = None) -> Searcher:
+    """Load a searcher once per embeddings path and model, shared across reruns."""
+    import_torch()
+    return Searcher(embeddings_path, model_name, cache=QueryCache(), sql_path=sql_path)
 
-# Hack to prevent torch/Streamlit issues
-# (see here: https://discuss.streamlit.io/t/error-in-torch-with-streamlit/90908/4)
-torch.classes.__path__ = [os.path.join(torch.__path__[0], torch.classes.__file__)]
 
 st.title("LLM Email Search")
 
@@ -59,11 +74,18 @@ with tab3:
         "Name of embedding model to use", value="sentence-transformers/all-MiniLM-L6-v2"
     )
     batch_size = st.number_input(
-        "Batch size for embedding inference", value=2500, min_value=1, max_value=5461
+        "Batch size for database writes", value=2500, min_value=1, max_value=5461
+    )
+    encode_batch_size = st.number_input(
+        "Batch size for embedding inference", value=32, min_value=1, max_value=1024
     )
 
     # Add a checkbox to force CPU usage
     use_cpu = st.checkbox("Force CPU usage", value=False)
+    store_documents = st.checkbox(
+        "Store email bodies with the embeddings (otherwise they are read from the emails when searching)",
+        value=True,
+    )
 
     if st.button("Embed Emails"):
         with st.spinner("Embedding emails..."):
@@ -76,10 +98,19 @@ with tab3:
                 else:
                     use_mps = True
 
+                import_torch()
                 # Run in a separate process to avoid memory issues
                 embed_emails(
-                    emails_path, embeddings_path, model_name, batch_size=batch_size, use_mps=use_mps
+                    emails_path,
+                    embeddings_path,
+                    model_name,
+                    batch_size=batch_size,
+                    use_mps=use_mps,
+                    encode_batch_size=encode_batch_size,
+                    store_documents=store_documents,
                 )
+                # Collections may have been rebuilt, so searchers are opened again
+                load_searcher.clear()
                 st.success("Emails embedded successfully")
             except Exception as e:
                 st.error(f"Error embedding emails: {str(e)}")
@@ -99,13 +130,53 @@ with tab4:
         value="sentence-transformers/all-MiniLM-L6-v2",
         key="model_name",
     )
+    # Planned search reads its filters from the query, so it is not combined with the others
+    search_mode = st.radio(
+        "Search mode",
+        [
+            "Semantic search",
+            "Combine with keyword search (finds exact terms such as order numbers)",
+            'Read filters from the query (e.g. "from John with an image attachment in the last week")',
+        ],
+    )
+    hybrid = search_mode.startswith("Combine")
+    planned = search_mode.startswith("Read filters")
+    sql_path = st.text_input(
+        "Path to the emails", value="demo_emails.db", key="search_emails_path"
+    )
+    with st.expander("Filters"):
+        sender = st.text_input("Only emails from this sender address")
+        after = st.date_input("Only emails sent on or after", value=None)
+        before = st.date_input("Only emails sent before", value=None)
+        has_attachment = st.checkbox("Only emails with attachments")
+        attachment_type = st.text_input("Only emails with an attachment of this type (e.g. pdf)")
     if st.button("Search Emails"):
         if not query:
             st.warning("Please enter a query to search for")
         else:
             with st.spinner("Searching emails..."):
                 try:
-                    results = run_query(query, num_results, embeddings_path, model_name)
+                    where = build_where(
+                        sender=sender or None,
+                        after=after,
+                        before=before,
+                        has_attachment=attachment_type or has_attachment or None,
+                    )
+                    if planned:
+                        # Filters set above would otherwise be silently ignored
+                        check_planned(where, hybrid)
+                        results = load_searcher(
+                            embeddings_path, model_name, sql_path
+                        ).search_planned(query, num_results)
+                        st.caption(f"Plan: {results['plan']['strategy']}, {results['timings']['total_ms']:.0f} ms")
+                    elif hybrid:
+                        results = load_searcher(
+                            embeddings_path, model_name, sql_path
+                        ).search_hybrid(query, num_results, where)
+                    else:
+                        results = load_searcher(embeddings_path, model_name, sql_path).search(
+                            query, num_results, where
+                        )
                     st.success("Emails searched successfully")
                     if results and "documents" in results:
                         with st.expander("Results", expanded=True):
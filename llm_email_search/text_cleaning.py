@@ -0,0 +1,165 @@
+import html
+import re
+from typing import Optional
+
+# Tags that only occur in HTML, checked before a body is treated as markup
+HTML_TAG_PATTERN = re.compile(r"<(?:html|body|div|p|br|table|td|span|a|font|b|i|img)\b[^>]*>", re.I)
+# Elements whose content is never shown
+HIDDEN_ELEMENT_PATTERN = re.compile(
+    r"<(script|style|head|title)\b[^>]*>.*?</\1\s*>|<!--.*?-->", re.I | re.S
+)
+# Tags that end a line or a block of text
+LINE_BREAK_PATTERN = re.compile(
+    r"<(?:br|hr|/p|/div|/tr|/li|/h[1-6]|/table|/?blockquote|/ul|/ol)\b[^>]*>", re.I
+)
+# Table cells are set apart by a space; other inline tags join their text as a browser does
+CELL_END_PATTERN = re.compile(r"</t[dh]\s*>", re.I)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# Lines that introduce the quoted message of a reply. "On ... wrote:" may be
+# wrapped over two lines by the sending client
+REPLY_HEADER_PATTERN = re.compile(
+    r"^(?:On\b[^\n]{0,200}(?:\n[^\n]{0,200})?\bwrote:[ \t]*$"
+    r"|-{2,}[ \t]*Original Message[ \t]*-{2,}"
+    r"|From:[^\n]+\n(?:Sent|Date):)",
+    re.I | re.M,
+)
+QUOTED_LINE_PATTERN = re.compile(r"^[ \t]*>.*(?:\n|$)", re.M)
+
+# The standard signature separator (RFC 3676) and footers added by mail apps
+SIGNATURE_SEPARATOR_PATTERN = re.compile(r"^-- ?$", re.M)
+MOBILE_FOOTER_PATTERN = re.compile(r"^[ \t]*(?:Sent from my|Get Outlook for)\b.*$", re.I | re.M)
+# Sign-offs; only cut when what follows them is a signature, see looks_like_signature
+SIGN_OFF_PATTERN = re.compile(
+    r"^[ \t]*(?:(?:best|kind|warm|many)? ?regards|cheers|sincerely|thanks|thank you|best)"
+    r"[ \t]*[,!.]?[ \t]*$",
+    re.I | re.M,
+)
+MAX_SIGNATURE_LINES = 8
+# Lines of a signature block: contact details, or a name or title of a few words
+CONTACT_LINE_PATTERN = re.compile(r"(?:https?://|www\.|@|\+?\d[\d ()./-]{6,}\d)", re.I)
+MAX_SIGNATURE_LINE_WORDS = 6
+# Company and name suffixes; other lines ending in a period are sentences
+ABBREVIATION_PATTERN = re.compile(r"\b(?:inc|ltd|llc|co|corp|jr|sr|phd|esq)\.$", re.I)
+
+
+def looks_like_html(text: str) -> bool:
+    """Whether a body is HTML markup rather than plain text."""
+    return HTML_TAG_PATTERN.search(text) is not None
+
+
+def html_to_text(markup: str) -> str:
+    """Convert HTML to plain text, keeping line breaks between blocks.
+
+    Regular expressions rather than a parser are used: email HTML is often
+    malformed, and only the visible text is needed.
+
+    Args:
+        markup (str): HTML of an email
+
+    Returns:
+        str: Visible text, with entities decoded
+    """
+    text = HIDDEN_ELEMENT_PATTERN.sub(" ", markup)
+    text = LINE_BREAK_PATTERN.sub("\n", text)
+    text = CELL_END_PATTERN.sub(" ", text)
+    text = TAG_PATTERN.sub("", text)
+    return html.unescape(text)
+
+
+def strip_quoted_reply(text: str) -> str:
+    """Remove the quoted earlier messages of a reply.
+
+    Everything from the first reply header (such as "On ..., John wrote:"
+    or "-----Original Message-----") on is dropped, as are lines quoted with
+    ">". A message that is only a quote, such as a forward without comment,
+    is kept as it is.
+
+    Args:
+        text (str): Plain text of an email
+
+    Returns:
+        str: Text of the new message only
+    """
+    match = REPLY_HEADER_PATTERN.search(text)
+    if match is not None and text[: match.start()].strip():
+        text = text[: match.start()]
+    unquoted = QUOTED_LINE_PATTERN.sub("", text)
+    return unquoted if unquoted.strip() else text
+
+
+def looks_like_signature(text: str) -> bool:
+    """Whether the lines after a sign-off are a signature rather than more of the message.
+
+    A signature is a few short lines: a name, a title or company, and contact
+    details such as phone numbers, email addresses and URLs. Lines that read
+    as sentences are message content.
+
+    Args:
+        text (str): Text after the sign-off
+
+    Returns:
+        bool: True if every line could belong to a signature
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) > MAX_SIGNATURE_LINES:
+        return False
+    for line in lines:
+        if CONTACT_LINE_PATTERN.search(line):
+            continue
+        words = line.split()
+        if len(words) > MAX_SIGNATURE_LINE_WORDS or line.endswith(("?", "!")):
+            return False
+        if line.endswith(".") and not ABBREVIATION_PATTERN.search(line):
+            return False
+    return True
+
+
+def strip_signature(text: str) -> str:
+    """Remove the signature and mail app footers at the end of an email.
+
+    Args:
+        text (str): Plain text of an email
+
+    Returns:
+        str: Text without its signature
+    """
+    text = MOBILE_FOOTER_PATTERN.sub("", text)
+    match = SIGNATURE_SEPARATOR_PATTERN.search(text)
+    if match is not None and text[: match.start()].strip():
+        text = text[: match.start()]
+    sign_offs = list(SIGN_OFF_PATTERN.finditer(text))
+    if sign_offs:
+        # Only the last sign-off can end the message; a "Thanks!" earlier on is content
+        sign_off = sign_offs[-1]
+        if text[: sign_off.start()].strip() and looks_like_signature(text[sign_off.end() :]):
+            text = text[: sign_off.start()]
+    return text
+
+
+def collapse_whitespace(text: str) -> str:
+    """Collapse runs of spaces within lines and runs of blank lines between them."""
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def clean_text(body: Optional[str]) -> str:
+    """Reduce an email body to the text worth embedding.
+
+    HTML is converted to text, quoted replies and signatures are removed
+    and whitespace is collapsed, so the model's short token window is spent
+    on what the email actually says.
+
+    Args:
+        body (str): Body of an email, plain text or HTML
+
+    Returns:
+        str: Cleaned text; if cleaning would leave nothing, the body with only
+            markup and whitespace removed
+    """
+    if not body:
+        return ""
+    text = html_to_text(body) if looks_like_html(body) else body
+    text = text.replace("\r\n", "\n")
+    cleaned = collapse_whitespace(strip_signature(strip_quoted_reply(text)))
+    return cleaned or collapse_whitespace(text)
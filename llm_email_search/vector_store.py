@@ -0,0 +1,386 @@
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from datetime import date, datetime, timezone
+from email.utils import parseaddr
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence, Union
+
+from llm_email_search.logger import setup_logger
+
+# chromadb takes seconds to import, so it is only imported when a database is opened
+if TYPE_CHECKING:
+    from chromadb.api.models.Collection import Collection
+    from chromadb.api.types import EmbeddingFunction
+
+    from llm_email_search.numpy_store import NumpyCollection
+
+logger = setup_logger(__name__)
+
+COLLECTION_NAME = "test_emails"
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Default inference batch size of SentenceTransformer.encode
+DEFAULT_ENCODE_BATCH_SIZE = 32
+
+# Metadata key holding the hash of the document and metadata an embedding was computed from
+EMBEDDING_HASH_KEY = "embedding_hash"
+
+# Stores embeddings can be kept in: a Chroma database, memory-mapped NumPy
+# files for read-mostly archives (see numpy_store), or those files searched
+# through an IVF/PQ index for very large archives (see ivf_pq)
+CHROMA_BACKEND = "chroma"
+NUMPY_BACKEND = "numpy"
+IVF_PQ_BACKEND = "ivfpq"
+BACKENDS = (CHROMA_BACKEND, NUMPY_BACKEND, IVF_PQ_BACKEND)
+DEFAULT_BACKEND = CHROMA_BACKEND
+
+# Storage types of the vectors of the NumPy backend; int8 vectors are stored
+# with one scale per vector
+NUMPY_DTYPES = ("float32", "float16", "int8")
+DEFAULT_NUMPY_DTYPE = "int8"
+
+# Embeddings of every text encoded before, see embedding_cache
+EMBEDDING_CACHE_FILENAME = "embedding_cache.sqlite3"
+
+# Chroma cannot filter on list values, so each attachment type gets its own boolean flag
+ATTACHMENT_FLAG_PREFIX = "attachment_"
+
+
+def normalize_sender(sender: Optional[str]) -> Optional[str]:
+    """Normalize a sender to a bare, lower-cased email address.
+
+    Args:
+        sender (str): Sender as in the From header, e.g. ``"John Doe <John@Example.com>"``
+
+    Returns:
+        str: Address such as ``"john@example.com"``, the lower-cased sender if it
+            holds no address, or None if the sender is empty
+    """
+    if not sender:
+        return None
+    _, address = parseaddr(sender)
+    normalized = (address if "@" in address else sender).strip().lower()
+    return normalized or None
+
+
+def get_attachment_flag(attachment_type: str) -> str:
+    """Get the metadata key flagging emails with an attachment of a type.
+
+    Args:
+        attachment_type (str): File extension with or without the dot, e.g. ``".PDF"``
+
+    Returns:
+        str: Metadata key, e.g. ``"attachment_pdf"``
+    """
+    extension = re.sub(r"[^a-z0-9]+", "_", attachment_type.strip().lstrip(".").lower())
+    return f"{ATTACHMENT_FLAG_PREFIX}{extension or 'unknown'}"
+
+
+def build_metadata(
+    sender: Optional[str],
+    subject: Optional[str],
+    timestamp: Optional[int],
+    attachment_types: Optional[str],
+) -> Dict[str, Union[str, int, bool]]:
+    """Build the filterable metadata stored with an email's embedding.
+
+    Missing values are left out rather than stored as placeholders, so
+    filters never match them.
+
+    Args:
+        sender (str): Sender as in the From header
+        subject (str): Subject line
+        timestamp (int): Epoch timestamp in milliseconds
+        attachment_types (str): Comma-separated file extensions of the attachments
+
+    Returns:
+        dict: Metadata with the sender, normalized sender address, subject,
+            integer timestamp, attachment types, ``has_attachment`` and one
+            flag per attachment type (see ``get_attachment_flag``)
+    """
+    metadata = {}
+    if sender is not None:
+        metadata["sender"] = sender
+    sender_address = normalize_sender(sender)
+    if sender_address is not None:
+        metadata["sender_address"] = sender_address
+    if subject is not None:
+        metadata["subject"] = subject
+    if timestamp is not None:
+        metadata["timestamp"] = int(timestamp)
+    types = [t for t in (attachment_types or "").split(",") if t.strip()]
+    metadata["attachment_types"] = ",".join(types)
+    metadata["has_attachment"] = bool(types)
+    for attachment_type in types:
+        metadata[get_attachment_flag(attachment_type)] = True
+    return metadata
+
+
+def to_epoch_ms(value: Union[int, str, date, datetime]) -> int:
+    """Convert a point in time to epoch milliseconds, the unit of email timestamps.
+
+    Args:
+        value (int, str, date or datetime): Epoch milliseconds, an ISO 8601 date
+            or datetime string, or a date or datetime. Dates and naive datetimes
+            are taken as UTC
+
+    Returns:
+        int: Epoch timestamp in milliseconds
+
+    Raises:
+        ValueError: If a string is not an ISO 8601 date or datetime
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def build_where(
+    sender: Union[str, Sequence[str], None] = None,
+    after: Optional[Union[int, str, date, datetime]] = None,
+    before: Optional[Union[int, str, date, datetime]] = None,
+    has_attachment: Union[bool, str, Sequence[str], None] = None,
+) -> Optional[Dict[str, Any]]:
+    """Build a Chroma ``where`` filter, so results are narrowed inside the index.
+
+    Args:
+        sender (str or sequence, optional): Only emails from this sender address,
+            or from any of several addresses
+        after (optional): Only emails sent at or after this time, see ``to_epoch_ms``
+        before (optional): Only emails sent before this time, see ``to_epoch_ms``
+        has_attachment (bool, str or sequence, optional): Only emails with an
+            attachment if True, with an attachment of this type if a string
+            (e.g. ``"pdf"``), or with an attachment of any of several types
+
+    Returns:
+        dict: Chroma ``where`` filter, or None if no filter is given
+    """
+    conditions = []
+    if isinstance(sender, str):
+        sender = [sender]
+    addresses = sorted({normalize_sender(address) for address in sender or []} - {None})
+    if addresses:
+        conditions.append(
+            {"sender_address": addresses[0] if len(addresses) == 1 else {"$in": addresses}}
+        )
+    if after is not None:
+        conditions.append({"timestamp": {"$gte": to_epoch_ms(after)}})
+    if before is not None:
+        conditions.append({"timestamp": {"$lt": to_epoch_ms(before)}})
+    if isinstance(has_attachment, str):
+        has_attachment = [has_attachment]
+    if isinstance(has_attachment, bool):
+        if has_attachment:
+            conditions.append({"has_attachment": True})
+    elif has_attachment:
+        flags = sorted({get_attachment_flag(attachment_type) for attachment_type in has_attachment})
+        if len(flags) == 1:
+            conditions.append({flags[0]: True})
+        else:
+            conditions.append({"$or": [{flag: True} for flag in flags]})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def get_collection_name(model_name: str) -> str:
+    """Get the name of the collection holding the embeddings of a model.
+
+    Each model gets its own collection, so switching models never mixes
+    embeddings from different vector spaces. The default model keeps the
+    original collection name.
+
+    Args:
+        model_name (str): Name of the sentence transformer model
+
+    Returns:
+        str: Collection name that satisfies Chroma's naming rules
+    """
+    if model_name == DEFAULT_MODEL_NAME:
+        return COLLECTION_NAME
+    slug = re.sub(r"[^a-zA-Z0-9]+", "-", model_name.split("/")[-1]).strip("-")[:32]
+    model_hash = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:8]
+    return f"{COLLECTION_NAME}_{slug}_{model_hash}"
+
+
+def get_version_path(embeddings_path: str, model_name: str) -> str:
+    return os.path.join(embeddings_path, f"{get_collection_name(model_name)}.version")
+
+
+def get_collection_version(embeddings_path: str, model_name: str) -> str:
+    """Get the version of a model's collection, which changes whenever it is written to.
+
+    Args:
+        embeddings_path (str): Path to the ChromaDB embeddings database
+        model_name (str): Name of the sentence transformer model
+
+    Returns:
+        str: Current version, or an empty string if it was never written to
+    """
+    try:
+        with open(get_version_path(embeddings_path, model_name)) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_collection_version(embeddings_path: str, model_name: str) -> str:
+    """Give a model's collection a new version, invalidating cached search results.
+
+    The version is kept in a file next to the Chroma database, so searchers in
+    other processes see it too.
+
+    Args:
+        embeddings_path (str): Path to the ChromaDB embeddings database
+        model_name (str): Name of the sentence transformer model
+
+    Returns:
+        str: New version
+    """
+    version = uuid.uuid4().hex
+    version_path = get_version_path(embeddings_path, model_name)
+    temp_path = f"{version_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as file:
+        file.write(version)
+    os.replace(temp_path, version_path)
+    return version
+
+
+def get_numpy_store_path(embeddings_path: str, model_name: str) -> str:
+    return os.path.join(embeddings_path, NUMPY_BACKEND, get_collection_name(model_name))
+
+
+def get_ivf_pq_path(embeddings_path: str, model_name: str) -> str:
+    return os.path.join(embeddings_path, IVF_PQ_BACKEND, get_collection_name(model_name))
+
+
+def get_embedding_cache_path(embeddings_path: str) -> str:
+    # Shared by all models and backends, and kept when collections are rebuilt
+    return os.path.join(embeddings_path, EMBEDDING_CACHE_FILENAME)
+
+
+def open_collection(
+    embeddings_path: str,
+    model_name: str,
+    embedding_function: Optional["EmbeddingFunction"] = None,
+    rebuild: bool = False,
+    backend: str = DEFAULT_BACKEND,
+    dtype: str = DEFAULT_NUMPY_DTYPE,
+) -> Union["Collection", "NumpyCollection"]:
+    """Open (or create) the collection holding the embeddings of a model.
+
+    Args:
+        embeddings_path (str): Path to the ChromaDB embeddings database
+        model_name (str): Name of the sentence transformer model
+        embedding_function (EmbeddingFunction, optional): Function used by Chroma to embed
+            documents and query texts
+        rebuild (bool): Delete the collection first, so everything is embedded from scratch
+        backend (str): Store holding the embeddings, one of ``BACKENDS``
+        dtype (str): Storage type of the vectors of a new NumPy store, one of ``NUMPY_DTYPES``
+
+    Returns:
+        Collection: Chroma collection for the model, or a ``NumpyCollection`` or
+            ``IndexedCollection`` with the same interface
+
+    Raises:
+        ValueError: If the backend is not one of ``BACKENDS``
+    """
+    if backend in (NUMPY_BACKEND, IVF_PQ_BACKEND):
+        from llm_email_search.numpy_store import NumpyCollection
+
+        store_path = get_numpy_store_path(embeddings_path, model_name)
+        index_path = get_ivf_pq_path(embeddings_path, model_name)
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        if rebuild:
+            for path in (store_path, index_path):
+                if os.path.exists(path):
+                    logger.info(f"Deleting {path} for a clean rebuild")
+                    shutil.rmtree(path)
+            bump_collection_version(embeddings_path, model_name)
+        # The names differ from the Chroma collection's, so cached results of
+        # the backends are kept apart
+        name = f"{NUMPY_BACKEND}/{get_collection_name(model_name)}"
+        store = NumpyCollection(store_path, name, model_name, dtype)
+        if backend == NUMPY_BACKEND:
+            return store
+
+        from llm_email_search.ivf_pq import IndexedCollection
+
+        return IndexedCollection(
+            store, index_path, f"{IVF_PQ_BACKEND}/{get_collection_name(model_name)}"
+        )
+    if backend != CHROMA_BACKEND:
+        raise ValueError(f"Unknown backend {backend}, expected one of {', '.join(BACKENDS)}")
+
+    import chromadb
+
+    client = chromadb.PersistentClient(path=embeddings_path)
+    collection_name = get_collection_name(model_name)
+    if rebuild and collection_name in client.list_collections():
+        logger.info(f"Deleting collection {collection_name} for a clean rebuild")
+        client.delete_collection(collection_name)
+        bump_collection_version(embeddings_path, model_name)
+    return client.get_or_create_collection(
+        collection_name,
+        embedding_function=embedding_function,
+        metadata={"model_name": model_name},
+    )
+
+
+def get_max_batch_size(embeddings_path: str) -> int:
+    """Get the largest number of entries Chroma accepts in a single write.
+
+    Args:
+        embeddings_path (str): Path to the ChromaDB embeddings database
+
+    Returns:
+        int: Maximum batch size
+    """
+    import chromadb
+
+    return chromadb.PersistentClient(path=embeddings_path).get_max_batch_size()
+
+
+def get_embedding_hashes(collection: "Collection", ids: List[str]) -> Dict[str, str]:
+    """Read the embedding hashes of some entries of a collection.
+
+    Args:
+        collection (Collection): Chroma collection
+        ids (list): Ids of the entries
+
+    Returns:
+        dict: Maps the ids of the entries found to their embedding hash, or to an
+            empty string for entries embedded before hashes were recorded
+    """
+    entries = collection.get(ids=ids, include=["metadatas"])
+    return {
+        entry_id: (metadata or {}).get(EMBEDDING_HASH_KEY, "")
+        for entry_id, metadata in zip(entries["ids"], entries["metadatas"])
+    }
+
+
+def iter_entry_ids(collection: "Collection", page_size: int = 10000) -> Iterator[List[str]]:
+    """Stream the ids of every entry of a collection, a page at a time.
+
+    Args:
+        collection (Collection): Chroma collection
+        page_size (int): Number of ids read per request
+
+    Yields:
+        list: Ids of the entries of a page
+    """
+    offset = 0
+    while True:
+        ids = collection.get(include=[], limit=page_size, offset=offset)["ids"]
+        if ids:
+            yield ids
+        if len(ids) < page_size:
+            break
+        offset += page_size
@@ -1,4 +1,8 @@
+import base64
+import copy
 import pytest
+import httplib2
+from googleapiclient.errors import HttpError
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from llm_email_search.extract_emails_to_sqlite import Base, Email
@@ -25,6 +29,145 @@ MOCK_EMAIL = {
     },
 }
 
+
+
+def make_mock_message(index: int) -> dict:
+    """Returns a copy of MOCK_EMAIL with a unique id, timestamp and body."""
+    message = copy.deepcopy(MOCK_EMAIL)
+    body = base64.urlsafe_b64encode(f"This is test email {index}".encode()).decode()
+    message["id"] = f"msg{index:05d}"
+    message["internalDate"] = str(1647123456789 + index)
+    message["payload"]["body"]["data"] = body
+    message["payload"]["parts"][0]["body"]["data"] = body
+    return message
+
+
+class FakeRequest:
+    """Mimics a googleapiclient HttpRequest."""
+
+    def __init__(self, func):
+        self._func = func
+
+    def execute(self):
+        return self._func()
+
+
+class FakeBatch:
+    """Mimics a googleapiclient BatchHttpRequest."""
+
+    def __init__(self, callback):
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        for request_id, request in self._requests:
+            try:
+                response, exception = request.execute(), None
+            except HttpError as e:
+                response, exception = None, e
+            self._callback(request_id, response, exception)
+
+
+class FakeHistoryResource:
+    """Mimics the ``users().history()`` resource of a FakeGmailService."""
+
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId, startHistoryId, pageToken=None, **kwargs):
+        def execute():
+            if int(startHistoryId) < 100:
+                raise HttpError(httplib2.Response({"status": 404}), b"not found")
+            records = [
+                record
+                for record in self._service.history_records
+                if int(record["id"]) > int(startHistoryId)
+            ]
+            return {"history": records, "historyId": str(self._service.history_id)}
+
+        return FakeRequest(execute)
+
+
+class FakeGmailService:
+    """In-memory stand-in for the Gmail API ``Resource``.
+
+    Args:
+        messages (list): Gmail message resources, newest first
+        failures (dict): Maps message ids to HTTP status codes raised on
+            successive ``get`` calls before the message is returned
+    """
+
+    def __init__(self, messages, failures=None):
+        self.messages_by_id = {message["id"]: message for message in messages}
+        self.failures = {k: list(v) for k, v in (failures or {}).items()}
+        self.get_calls = []
+        self.history_id = 100
+        self.history_records = []
+
+    def add_message(self, message):
+        """Adds a message as the newest in the mailbox and records it in the history."""
+        self.history_id += 1
+        self.messages_by_id = {message["id"]: message, **self.messages_by_id}
+        self.history_records.append(
+            {"id": str(self.history_id), "messagesAdded": [{"message": {"id": message["id"]}}]}
+        )
+
+    def delete_message(self, message_id):
+        """Deletes a message from the mailbox and records it in the history."""
+        self.history_id += 1
+        del self.messages_by_id[message_id]
+        self.history_records.append(
+            {"id": str(self.history_id), "messagesDeleted": [{"message": {"id": message_id}}]}
+        )
+
+    def users(self):
+        return self
+
+    def getProfile(self, userId):
+        return FakeRequest(lambda: {"historyId": str(self.history_id)})
+
+    def history(self):
+        return FakeHistoryResource(self)
+
+    def messages(self):
+        return self
+
+    def get(self, userId, id, format="full", **kwargs):
+        def execute():
+            self.get_calls.append((id, format))
+            if self.failures.get(id):
+                status = self.failures[id].pop(0)
+                raise HttpError(httplib2.Response({"status": status}), b"error")
+            if id not in self.messages_by_id:
+                raise HttpError(httplib2.Response({"status": 404}), b"not found")
+            return copy.deepcopy(self.messages_by_id[id])
+
+        return FakeRequest(execute)
+
+    def list(self, userId, maxResults=100, pageToken=None, **kwargs):
+        def execute():
+            start = int(pageToken or 0)
+            ids = list(self.messages_by_id)[start : start + maxResults]
+            response = {"messages": [{"id": i, "threadId": i} for i in ids]}
+            if start + maxResults < len(self.messages_by_id):
+                response["nextPageToken"] = str(start + maxResults)
+            return response
+
+        return FakeRequest(execute)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(callback)
+
+
+@pytest.fixture
+def fake_gmail_service():
+    """Returns a fake Gmail service holding five messages shaped like MOCK_EMAIL."""
+    return FakeGmailService([make_mock_message(i) for i in range(5)])
+
+
 @pytest.fixture(autouse=True)
 def setup_logging():
     """Configure logging for tests."""
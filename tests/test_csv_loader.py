@@ -0,0 +1,71 @@
+import csv
+
+import pytest
+from sqlalchemy import text
+
+from llm_email_search.csv_loader import load_csv_to_sqlite, parse_timestamp
+from llm_email_search.extract_demo_emails_to_sqlite import extract_demo_emails_to_sqlite
+from llm_email_search.extract_public_emails_to_sqlite import extract_public_emails_to_sqlite
+from llm_email_search.models import init_database
+
+
+@pytest.fixture
+def emails_csv(tmp_path):
+    path = tmp_path / "emails.csv"
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Email Text", "From", "Date", "Email Type"])
+        writer.writerow(["<p>Hello <b>there</b></p>", "a@example.com", "2024-03-01", "Safe Email"])
+        writer.writerow(["", "b@example.com", "1709251200000", "Safe Email"])
+        writer.writerow(["Win a prize", "", "1709251200000", "Phishing Email"])
+        writer.writerow(["Win a prize", "", "1709251200000", "Phishing Email"])
+    return str(path)
+
+
+def read_emails(database):
+    with init_database(database).connect() as connection:
+        return connection.execute(
+            text("SELECT sender, body, clean_body, timestamp FROM emails ORDER BY id")
+        ).all()
+
+
+def test_load_csv_maps_columns_and_skips_duplicates(emails_csv, temp_db_path):
+    columns = {"body": "Email Text", "sender": "From", "timestamp": "Date"}
+    assert load_csv_to_sqlite(temp_db_path, emails_csv, columns, chunk_size=2) == 2
+    assert read_emails(temp_db_path) == [
+        ("a@example.com", "<p>Hello <b>there</b></p>", "Hello there", 1709251200000),
+        (None, "Win a prize", "Win a prize", 1709251200000),
+    ]
+    # Loading again inserts nothing
+    assert load_csv_to_sqlite(temp_db_path, emails_csv, columns) == 0
+
+    with init_database(temp_db_path).begin() as connection:
+        # Bulk inserted emails are in the full-text index, and later inserts are indexed too
+        connection.execute(text("INSERT INTO emails (body) VALUES ('Claim your prize')"))
+        matches = connection.execute(
+            text("SELECT rowid FROM emails_fts WHERE emails_fts MATCH 'prize' ORDER BY rowid")
+        ).scalars()
+        assert list(matches) == [2, 3]
+
+    with pytest.raises(ValueError):
+        load_csv_to_sqlite(temp_db_path, emails_csv, {"text": "Email Text"})
+
+
+def test_parse_timestamp():
+    assert parse_timestamp(" 1709251200000 ") == 1709251200000
+    assert parse_timestamp("2024-03-01") == 1709251200000
+    assert parse_timestamp("Fri, 1 Mar 2024 01:00:00 +0100") == 1709251200000
+    assert parse_timestamp("Fri, 01 Mar 2024 00:00:00") == 1709251200000
+    assert parse_timestamp("last Friday") is None
+
+
+def test_demo_and_public_loaders(emails_csv, tmp_path):
+    demo_path = str(tmp_path / "demo.db")
+    public_path = str(tmp_path / "public.db")
+    assert extract_demo_emails_to_sqlite(demo_path, emails_csv) == 2
+    # The public loader keeps duplicates, but not rows without a body
+    assert extract_public_emails_to_sqlite(public_path, emails_csv) == 3
+    assert [email.sender for email in read_emails(public_path)] == [None, None, None]
+
+    with init_database(demo_path).connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
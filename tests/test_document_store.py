@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from llm_email_search.document_store import DocumentStore, fill_documents, make_snippet
+from llm_email_search.embed_emails import embed_emails
+from llm_email_search.extract_emails_to_sqlite import Email
+from llm_email_search.run_query import run_query
+from llm_email_search.vector_store import open_collection
+
+
+def test_make_snippet():
+    assert make_snippet("Hello\n\n  world") == "Hello world"
+    assert make_snippet("one two three", length=7) == "one two..."
+    assert make_snippet(None) is None
+    assert make_snippet("one two", length=7, truncated=True) == "one two..."
+
+
+def test_fill_documents_reads_missing_bodies_in_one_batch(sample_db_with_emails):
+    store = DocumentStore(sample_db_with_emails)
+    results = {"ids": [["2", "1"], ["1"]], "documents": [[None, "stored"], [None]]}
+
+    filled = fill_documents(results, store=store)
+    assert filled["documents"] == [["This is test email 2", "stored"], ["This is test email 1"]]
+    # Cached results are not changed
+    assert results["documents"] == [[None, "stored"], [None]]
+
+    snippets = fill_documents(results, "snippet", snippet_length=9, store=store)
+    assert snippets["documents"] == [["This is t...", "stored"], ["This is t..."]]
+    assert "documents" not in fill_documents(results, "none", store=store)
+    # A body cut in SQLite is marked as cut even when collapsing its whitespace shortens it
+    session = sessionmaker(bind=create_engine(f"sqlite:///{sample_db_with_emails}"))()
+    session.add(Email(sender="a@example.com", subject="Spaced", body="Hello" + " " * 20 + "world, and more"))
+    session.commit()
+    session.close()
+    spaced = fill_documents({"ids": [["3"]], "documents": [[None]]}, "snippet", snippet_length=20, store=store)
+    assert spaced["documents"] == [["Hello..."]]
+    assert store.get(["3", "1"], max_length=20) == {
+        "3": ("Hello" + " " * 15, True),
+        "1": ("This is test email 1", False),
+    }
+    with pytest.raises(ValueError):
+        fill_documents(results, "all", store=store)
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_search_hydrates_bodies_of_id_only_index(sample_db_with_emails, temp_embeddings_path, backend):
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    embed_emails(
+        sample_db_with_emails, temp_embeddings_path, model_name, backend=backend, store_documents=False
+    )
+    collection = open_collection(temp_embeddings_path, model_name, backend=backend)
+    assert collection.get(include=["documents"])["documents"] == [None, None]
+
+    results = run_query(
+        "test email 2", embeddings_path=temp_embeddings_path, sql_path=sample_db_with_emails, backend=backend
+    )
+    assert results["ids"][0][0] == "2"
+    assert results["documents"][0] == [f"This is test email {email_id}" for email_id in results["ids"][0]]
+
+    ids_only = run_query(
+        "test email 2",
+        embeddings_path=temp_embeddings_path,
+        sql_path=sample_db_with_emails,
+        backend=backend,
+        documents="none",
+    )
+    assert ids_only["ids"] == results["ids"]
+    assert "documents" not in ids_only
+
+
+@pytest.mark.parametrize("store_documents", [True, False])
+def test_search_results_show_raw_bodies(sample_db_with_emails, temp_embeddings_path, store_documents):
+    session = sessionmaker(bind=create_engine(f"sqlite:///{sample_db_with_emails}"))()
+    raw_body = "<div>Quarterly report attached.</div><div>Cheers,</div><div>Sam</div>"
+    session.add(Email(sender="sam@example.com", subject="Report", body=raw_body, clean_body="Quarterly report attached."))
+    session.commit()
+    session.close()
+    embed_emails(
+        sample_db_with_emails,
+        temp_embeddings_path,
+        "sentence-transformers/all-MiniLM-L6-v2",
+        store_documents=store_documents,
+    )
+
+    results = run_query(
+        "quarterly report", embeddings_path=temp_embeddings_path, sql_path=sample_db_with_emails, num_results=3
+    )
+    documents = dict(zip(results["ids"][0], results["documents"][0]))
+    assert documents["3"] == raw_body
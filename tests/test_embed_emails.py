@@ -1,5 +1,16 @@
 import chromadb
-from llm_email_search.embed_emails import embed_emails
+from chromadb.api.models.Collection import Collection
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from llm_email_search.embed_emails import embed_emails, find_deleted_ids
+from llm_email_search.extract_emails_to_sqlite import Email
+from llm_email_search.vector_store import (
+    COLLECTION_NAME,
+    DEFAULT_MODEL_NAME,
+    build_metadata,
+    get_collection_name,
+)
 
 
 def test_embed_emails(sample_db_with_emails, temp_embeddings_path):
@@ -17,3 +28,89 @@ def test_embed_emails(sample_db_with_emails, temp_embeddings_path):
 
     # The results["ids"] is a list of lists, so we need to check the length of the first list
     assert len(results["ids"][0]) == 2
+
+
+def test_embed_emails_streams_in_batches(sample_db_with_emails, temp_embeddings_path):
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+
+    # A batch size smaller than the number of emails writes several batches
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name, batch_size=1)
+
+    client = chromadb.PersistentClient(path=temp_embeddings_path)
+    collection = client.get_collection("test_emails")
+    assert sorted(collection.get()["ids"]) == ["1", "2"]
+
+
+def test_embed_emails_is_incremental(sample_db_with_emails, temp_embeddings_path, mocker):
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name)
+
+    session = sessionmaker(bind=create_engine(f"sqlite:///{sample_db_with_emails}"))()
+    session.get(Email, 1).subject = "Updated subject"
+    session.delete(session.get(Email, 2))
+    session.add(Email(sender="test3@example.com", subject="Test Email 3", body="This is test email 3"))
+    session.commit()
+    session.close()
+
+    add_spy = mocker.spy(Collection, "add")
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name)
+
+    # Only the modified and the new email are embedded again
+    assert sorted(add_spy.call_args.kwargs["ids"]) == ["1", "3"]
+    collection = chromadb.PersistentClient(path=temp_embeddings_path).get_collection("test_emails")
+    entries = collection.get(ids=["1", "2", "3"])
+    assert sorted(entries["ids"]) == ["1", "3"]
+    assert entries["metadatas"][entries["ids"].index("1")]["subject"] == "Updated subject"
+
+
+def test_get_collection_name():
+    assert get_collection_name(DEFAULT_MODEL_NAME) == COLLECTION_NAME
+    other_name = get_collection_name("sentence-transformers/all-mpnet-base-v2")
+    assert other_name.startswith(f"{COLLECTION_NAME}_all-mpnet-base-v2_")
+    assert other_name != get_collection_name("other-org/all-mpnet-base-v2")
+
+
+def test_embed_emails_stores_typed_metadata(sample_db_with_emails, temp_embeddings_path):
+    embed_emails(sample_db_with_emails, temp_embeddings_path, DEFAULT_MODEL_NAME)
+
+    collection = chromadb.PersistentClient(path=temp_embeddings_path).get_collection("test_emails")
+    metadata = collection.get(ids=["1"])["metadatas"][0]
+    assert metadata["timestamp"] == 1647123456789
+    assert metadata["sender_address"] == "test1@example.com"
+    assert metadata["has_attachment"] is True
+    assert metadata["attachment_pdf"] is True
+    assert metadata["attachment_txt"] is True
+    assert "attachment_jpg" not in metadata
+
+
+def test_build_metadata_omits_missing_values():
+    metadata = build_metadata("John Doe <John.Doe@Example.com>", None, None, "")
+    assert metadata == {
+        "sender": "John Doe <John.Doe@Example.com>",
+        "sender_address": "john.doe@example.com",
+        "attachment_types": "",
+        "has_attachment": False,
+    }
+
+
+def test_embed_emails_reads_hashes_per_batch(sample_db_with_emails, temp_embeddings_path, mocker):
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name, batch_size=1)
+
+    get_spy = mocker.spy(Collection, "get")
+    find_spy = mocker.patch("llm_email_search.embed_emails.find_deleted_ids", wraps=find_deleted_ids)
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name, batch_size=1)
+
+    # Hashes are read for one batch of emails at a time, and without deleted
+    # emails the collection is never scanned
+    assert [call.kwargs["ids"] for call in get_spy.call_args_list] == [["1"], ["2"]]
+    assert find_spy.call_count == 0
+
+    session = sessionmaker(bind=create_engine(f"sqlite:///{sample_db_with_emails}"))()
+    session.delete(session.get(Email, 1))
+    session.commit()
+    session.close()
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name, batch_size=1)
+    assert find_spy.call_count == 1
+    collection = chromadb.PersistentClient(path=temp_embeddings_path).get_collection("test_emails")
+    assert collection.get()["ids"] == ["2"]
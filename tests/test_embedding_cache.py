@@ -0,0 +1,77 @@
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from llm_email_search.embed_emails import embed_emails
+from llm_email_search.embedding_cache import EmbeddingCache, MinHashLSH, content_key
+from llm_email_search.encoder import SentenceTransformerEncoder
+from llm_email_search.extract_emails_to_sqlite import Email
+from llm_email_search.vector_store import get_embedding_cache_path, open_collection
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def test_content_key_ignores_whitespace():
+    assert content_key("Hello  world\n") == content_key("Hello world")
+    assert content_key("Hello world") != content_key("Hello world!")
+
+
+def test_cache_is_keyed_by_model(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path, "model-a")
+    embeddings = np.arange(6, dtype=np.float32).reshape(2, 3)
+    cache.put_many(["a", "b"], embeddings)
+    # Keys that are cached already keep their embedding
+    cache.put_many(["a"], np.zeros((1, 3), dtype=np.float32))
+    cache.close()
+
+    cache = EmbeddingCache(path, "model-a")
+    found = cache.get_many(["b", "a", "c"])
+    assert sorted(found) == ["a", "b"]
+    np.testing.assert_array_equal(found["a"], embeddings[0])
+    assert EmbeddingCache(path, "model-b").get_many(["a"]) == {}
+
+
+def test_minhash_finds_near_duplicates():
+    text = " ".join(f"word{i}" for i in range(200))
+    lsh = MinHashLSH(threshold=0.9)
+    lsh.add("original", lsh.signature(text))
+
+    assert lsh.query(lsh.signature(text + " word200")) == "original"
+    assert lsh.query(lsh.signature(" ".join(f"other{i}" for i in range(200)))) is None
+
+
+def test_minhash_forgets_least_recently_used_texts():
+    texts = {key: " ".join(f"{key}{i}" for i in range(50)) for key in ("a", "b", "c")}
+    lsh = MinHashLSH(threshold=0.9, max_signatures=2)
+    lsh.add("a", lsh.signature(texts["a"]))
+    lsh.add("b", lsh.signature(texts["b"]))
+    # Finding "a" as a near duplicate keeps it, so adding "c" forgets "b"
+    assert lsh.query(lsh.signature(texts["a"])) == "a"
+    lsh.add("c", lsh.signature(texts["c"]))
+
+    assert len(lsh) == 2
+    assert lsh.query(lsh.signature(texts["b"])) is None
+    assert lsh.query(lsh.signature(texts["a"])) == "a"
+
+
+def test_rebuild_reuses_cached_embeddings(sample_db_with_emails, temp_embeddings_path, mocker):
+    session = sessionmaker(bind=create_engine(f"sqlite:///{sample_db_with_emails}"))()
+    session.add(Email(sender="test3@example.com", subject="Copy", body="This is  test email 1"))
+    session.commit()
+    session.close()
+    encode_spy = mocker.spy(SentenceTransformerEncoder, "encode_tokenized")
+
+    embed_emails(sample_db_with_emails, temp_embeddings_path, MODEL_NAME, backend="numpy")
+    # The copy of email 1 reuses its embedding
+    assert len(encode_spy.call_args.args[1]["input_ids"]) == 2
+    embeddings = open_collection(temp_embeddings_path, MODEL_NAME, backend="numpy").get(
+        ids=["1", "3"], include=["embeddings"]
+    )["embeddings"]
+    np.testing.assert_array_equal(embeddings[0], embeddings[1])
+
+    encode_spy.reset_mock()
+    embed_emails(sample_db_with_emails, temp_embeddings_path, MODEL_NAME, backend="numpy", rebuild=True)
+    encode_spy.assert_not_called()
+    assert open_collection(temp_embeddings_path, MODEL_NAME, backend="numpy").count() == 3
+    assert len(EmbeddingCache(get_embedding_cache_path(temp_embeddings_path), MODEL_NAME)) == 2
@@ -0,0 +1,34 @@
+import numpy as np
+
+from llm_email_search.encoder import EncoderPool, SentenceTransformerEncoder
+
+
+def test_encode_preserves_input_order():
+    encoder = SentenceTransformerEncoder("sentence-transformers/all-MiniLM-L6-v2")
+    texts = ["a much longer test email about a meeting " * 5, "hi", "a test email", "invoice"]
+
+    sorted_embeddings = encoder.encode(texts, batch_size=2)
+    unsorted_embeddings = encoder.encode(texts, batch_size=2, sort_by_length=False)
+    # Matches SentenceTransformer.encode, so collections stay compatible with Chroma's embedding function
+    single_embeddings = encoder.model.encode(texts, convert_to_numpy=True)
+
+    assert sorted_embeddings.shape == (4, encoder.dimension)
+    np.testing.assert_allclose(sorted_embeddings, single_embeddings, atol=1e-5)
+    np.testing.assert_allclose(unsorted_embeddings, single_embeddings, atol=1e-5)
+
+
+def test_tokenize_truncates():
+    encoder = SentenceTransformerEncoder("sentence-transformers/all-MiniLM-L6-v2")
+    short_ids, long_ids = encoder.tokenize(["test", "test " * 1000])["input_ids"]
+    assert len(short_ids) < len(long_ids) == encoder.model.max_seq_length
+
+
+def test_encoder_pool_matches_single_process():
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    texts = [f"test email {i} " * (i % 7 + 1) for i in range(20)]
+
+    with EncoderPool(model_name, workers=2, threads_per_worker=1) as pool:
+        pool_embeddings = pool.encode(texts, batch_size=4)
+
+    expected = SentenceTransformerEncoder(model_name).encode(texts)
+    np.testing.assert_allclose(pool_embeddings, expected, atol=1e-5)
@@ -0,0 +1,75 @@
+import mailbox
+from email.message import EmailMessage
+
+import pytest
+from sqlalchemy import text
+
+from llm_email_search.extract_archive_to_sqlite import extract_archive_to_sqlite, find_mbox_shards
+from llm_email_search.models import init_database
+
+
+def make_messages():
+    plain = EmailMessage()
+    plain["From"] = "Alice <alice@example.com>"
+    plain["Subject"] = "=?utf-8?q?Caf=C3=A9_plans?="
+    plain["Date"] = "Thu, 14 Mar 2024 10:00:00 +0000"
+    plain.set_content("Lunch on Friday?\nFrom now on we meet at noon.\n")
+
+    with_attachment = EmailMessage()
+    with_attachment["From"] = "bob@example.com"
+    with_attachment["Subject"] = "Invoice"
+    with_attachment.set_content("Plain invoice text", charset="iso-8859-1")
+    with_attachment.add_alternative("<p>HTML invoice text</p>", subtype="html")
+    with_attachment.add_attachment(b"%PDF", maintype="application", subtype="pdf", filename="invoice.pdf")
+    return [plain, with_attachment]
+
+
+def read_emails(database):
+    with init_database(database).connect() as connection:
+        return connection.execute(
+            text("SELECT sender, subject, body, timestamp, attachment_types FROM emails ORDER BY timestamp")
+        ).all()
+
+
+EXPECTED_EMAILS = [
+    ("bob@example.com", "Invoice", "Plain invoice text\n", None, ".pdf"),
+    (
+        "Alice <alice@example.com>",
+        "Café plans",
+        "Lunch on Friday?\nFrom now on we meet at noon.\n",
+        1710410400000,
+        "",
+    ),
+]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_import_mbox_in_shards(tmp_path, temp_db_path, workers):
+    path = str(tmp_path / "archive.mbox")
+    archive = mailbox.mbox(path)
+    for message in make_messages() * 3:
+        archive.add(message)
+    archive.close()
+    # Shards start at message boundaries, whatever their requested size
+    shards = find_mbox_shards(path, shard_bytes=10)
+    assert len(shards) == 6
+    with open(path, "rb") as file:
+        data = file.read()
+    assert all(data[start : start + 5] == b"From " for start, _ in shards)
+
+    # Duplicates in the archive are skipped by their content hash
+    assert extract_archive_to_sqlite(path, temp_db_path, workers=workers, shard_bytes=10, batch_size=1) == 2
+    assert read_emails(temp_db_path) == EXPECTED_EMAILS
+
+
+def test_import_maildir(tmp_path, temp_db_path):
+    archive = mailbox.Maildir(str(tmp_path / "Maildir"))
+    for message in make_messages():
+        archive.add(message)
+
+    assert extract_archive_to_sqlite(str(tmp_path / "Maildir"), temp_db_path, workers=1) == 2
+    assert read_emails(temp_db_path) == EXPECTED_EMAILS
+    with init_database(temp_db_path).connect() as connection:
+        assert connection.execute(text("SELECT DISTINCT source FROM emails")).scalars().all() == ["archive"]
+    # Importing again inserts nothing
+    assert extract_archive_to_sqlite(str(tmp_path / "Maildir"), temp_db_path, workers=1) == 0
@@ -1,8 +1,29 @@
+import base64
+import sqlite3
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+import pytest
+from googleapiclient.errors import HttpError
+
 from llm_email_search.extract_emails_to_sqlite import (
+    CURSOR_KEYS,
+    CURSOR_PROCESSED,
+    CURSOR_START_HISTORY_ID,
+    HISTORY_ID,
+    Email,
+    SyncState,
+    compute_content_hash,
     get_header,
+    extract_emails,
     extract_message_body,
     extract_attachment_types,
+    extract_message_data,
+    init_database,
 )
+from llm_email_search.gmail_fetch import QuotaLimiter
+from llm_email_search.models import ARCHIVE_SOURCE
+from tests.conftest import FakeGmailService, make_mock_message
 
 def test_get_header():
     headers = [
@@ -19,6 +40,33 @@ def test_extract_message_body(mock_gmail_message):
     assert body == "This is a test email"
 
 
+def encode_part(mime_type, text, filename=""):
+    data = base64.urlsafe_b64encode(text.encode()).decode()
+    return {"mimeType": mime_type, "filename": filename, "body": {"data": data}}
+
+
+def test_extract_message_body_walks_nested_parts():
+    payload = {
+        "mimeType": "multipart/mixed",
+        "body": {"size": 0},
+        "parts": [
+            {
+                "mimeType": "multipart/alternative",
+                "body": {"size": 0},
+                "parts": [
+                    encode_part("text/html", "<p>Hello <b>there</b></p>"),
+                    encode_part("text/plain", "Hello there"),
+                ],
+            },
+            encode_part("text/plain", "attached notes", filename="notes.txt"),
+        ],
+    }
+    assert extract_message_body(payload) == "Hello there"
+    # HTML is used when there is no plain text part
+    payload["parts"][0]["parts"].pop()
+    assert extract_message_body(payload) == "<p>Hello <b>there</b></p>"
+
+
 def test_extract_attachment_types():
     parts = [
         {"filename": "document.pdf"},
@@ -29,9 +77,244 @@ def test_extract_attachment_types():
     assert ".pdf,.jpg,unknown" == types
 
 
-# TODO: Add test for extract_message_data
+def test_extract_message_data(fake_gmail_service):
+    data = extract_message_data(fake_gmail_service, "msg00001")
+    assert data == {
+        "sender": "sender@example.com",
+        "subject": "Test Subject",
+        "body": "This is test email 1",
+        "clean_body": "This is test email 1",
+        "attachment_types": ".txt",
+        "timestamp": 1647123456790,
+        "gmail_id": "msg00001",
+        "thread_id": None,
+        "history_id": None,
+    }
+
+
+def test_extract_emails(fake_gmail_service, temp_db_path):
+    extract_emails(database=temp_db_path, workers=2, batch_size=2, service=fake_gmail_service)
+    # A second run must not duplicate any emails
+    extract_emails(database=temp_db_path, workers=2, batch_size=2, service=fake_gmail_service)
+
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    emails = session.query(Email).order_by(Email.id).all()
+    assert [email.body for email in emails] == [f"This is test email {i}" for i in range(5)]
+    session.close()
+
+
+def test_extract_emails_walks_all_pages(temp_db_path):
+    service = FakeGmailService([make_mock_message(i) for i in range(1200)])
+    extract_emails(
+        max_emails=None,
+        database=temp_db_path,
+        chunk_size=200,
+        service=service,
+        quota=QuotaLimiter(units_per_second=1e6),
+    )
+
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    assert session.query(Email).count() == 1200
+    # The resume cursor is cleared once the sync completes
+    assert session.query(SyncState).filter(SyncState.key.in_(CURSOR_KEYS)).count() == 0
+    session.close()
+
+
+def test_extract_emails_resumes_from_cursor(temp_db_path):
+    # The 7th message fails with a non-retryable error, aborting the sync mid-way
+    service = FakeGmailService(
+        [make_mock_message(i) for i in range(10)], failures={"msg00006": [403]}
+    )
+    with pytest.raises(HttpError):
+        extract_emails(max_emails=8, database=temp_db_path, chunk_size=3, service=service)
+
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    assert session.query(Email).count() == 6
+    assert session.get(SyncState, CURSOR_PROCESSED).value == "6"
+    session.close()
+
+    service.get_calls.clear()
+    extract_emails(max_emails=8, database=temp_db_path, chunk_size=3, service=service)
+
+    # Only the messages after the cursor are downloaded again
+    assert [call[0] for call in service.get_calls] == ["msg00006", "msg00007"]
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    assert session.query(Email).count() == 8
+    session.close()
+
+
+def test_extract_emails_continues_past_max_emails(temp_db_path):
+    service = FakeGmailService([make_mock_message(i) for i in range(10)])
+    for run in range(3):
+        service.get_calls.clear()
+        extract_emails(max_emails=4, database=temp_db_path, chunk_size=3, service=service)
+
+        # Each run continues the listing where the previous one stopped
+        expected_ids = [f"msg{i:05d}" for i in range(4 * run, min(4 * run + 4, 10))]
+        assert [call[0] for call in service.get_calls] == expected_ids
+        session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+        # The history id is only saved once the whole mailbox has been listed
+        assert (session.get(SyncState, HISTORY_ID) is None) == (run < 2)
+        assert (session.query(SyncState).filter(SyncState.key.in_(CURSOR_KEYS)).count() == 0) == (run == 2)
+        session.close()
+
+
+def test_extract_emails_past_max_emails_downloads_new_mail(temp_db_path):
+    service = FakeGmailService([make_mock_message(i) for i in range(10)])
+    extract_emails(max_emails=4, database=temp_db_path, chunk_size=3, service=service)
+    service.add_message(make_mock_message(10))
+    service.delete_message("msg00001")
+    service.get_calls.clear()
+
+    # Mail that arrived since the listing started is downloaded before the listing continues
+    extract_emails(max_emails=4, database=temp_db_path, chunk_size=3, service=service)
+    assert service.get_calls[0] == ("msg00010", "full")
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    gmail_ids = {gmail_id for (gmail_id,) in session.query(Email.gmail_id)}
+    assert "msg00010" in gmail_ids
+    assert "msg00001" not in gmail_ids
+    assert session.get(SyncState, CURSOR_START_HISTORY_ID).value == "102"
+
+    # An expired history id starts the listing over from the newest message
+    session.get(SyncState, CURSOR_START_HISTORY_ID).value = "1"
+    session.commit()
+    session.close()
+    service.add_message(make_mock_message(11))
+    extract_emails(max_emails=None, database=temp_db_path, chunk_size=3, service=service)
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    gmail_ids = {gmail_id for (gmail_id,) in session.query(Email.gmail_id)}
+    assert gmail_ids == set(service.messages_by_id)
+    assert session.get(SyncState, HISTORY_ID).value == "103"
+    assert session.query(SyncState).filter(SyncState.key.in_(CURSOR_KEYS)).count() == 0
+    session.close()
+
+
+def test_extract_emails_incremental(fake_gmail_service, temp_db_path):
+    extract_emails(database=temp_db_path, service=fake_gmail_service)
+    fake_gmail_service.add_message(make_mock_message(5))
+    fake_gmail_service.delete_message("msg00002")
+    fake_gmail_service.get_calls.clear()
+
+    extract_emails(database=temp_db_path, incremental=True, service=fake_gmail_service)
+
+    # Only the added message is downloaded
+    assert fake_gmail_service.get_calls == [("msg00005", "full")]
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    gmail_ids = {gmail_id for (gmail_id,) in session.query(Email.gmail_id)}
+    assert gmail_ids == {"msg00000", "msg00001", "msg00003", "msg00004", "msg00005"}
+    assert session.get(SyncState, HISTORY_ID).value == "102"
+    session.close()
+
+
+def test_extract_emails_incremental_falls_back_to_full_sync(fake_gmail_service, temp_db_path):
+    # Without a completed sync there is no history id to start from
+    extract_emails(database=temp_db_path, incremental=True, service=fake_gmail_service)
+
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    assert session.query(Email).count() == 5
+    # An expired history id also triggers a full sync
+    session.get(SyncState, HISTORY_ID).value = "1"
+    session.commit()
+    session.close()
+
+    extract_emails(database=temp_db_path, incremental=True, service=fake_gmail_service)
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    assert session.get(SyncState, HISTORY_ID).value == "100"
+    session.close()
+
+
+def test_compute_content_hash():
+    email_data = {"sender": "a@example.com", "subject": "Hi", "body": "Hello", "timestamp": 1}
+    assert compute_content_hash(email_data) == compute_content_hash(dict(email_data))
+    assert compute_content_hash(email_data) != compute_content_hash({**email_data, "body": "Hello!"})
+    # Field boundaries are part of the hash
+    assert compute_content_hash({"sender": "ab", "subject": "c"}) != compute_content_hash(
+        {"sender": "a", "subject": "bc"}
+    )
+
+
+def test_init_database_upgrades_existing_schema(temp_db_path):
+    connection = sqlite3.connect(temp_db_path)
+    connection.execute(
+        "CREATE TABLE emails (id INTEGER PRIMARY KEY, sender VARCHAR, subject VARCHAR, "
+        "body VARCHAR NOT NULL, timestamp INTEGER, attachment_types VARCHAR)"
+    )
+    connection.executemany(
+        "INSERT INTO emails (sender, body, timestamp) VALUES (?, ?, ?)",
+        [("a@example.com", "old email", 1), ("b@example.com", "other", 2), ("a@example.com", "old email", 1)],
+    )
+    connection.commit()
+    connection.close()
+
+    engine = init_database(temp_db_path)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("emails")}
+    assert {"gmail_id", "thread_id", "history_id", "content_hash", "clean_body"} <= columns
+    session = sessionmaker(bind=engine)()
+    emails = session.query(Email).order_by(Email.id).all()
+    # Duplicates are removed during the migration, keeping the oldest row
+    assert [(email.id, email.body) for email in emails] == [(1, "old email"), (2, "other")]
+    assert emails[0].content_hash == compute_content_hash(
+        {"sender": "a@example.com", "body": "old email", "timestamp": 1}
+    )
+    assert [email.clean_body for email in emails] == ["old email", "other"]
+    session.close()
+
+
+def test_extract_emails_skips_stored_messages(fake_gmail_service, temp_db_path):
+    extract_emails(database=temp_db_path, service=fake_gmail_service)
+    fake_gmail_service.add_message(make_mock_message(5))
+    fake_gmail_service.get_calls.clear()
+
+    extract_emails(database=temp_db_path, service=fake_gmail_service)
+
+    assert fake_gmail_service.get_calls == [("msg00005", "full")]
+
+
+def test_extract_emails_adopts_legacy_emails(fake_gmail_service, temp_db_path):
+    session = sessionmaker(bind=init_database(temp_db_path))()
+    # Stored before Gmail ids were recorded
+    session.add(
+        Email(
+            sender="sender@example.com",
+            subject="Test Subject",
+            body="This is test email 3",
+            timestamp=1647123456789 + 3,
+            attachment_types=".txt",
+        )
+    )
+    session.commit()
+    session.close()
+
+    extract_emails(database=temp_db_path, service=fake_gmail_service)
+
+    full_downloads = {message_id for message_id, format in fake_gmail_service.get_calls if format == "full"}
+    assert full_downloads == {"msg00000", "msg00001", "msg00002", "msg00004"}
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    assert session.query(Email).count() == 5
+    assert session.query(Email).filter(Email.gmail_id == "msg00003").one().id == 1
+    session.close()
+
+
+def test_extract_emails_does_not_adopt_imported_emails(fake_gmail_service, temp_db_path):
+    session = sessionmaker(bind=init_database(temp_db_path))()
+    # Imported from an mbox export of the same mailbox
+    session.add(
+        Email(
+            sender="sender@example.com",
+            subject="Test Subject",
+            body="This is test email 3",
+            timestamp=1647123456789 + 3,
+            attachment_types=".txt",
+            source=ARCHIVE_SOURCE,
+        )
+    )
+    session.commit()
+    session.close()
+
+    extract_emails(database=temp_db_path, service=fake_gmail_service)
 
-# TODO: Add test for extract_emails
-# Even with MagicMock, this is a bit tricky to test
-# because it interacts with the Gmail API while having
-# a SQLAlchemy session open to ensure uniqueness of the database
\ No newline at end of file
+    assert {format for _, format in fake_gmail_service.get_calls} == {"full"}
+    session = sessionmaker(bind=create_engine(f"sqlite:///{temp_db_path}"))()
+    assert session.query(Email).count() == 6
+    session.close()
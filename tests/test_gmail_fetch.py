@@ -0,0 +1,98 @@
+import pytest
+from googleapiclient.errors import HttpError
+
+from llm_email_search.gmail_fetch import MessageFetcher, QuotaLimiter, list_history_changes
+from tests.conftest import FakeGmailService, make_mock_message
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 50])
+def test_fetch_preserves_order(batch_size):
+    service = FakeGmailService([make_mock_message(i) for i in range(7)])
+    fetcher = MessageFetcher(service=service, workers=3, batch_size=batch_size)
+    ids = [f"msg{i:05d}" for i in reversed(range(7))]
+
+    messages = list(fetcher.fetch(ids))
+
+    assert [message["id"] for message in messages] == ids
+
+
+def test_fetch_retries_throttled_requests():
+    service = FakeGmailService(
+        [make_mock_message(i) for i in range(3)],
+        failures={"msg00001": [429, 503]},
+    )
+    quota = QuotaLimiter()
+    fetcher = MessageFetcher(
+        service=service, batch_size=3, initial_backoff=0, quota=quota
+    )
+
+    messages = list(fetcher.fetch(["msg00000", "msg00001", "msg00002"]))
+
+    assert [message["id"] for message in messages] == ["msg00000", "msg00001", "msg00002"]
+    # Only the throttled message is requested again
+    assert [call[0] for call in service.get_calls].count("msg00001") == 3
+    assert [call[0] for call in service.get_calls].count("msg00000") == 1
+    assert quota.units_per_second < quota.max_units_per_second
+
+
+def test_fetch_skips_missing_messages():
+    service = FakeGmailService([make_mock_message(0)])
+    fetcher = MessageFetcher(service=service, batch_size=2)
+
+    messages = list(fetcher.fetch(["msg00000", "deleted"]))
+
+    assert [message["id"] for message in messages] == ["msg00000"]
+
+
+def test_fetch_raises_after_max_retries():
+    service = FakeGmailService(
+        [make_mock_message(0)], failures={"msg00000": [500] * 3}
+    )
+    fetcher = MessageFetcher(
+        service=service, batch_size=1, max_retries=2, initial_backoff=0
+    )
+
+    with pytest.raises(HttpError):
+        list(fetcher.fetch(["msg00000"]))
+
+
+def test_fetch_uses_service_factory_per_thread():
+    services = []
+
+    def service_factory():
+        services.append(FakeGmailService([make_mock_message(i) for i in range(4)]))
+        return services[-1]
+
+    fetcher = MessageFetcher(service_factory=service_factory, workers=2, batch_size=1)
+    messages = list(fetcher.fetch([f"msg{i:05d}" for i in range(4)]))
+
+    assert len(messages) == 4
+    assert 1 <= len(services) <= 2
+
+
+def test_list_history_changes_follows_spam_and_trash_labels():
+    service = FakeGmailService([make_mock_message(i) for i in range(3)])
+    service.history_records = [
+        {"id": "101", "labelsAdded": [{"message": {"id": "msg00000"}, "labelIds": ["TRASH"]}]},
+        {"id": "102", "labelsAdded": [{"message": {"id": "msg00001"}, "labelIds": ["SPAM"]}]},
+        # Taken out of the trash again
+        {
+            "id": "103",
+            "labelsRemoved": [{"message": {"id": "msg00000", "labelIds": ["INBOX"]}, "labelIds": ["TRASH"]}],
+        },
+        # Still in spam after leaving the trash
+        {
+            "id": "104",
+            "labelsRemoved": [
+                {"message": {"id": "msg00002", "labelIds": ["SPAM"]}, "labelIds": ["TRASH"]},
+                {"message": {"id": "msg00001", "labelIds": ["INBOX"]}, "labelIds": ["IMPORTANT"]},
+            ],
+        },
+    ]
+    service.history_id = 104
+
+    added_ids, deleted_ids, history_id = list_history_changes(service, "100")
+
+    assert added_ids == ["msg00000"]
+    assert deleted_ids == ["msg00001"]
+    assert history_id == "104"
@@ -0,0 +1,78 @@
+from sqlalchemy.orm import sessionmaker
+
+from llm_email_search.embed_emails import embed_emails
+from llm_email_search.hybrid_search import LexicalIndex, reciprocal_rank_fusion, to_fts_query
+from llm_email_search.models import Email, init_database
+from llm_email_search.run_query import run_query
+
+
+def test_to_fts_query_quotes_words():
+    assert to_fts_query('order #A-1234 "urgent"') == '"order" OR "A" OR "1234" OR "urgent"'
+    assert to_fts_query("?!") is None
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=1)
+    assert [item_id for item_id, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == 1 / 2 + 1 / 3
+
+
+def test_fts_index_follows_changes(sample_db_with_emails):
+    # The index is built for emails stored before it existed
+    index = LexicalIndex(sample_db_with_emails)
+    assert [email_id for email_id, _ in index.search("test2")] == ["2"]
+    assert [email_id for email_id, _ in index.search("email 1")][0] == "1"
+
+    session = sessionmaker(bind=init_database(sample_db_with_emails))()
+    session.add(Email(sender="orders@example.com", subject="Order 998877", body="Your order shipped"))
+    session.get(Email, 1).body = "Invoice for order 998877"
+    session.delete(session.get(Email, 2))
+    session.commit()
+    session.close()
+
+    assert sorted(email_id for email_id, _ in index.search("998877")) == ["1", "3"]
+    assert index.search("test2") == []
+    assert index.search("invoice")[0][0] == "1"
+
+
+def test_hybrid_search_finds_exact_terms(sample_db_with_emails, temp_embeddings_path):
+    session = sessionmaker(bind=init_database(sample_db_with_emails))()
+    session.add(Email(sender="shop@example.com", subject="Shipping", body="Tracking number ZX81QL"))
+    session.commit()
+    session.close()
+    embed_emails(sample_db_with_emails, temp_embeddings_path, "sentence-transformers/all-MiniLM-L6-v2")
+
+    results = run_query(
+        "ZX81QL",
+        num_results=1,
+        embeddings_path=temp_embeddings_path,
+        hybrid=True,
+        sql_path=sample_db_with_emails,
+    )
+
+    assert results["ids"] == [["3"]]
+    assert results["documents"] == [["Tracking number ZX81QL"]]
+    assert set(results["timings"]) == {"lexical_ms", "vector_ms", "fusion_ms", "total_ms"}
+
+    filtered = run_query(
+        "ZX81QL",
+        num_results=3,
+        embeddings_path=temp_embeddings_path,
+        sender="test1@example.com",
+        hybrid=True,
+        sql_path=sample_db_with_emails,
+    )
+    assert filtered["ids"] == [["1"]]
+
+    # Bodies are left out entirely when they are not asked for
+    without_documents = run_query(
+        "ZX81QL",
+        num_results=1,
+        embeddings_path=temp_embeddings_path,
+        hybrid=True,
+        sql_path=sample_db_with_emails,
+        documents="none",
+    )
+    assert without_documents["ids"] == [["3"]]
+    assert "documents" not in without_documents
+    assert without_documents["metadatas"][0][0]["sender"] == "shop@example.com"
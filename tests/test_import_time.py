@@ -0,0 +1,10 @@
+import pytest
+
+from benchmarks.bench_import_time import CLI_MODULES, profile_import
+
+
+@pytest.mark.parametrize("module", CLI_MODULES)
+def test_cli_modules_do_not_import_heavy_dependencies(module):
+    profile = profile_import(module)
+    assert module in profile.imported
+    assert profile.heavy_imports() == []
@@ -0,0 +1,126 @@
+import numpy as np
+
+from llm_email_search.embed_emails import embed_emails
+from llm_email_search.ivf_pq import IndexedCollection, IVFPQIndex, exact_rerank, get_default_nlist, kmeans
+from llm_email_search.numpy_store import NumpyCollection
+from llm_email_search.run_query import run_query
+
+
+def clustered_embeddings(count, dimensions=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(20, dimensions))
+    embeddings = centres[rng.integers(0, 20, count)] + rng.normal(scale=0.3, size=(count, dimensions))
+    return embeddings.astype(np.float32)
+
+
+def search(index, vectors, queries, k, nprobe):
+    found = []
+    for query, (ids, _) in zip(queries, index.search(queries, shortlist=50, nprobe=nprobe)):
+        rows = [int(entry_id) for entry_id in ids]
+        found.append(exact_rerank(query, ids, vectors[rows], k)[0])
+    return found
+
+
+def recall(found, vectors, queries, k):
+    distances = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2)
+    expected = np.argsort(distances, axis=1)[:, :k]
+    return np.mean([len(set(map(int, ids)) & set(row)) / k for ids, row in zip(found, expected)])
+
+
+def test_kmeans_finds_clusters():
+    points = np.concatenate([np.zeros((50, 2)), np.ones((50, 2)) * 10]).astype(np.float32)
+    centroids = kmeans(points, 2)
+    assert sorted(centroids[:, 0].round().tolist()) == [0.0, 10.0]
+
+
+def test_search_recall_grows_with_nprobe(tmp_path):
+    vectors = clustered_embeddings(2000)
+    queries = clustered_embeddings(50, seed=1)
+    index = IVFPQIndex.train(vectors, nlist=20, num_subquantizers=8)
+    index.add([str(i) for i in range(len(vectors))], vectors)
+    assert index.codes.shape == (2000, 8)
+
+    low = recall(search(index, vectors, queries, 10, nprobe=1), vectors, queries, 10)
+    high = recall(search(index, vectors, queries, 10, nprobe=20), vectors, queries, 10)
+    assert high >= 0.9
+    assert high >= low
+
+    index.save(str(tmp_path / "index"))
+    loaded = IVFPQIndex.load(str(tmp_path / "index"))
+    assert search(loaded, vectors, queries, 10, nprobe=4) == search(index, vectors, queries, 10, nprobe=4)
+
+
+def test_add_and_remove_without_retraining():
+    vectors = clustered_embeddings(500)
+    index = IVFPQIndex.train(vectors[:400], nlist=10, num_subquantizers=4)
+    index.add([str(i) for i in range(400)], vectors[:400])
+    centroids = index.coarse_centroids.copy()
+
+    index.add([str(i) for i in range(400, 500)], vectors[400:])
+    assert len(index) == 500
+    assert np.array_equal(index.coarse_centroids, centroids)
+    assert search(index, vectors, vectors[450:451], 1, nprobe=10) == [["450"]]
+
+    assert index.remove(["450", "missing"]) == 1
+    assert "450" not in search(index, vectors, vectors[450:451], 5, nprobe=10)[0]
+
+
+def test_embed_and_search_with_ivf_pq_backend(sample_db_with_emails, temp_embeddings_path):
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name, backend="ivfpq")
+
+    indexed = run_query("test email 2", embeddings_path=temp_embeddings_path, backend="ivfpq")
+    exact = run_query("test email 2", embeddings_path=temp_embeddings_path, backend="numpy")
+    assert indexed["ids"] == exact["ids"]
+    assert indexed["documents"] == exact["documents"]
+
+
+def test_indexed_collection_refreshes_changed_entries(tmp_path):
+    vectors = clustered_embeddings(600)
+    metadatas = [{"parity": i % 2} for i in range(600)]
+    store = NumpyCollection(str(tmp_path / "store"), "emails", "model", "float32")
+    collection = IndexedCollection(store, str(tmp_path / "index"), "emails", nprobe=4)
+    collection.add(ids=[str(i) for i in range(500)], embeddings=vectors[:500], metadatas=metadatas[:500])
+    collection.save()
+
+    # Email 7 is modified: deleted, then added again with another vector
+    collection.delete(ids=["7"])
+    collection.add(ids=["7"], embeddings=vectors[550:551], metadatas=[{"parity": 1}])
+    collection.add(ids=[str(i) for i in range(500, 520)], embeddings=vectors[500:520], metadatas=metadatas[500:520])
+    collection.save()
+    reopened = IndexedCollection(
+        NumpyCollection(str(tmp_path / "store"), "emails", "model"), str(tmp_path / "index"), "emails", nprobe=1
+    )
+    assert len(reopened.index) == 520
+    assert reopened.index.search(vectors[550:551], shortlist=1, nprobe=1)[0][0] == ["7"]
+    assert reopened.query(vectors[550:551], n_results=1)["ids"] == [["7"]]
+    assert "7" not in reopened.query(vectors[7:8], n_results=5)["ids"][0]
+
+    # Filters apply to the candidates of the index
+    filtered = reopened.query(vectors[:5], n_results=5, where={"parity": 1})
+    assert all(int(entry_id) % 2 == 1 or entry_id == "7" for ids in filtered["ids"] for entry_id in ids)
+    assert [len(ids) for ids in filtered["ids"]] == [5] * 5
+    exact = reopened.store.query(vectors[:5], n_results=5, where={"parity": 1})
+    assert np.mean([len(set(a) & set(b)) / 5 for a, b in zip(filtered["ids"], exact["ids"])]) >= 0.8
+
+
+def test_indexed_collection_retrains_when_the_store_outgrows_the_index(tmp_path):
+    vectors = clustered_embeddings(600)
+    store = NumpyCollection(str(tmp_path / "store"), "emails", "model", "float32")
+    collection = IndexedCollection(store, str(tmp_path / "index"), "emails")
+    collection.add(ids=[str(i) for i in range(20)], embeddings=vectors[:20])
+    collection.save()
+    assert collection.index.nlist == get_default_nlist(20)
+
+    # A few more vectors are added to the trained lists
+    collection.add(ids=[str(i) for i in range(20, 40)], embeddings=vectors[20:40])
+    collection.save()
+    assert collection.index.nlist == get_default_nlist(20)
+    assert len(collection.index) == 40
+
+    collection.add(ids=[str(i) for i in range(40, 600)], embeddings=vectors[40:])
+    collection.save()
+    reopened = IVFPQIndex.load(str(tmp_path / "index"))
+    assert reopened.nlist == get_default_nlist(600)
+    assert reopened.trained_count == 600
+    assert len(reopened) == 600
@@ -0,0 +1,160 @@
+import numpy as np
+import pytest
+
+from llm_email_search.embed_emails import embed_emails
+from llm_email_search.numpy_store import NumpyCollection, dequantize, matches_where, quantize
+from llm_email_search.run_query import run_query
+from llm_email_search.vector_store import NUMPY_DTYPES, build_metadata, build_where
+
+
+def random_embeddings(count, dimensions=32, seed=0):
+    embeddings = np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def test_quantize_int8_round_trip():
+    embeddings = random_embeddings(100)
+    codes, scales = quantize(embeddings, "int8")
+    assert codes.dtype == np.int8
+    assert np.abs(dequantize(codes, scales) - embeddings).max() < np.abs(embeddings).max() / 127
+
+
+def test_matches_where():
+    metadata = {"sender_address": "a@example.com", "timestamp": 5, "attachment_pdf": True}
+    assert matches_where(metadata, {"sender_address": "a@example.com"})
+    assert matches_where(metadata, {"$and": [{"timestamp": {"$gte": 5}}, {"timestamp": {"$lt": 6}}]})
+    assert matches_where(metadata, {"$or": [{"attachment_jpg": True}, {"attachment_pdf": True}]})
+    assert matches_where(metadata, {"sender_address": {"$in": ["a@example.com", "b@example.com"]}})
+    assert not matches_where(metadata, {"timestamp": {"$gt": 5}})
+    assert not matches_where(metadata, {"has_attachment": True})
+
+
+@pytest.mark.parametrize("dtype", NUMPY_DTYPES)
+def test_query_matches_exact_search(tmp_path, dtype):
+    embeddings = random_embeddings(1000)
+    queries = random_embeddings(20, seed=1)
+    collection = NumpyCollection(str(tmp_path / "store"), "emails", "model", dtype)
+    collection.add(
+        ids=[str(i) for i in range(1000)],
+        embeddings=embeddings,
+        documents=[f"document {i}" for i in range(1000)],
+        metadatas=[{"parity": i % 2} for i in range(1000)],
+    )
+    collection.save()
+
+    # Reopening memory-maps the saved files
+    collection = NumpyCollection(str(tmp_path / "store"), "emails", "model")
+    assert collection.dtype == dtype
+    results = collection.query(queries, n_results=10)
+    distances = ((queries[:, None, :] - embeddings[None, :, :]) ** 2).sum(axis=2)
+    expected = np.argsort(distances, axis=1)[:, :10]
+    recall = np.mean(
+        [len(set(map(int, ids)) & set(row)) / 10 for ids, row in zip(results["ids"], expected)]
+    )
+    assert recall >= (1.0 if dtype == "float32" else 0.9)
+    first = int(results["ids"][0][0])
+    assert results["documents"][0][0] == f"document {first}"
+    assert results["distances"][0][0] == pytest.approx(distances[0, first], abs=0.02)
+
+    filtered = collection.query(queries, n_results=5, where={"parity": 1})
+    assert all(int(entry_id) % 2 == 1 for ids in filtered["ids"] for entry_id in ids)
+
+
+def test_add_delete_and_get(tmp_path):
+    collection = NumpyCollection(str(tmp_path / "store"), "emails", "model", "int8")
+    collection.add(ids=["1", "2", "3"], embeddings=random_embeddings(3), metadatas=[{"n": i} for i in range(3)])
+    with pytest.raises(ValueError):
+        collection.add(ids=["2"], embeddings=random_embeddings(1))
+    collection.delete(ids=["2", "missing"])
+    collection.save()
+
+    collection = NumpyCollection(str(tmp_path / "store"), "emails", "model")
+    assert collection.count() == 2
+    assert collection.get(include=["metadatas"], limit=1, offset=1)["metadatas"] == [{"n": 2}]
+    assert collection.get(ids=["3", "2"], include=[])["ids"] == ["3"]
+    assert collection.get(where={"n": 0}, include=["embeddings"])["embeddings"].shape == (1, 32)
+
+
+def test_deleted_rows_are_hidden_until_compacted(tmp_path):
+    embeddings = random_embeddings(10)
+    collection = NumpyCollection(str(tmp_path / "store"), "emails", "model")
+    collection.add(ids=[str(i) for i in range(10)], embeddings=embeddings, metadatas=[{"n": i} for i in range(10)])
+    collection.delete(ids=["0", "4"])
+    collection.delete(ids=["4"])
+    assert collection.count() == 8
+    assert "0" not in collection.get(include=[])["ids"]
+    assert collection.get(where={"n": {"$lt": 5}}, include=[])["ids"] == ["1", "2", "3"]
+    assert collection.query(embeddings[4:5], n_results=1)["ids"] != [["4"]]
+    assert len(collection.query(embeddings[:1], n_results=20)["ids"][0]) == 8
+    # Adding a deleted id again stores it once
+    collection.add(ids=["4"], embeddings=embeddings[:1], metadatas=[{"n": 40}])
+    assert collection.get(ids=["4"], include=["metadatas"])["metadatas"] == [{"n": 40}]
+    collection.save()
+
+    collection = NumpyCollection(str(tmp_path / "store"), "emails", "model")
+    assert collection.count() == 9
+    assert len(np.load(tmp_path / "store" / "ids.npy")) == 9
+    assert collection.query(embeddings[:1], n_results=1)["ids"] == [["4"]]
+
+
+def test_batched_adds_and_column_filters(tmp_path):
+    embeddings = random_embeddings(300)
+    metadatas = [
+        build_metadata(
+            f"user{i % 7}@example.com" if i % 5 else None, None, i if i % 4 else None, ".pdf" if i % 3 == 0 else ""
+        )
+        for i in range(300)
+    ]
+    collection = NumpyCollection(str(tmp_path / "store"), "emails", "model", "int8")
+    for start in range(0, 300, 7):
+        collection.add(
+            ids=[f"email-{i}" for i in range(start, min(start + 7, 300))],
+            embeddings=embeddings[start : start + 7],
+            metadatas=metadatas[start : start + 7],
+        )
+    collection.delete(ids=["email-3", "email-150"])
+    collection.add(ids=["email-3"], embeddings=embeddings[3:4], metadatas=metadatas[3:4])
+    assert collection.added_ids == {f"email-{i}" for i in range(300)}
+    assert collection.get(ids=["email-299", "email-3"], include=["metadatas"])["metadatas"] == [
+        metadatas[299],
+        metadatas[3],
+    ]
+    collection.save()
+
+    filters = [
+        build_where(sender="User3@example.com"),
+        build_where(sender=["user1@example.com", "user2@example.com"], after=100, before=250),
+        build_where(has_attachment=True),
+        build_where(has_attachment="pdf", after=10),
+        {"$or": [{"timestamp": {"$lte": 20}}, {"sender_address": {"$nin": ["user0@example.com"]}}]},
+    ]
+    expected = [
+        {f"email-{i}" for i in range(300) if i != 150 and matches_where(metadatas[i], where)} for where in filters
+    ]
+    reopened = NumpyCollection(str(tmp_path / "store"), "emails", "model")
+    for where, ids in zip(filters, expected):
+        assert set(reopened.get(where=where, include=[])["ids"]) == ids
+    # Stores saved before the columns existed build them from the metadata
+    for path in (tmp_path / "store").glob("*.present.npy"):
+        path.unlink()
+    reopened = NumpyCollection(str(tmp_path / "store"), "emails", "model")
+    assert set(reopened.get(where=filters[1], include=[])["ids"]) == expected[1]
+
+
+def test_embed_and_search_with_numpy_backend(sample_db_with_emails, temp_embeddings_path):
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name)
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name, backend="numpy", dtype="int8")
+    # Embedding again finds nothing to do
+    stats = embed_emails(sample_db_with_emails, temp_embeddings_path, model_name, backend="numpy")
+    assert stats[0].items == 0
+
+    from_chroma = run_query("test email 2", embeddings_path=temp_embeddings_path)
+    from_numpy = run_query("test email 2", embeddings_path=temp_embeddings_path, backend="numpy")
+    assert from_numpy["ids"] == from_chroma["ids"]
+    assert from_numpy["metadatas"] == from_chroma["metadatas"]
+    assert from_numpy["distances"][0] == pytest.approx(from_chroma["distances"][0], rel=0.05)
+    filtered = run_query(
+        "test email", embeddings_path=temp_embeddings_path, backend="numpy", has_attachment="pdf"
+    )
+    assert filtered["ids"] == [["1"]]
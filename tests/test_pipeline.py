@@ -0,0 +1,31 @@
+import pytest
+
+from llm_email_search.pipeline import run_pipeline
+
+
+def test_run_pipeline_preserves_order():
+    results = []
+
+    stats = run_pipeline(
+        ("source", lambda: iter([[1, 2], [3], [4, 5, 6]])),
+        [("double", lambda batch: [x * 2 for x in batch]), ("collect", results.append)],
+        queue_size=1,
+    )
+
+    assert results == [[2, 4], [6], [8, 10, 12]]
+    assert [stage_stats.name for stage_stats in stats] == ["source", "double", "collect"]
+    assert all(stage_stats.items == 6 for stage_stats in stats)
+    assert all(stage_stats.max_queue_depth <= 1 for stage_stats in stats)
+
+
+def test_run_pipeline_propagates_errors():
+    def fail(batch):
+        raise ValueError("encode failed")
+
+    def endless():
+        while True:
+            yield [0]
+
+    # The source would never finish on its own, so this also checks that it is stopped
+    with pytest.raises(ValueError, match="encode failed"):
+        run_pipeline(("source", endless), [("fail", fail), ("collect", lambda batch: None)])
@@ -0,0 +1,62 @@
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from llm_email_search.embed_emails import embed_emails
+from llm_email_search.extract_emails_to_sqlite import Email
+from llm_email_search.query_cache import MISSING, LRUCache, QueryCache, normalize_query
+from llm_email_search.run_query import Searcher
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert cache.hit_rate == 0.75
+
+
+def test_query_cache_persists(tmp_path):
+    path = str(tmp_path / "query_cache.pkl")
+    cache = QueryCache(path=path)
+    cache.embeddings.put(QueryCache.embedding_key("model", "Invoices"), np.ones(3))
+    cache.save()
+
+    loaded = QueryCache(path=path)
+    np.testing.assert_array_equal(
+        loaded.embeddings.get(QueryCache.embedding_key("model", "  invoices ")), np.ones(3)
+    )
+    assert normalize_query("  Flight\n confirmation ") == "flight confirmation"
+
+
+def test_searcher_cache_is_invalidated_by_embedding(sample_db_with_emails, temp_embeddings_path, mocker):
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name)
+    searcher = Searcher(temp_embeddings_path, model_name, cache=QueryCache())
+    encode_spy = mocker.spy(searcher.encoder, "encode")
+    query_spy = mocker.spy(searcher.collection, "query")
+
+    first = searcher.search("test email", num_results=5)
+    second = searcher.search("Test  Email", num_results=5)
+    assert second == first
+    assert encode_spy.call_count == 1
+    assert query_spy.call_count == 1
+
+    session = sessionmaker(bind=create_engine(f"sqlite:///{sample_db_with_emails}"))()
+    session.add(Email(sender="test3@example.com", subject="Test Email 3", body="This is test email 3"))
+    session.commit()
+    session.close()
+    embed_emails(sample_db_with_emails, temp_embeddings_path, model_name)
+
+    # The new email is found, and the query embedding is still reused
+    third = searcher.search("test email", num_results=5)
+    assert sorted(third["ids"][0]) == ["1", "2", "3"]
+    assert encode_spy.call_count == 1
+    assert query_spy.call_count == 2
+    assert searcher.cache.stats()["result_hits"] == 1
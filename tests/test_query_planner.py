@@ -0,0 +1,111 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from llm_email_search.embed_emails import embed_emails
+from llm_email_search.query_planner import (
+    PLAN_ANN_FIRST,
+    PLAN_SEMANTIC,
+    PLAN_SQL_FIRST,
+    QueryPlanner,
+    parse_query,
+)
+from llm_email_search.run_query import Searcher, run_query
+from llm_email_search.vector_store import build_where, to_epoch_ms
+
+NOW = datetime(2022, 3, 20, 15, 30, tzinfo=timezone.utc)
+
+
+def test_parse_query_extracts_constraints():
+    parsed = parse_query("emails from John with an image attachment in the last week", now=NOW)
+    assert parsed.sender == "John"
+    assert parsed.has_attachment
+    assert "png" in parsed.attachment_types
+    assert parsed.after == to_epoch_ms(datetime(2022, 3, 13, 15, 30, tzinfo=timezone.utc))
+    assert parsed.before is None
+    assert parsed.text == ""
+
+    parsed = parse_query("budget review from jane.doe@example.com yesterday", now=NOW)
+    assert parsed.sender == "jane.doe@example.com"
+    assert (parsed.after, parsed.before) == (to_epoch_ms("2022-03-19"), to_epoch_ms("2022-03-20"))
+    assert parsed.text == "budget review"
+
+    parsed = parse_query("Invoices with a PDF in March 2021", now=NOW)
+    assert parsed.attachment_types == ["pdf"]
+    assert (parsed.after, parsed.before) == (to_epoch_ms("2021-03-01"), to_epoch_ms("2021-04-01"))
+    assert parsed.text == "Invoices"
+
+
+def test_parse_query_without_constraints():
+    parsed = parse_query("quarterly budget planning", now=NOW)
+    assert not parsed.has_constraints
+    assert parsed.text == "quarterly budget planning"
+    # "from" followed by a filler word is not a sender
+    assert parse_query("a note from the team", now=NOW).sender is None
+    # Nor is a pronoun starting a description of the sender
+    parsed = parse_query("budget from my boss", now=NOW)
+    assert parsed.sender is None
+    assert parsed.text == "budget from my boss"
+
+
+def test_build_where_with_several_values():
+    assert build_where(sender=["B@example.com", "a@example.com"]) == {
+        "sender_address": {"$in": ["a@example.com", "b@example.com"]}
+    }
+    assert build_where(has_attachment=["jpg", "png"]) == {
+        "$or": [{"attachment_jpg": True}, {"attachment_png": True}]
+    }
+    assert build_where(sender=[], has_attachment=[]) is None
+
+
+def test_planner_picks_plan_by_selectivity(sample_db_with_emails):
+    planner = QueryPlanner(sample_db_with_emails)
+    assert planner.plan("test email", now=NOW).strategy == PLAN_SEMANTIC
+
+    plan = planner.plan("test email from test2 with an image", now=NOW)
+    assert plan.strategy == PLAN_SQL_FIRST
+    assert plan.candidate_ids == ["2"]
+    assert plan.selectivity == 0.5
+
+    planner.max_sql_first_candidates = 1
+    plan = planner.plan("test email from example.com", now=NOW)
+    assert plan.strategy == PLAN_ANN_FIRST
+    # Counting stopped past the limit, so the fraction of matching emails is unknown
+    assert plan.matching_emails_is_lower_bound
+    assert plan.selectivity is None
+    assert plan.where == {
+        "sender_address": {"$in": ["test1@example.com", "test2@example.com"]}
+    }
+
+
+@pytest.mark.parametrize("max_sql_first_candidates", [2000, 0])
+def test_search_planned(sample_db_with_emails, temp_embeddings_path, max_sql_first_candidates):
+    embed_emails(sample_db_with_emails, temp_embeddings_path, "sentence-transformers/all-MiniLM-L6-v2")
+    searcher = Searcher(temp_embeddings_path, sql_path=sample_db_with_emails)
+    searcher.planner.max_sql_first_candidates = max_sql_first_candidates
+
+    results = searcher.search_planned("test email with a pdf in 2022", num_results=2, now=NOW)
+    assert results["ids"] == [["1"]]
+    assert results["metadatas"][0][0]["sender"] == "test1@example.com"
+    expected = PLAN_SQL_FIRST if max_sql_first_candidates else PLAN_ANN_FIRST
+    assert results["plan"]["strategy"] == expected
+    assert set(results["timings"]) == {"parse_ms", "estimate_ms", "search_ms", "total_ms"}
+
+    # Exact scoring returns the distances the vector index would
+    exact = searcher.search_planned("test email from test", num_results=2, now=NOW)
+    assert exact["plan"]["parsed"]["text"] == "test"
+    plain = searcher.search("test", num_results=2)
+    assert exact["ids"] == plain["ids"]
+    assert exact["distances"][0] == pytest.approx(plain["distances"][0], rel=1e-4)
+
+
+def test_run_query_planned_rejects_filters(sample_db_with_emails, temp_embeddings_path):
+    embed_emails(sample_db_with_emails, temp_embeddings_path, "sentence-transformers/all-MiniLM-L6-v2")
+    with pytest.raises(ValueError):
+        run_query(
+            "test email from test1",
+            embeddings_path=temp_embeddings_path,
+            sql_path=sample_db_with_emails,
+            planned=True,
+            sender="test1@example.com",
+        )
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import threading
+
+from llm_email_search.query_server import QueryBatcher, QueryServer, read_request
+
+
+class FakeSearcher:
+    cache = None
+
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def search_batch(self, queries, num_results, where=None, documents="full"):
+        with self.lock:
+            self.batches.append(list(queries))
+        return {
+            "ids": [[f"{query}-{i}" for i in range(num_results)] for query in queries],
+            "distances": [[float(i) for i in range(num_results)] for _ in queries],
+            "embeddings": None,
+            "included": ["distances"],
+        }
+
+
+async def post_search(port, query, num_results):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps({"query": query, "num_results": num_results}).encode("utf-8")
+    writer.write(
+        f"POST /search HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    _, status, _, response = await read_request(reader)
+    writer.close()
+    return status, json.loads(response)
+
+
+def test_concurrent_searches_are_batched():
+    searcher = FakeSearcher()
+
+    async def run():
+        server = QueryServer(QueryBatcher(searcher, max_batch_size=8, max_wait_ms=200), port=0)
+        await server.start()
+        try:
+            return await asyncio.gather(
+                *(post_search(server.port, f"query {i}", i % 3 + 1) for i in range(8))
+            )
+        finally:
+            await server.stop()
+
+    responses = asyncio.run(run())
+
+    assert len(searcher.batches) == 1
+    assert sorted(searcher.batches[0]) == sorted(f"query {i}" for i in range(8))
+    for i, (status, result) in enumerate(responses):
+        assert status == "200"
+        # Each search gets its own results, truncated to the number it asked for
+        assert result["ids"] == [[f"query {i}-{j}" for j in range(i % 3 + 1)]]
+        assert "embeddings" not in result
+
+
+def test_invalid_search_request():
+    async def run():
+        server = QueryServer(QueryBatcher(FakeSearcher()), port=0)
+        await server.start()
+        try:
+            return await post_search(server.port, None, 2)
+        finally:
+            await server.stop()
+
+    status, result = asyncio.run(run())
+    assert status == "400"
+    assert "error" in result
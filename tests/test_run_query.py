@@ -28,4 +28,102 @@ def test_run_query_with_invalid_path():
         run_query(
             query="test",
             embeddings_path="nonexistent_path.db"
-        ) 
\ No newline at end of file
+        ) 
+
+def test_searcher_is_reused(sample_db_with_emails, temp_embeddings_path):
+    from llm_email_search.embed_emails import embed_emails
+    from llm_email_search.run_query import Searcher, get_searcher
+    embed_emails(
+        sample_db_with_emails,
+        temp_embeddings_path,
+        "sentence-transformers/all-MiniLM-L6-v2"
+    )
+
+    searcher = get_searcher(temp_embeddings_path)
+    assert get_searcher(temp_embeddings_path) is searcher
+
+    results = searcher.search("test email", num_results=3)
+    expected = Searcher(temp_embeddings_path).collection.query(query_texts=["test email"], n_results=3)
+    assert results['ids'] == expected['ids']
+
+    batch_results = searcher.search_batch(["test email", "another query"], num_results=2)
+    assert len(batch_results['ids']) == 2
+
+
+def test_run_queries_matches_run_query(sample_db_with_emails, temp_embeddings_path):
+    import io
+    import json
+    from llm_email_search.embed_emails import embed_emails
+    from llm_email_search.run_query import run_queries, write_jsonl_results
+    embed_emails(
+        sample_db_with_emails,
+        temp_embeddings_path,
+        "sentence-transformers/all-MiniLM-L6-v2"
+    )
+
+    queries = ["test email", "meeting", "invoice", "flight", "hello"]
+    results = list(run_queries(queries, num_results=2, embeddings_path=temp_embeddings_path, batch_size=2))
+
+    assert len(results) == len(queries)
+    for query, result in zip(queries, results):
+        expected = run_query(query, num_results=2, embeddings_path=temp_embeddings_path)
+        assert result['ids'] == expected['ids']
+        assert result['metadatas'] == expected['metadatas']
+
+    output = io.StringIO()
+    assert write_jsonl_results(queries, results, output) == len(queries)
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line['query'] for line in lines] == queries
+    assert len(lines[0]['ids']) == 2
+
+
+def test_run_query_filters(sample_db_with_emails, temp_embeddings_path):
+    from llm_email_search.embed_emails import embed_emails
+    embed_emails(
+        sample_db_with_emails,
+        temp_embeddings_path,
+        "sentence-transformers/all-MiniLM-L6-v2"
+    )
+
+    def search(**filters):
+        results = run_query("test email", num_results=2, embeddings_path=temp_embeddings_path, **filters)
+        return sorted(results['ids'][0])
+
+    assert search(sender="Test Two <TEST2@example.com>") == ["2"]
+    assert search(after=1647123456790) == ["2"]
+    assert search(before=1647123456790) == ["1"]
+    assert search(after="2022-03-01", before="2022-04-01") == ["1", "2"]
+    assert search(has_attachment="PDF") == ["1"]
+    assert search(has_attachment=True) == ["1", "2"]
+    assert search(sender="test1@example.com", has_attachment=".jpg") == []
+
+
+def test_main_streams_queries_file(sample_db_with_emails, temp_embeddings_path, monkeypatch):
+    import io
+    import json
+    import sys
+    from llm_email_search.embed_emails import embed_emails
+    from llm_email_search.run_query import main
+    embed_emails(sample_db_with_emails, temp_embeddings_path, "sentence-transformers/all-MiniLM-L6-v2")
+
+    output = io.StringIO()
+    lines_written_before_read = []
+
+    def read_stdin():
+        for query in ["test email", "", "meeting", "invoice"]:
+            lines_written_before_read.append(output.getvalue().count("\n"))
+            yield query + "\n"
+
+    monkeypatch.setattr(sys, "stdin", read_stdin())
+    monkeypatch.setattr(sys, "stdout", output)
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["run_query.py", "--queries-file", "-", "--batch-size", "1", "--embeddings-path", temp_embeddings_path],
+    )
+    main()
+
+    # Each query is searched and written before the next one is read
+    assert lines_written_before_read == [0, 1, 1, 2]
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line["query"] for line in lines] == ["test email", "meeting", "invoice"]
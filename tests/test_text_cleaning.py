@@ -0,0 +1,77 @@
+from llm_email_search.text_cleaning import (
+    clean_text,
+    html_to_text,
+    looks_like_html,
+    strip_quoted_reply,
+    strip_signature,
+)
+
+
+def test_html_to_text():
+    markup = (
+        "<html><head><style>p { color: red }</style></head><body>"
+        "<p>Your order&nbsp;#123 has <b>shipped</b>.</p><!-- tracking --><div>Thanks &amp; enjoy</div>"
+        "<script>track()</script></body></html>"
+    )
+    assert looks_like_html(markup)
+    assert not looks_like_html("a < b and c > d")
+    assert html_to_text("<table><tr><td>Total</td><td>$5</td></tr></table>").strip() == "Total $5"
+    lines = [" ".join(line.split()) for line in html_to_text(markup).splitlines() if line.strip()]
+    assert lines == ["Your order #123 has shipped.", "Thanks & enjoy"]
+
+
+def test_strip_quoted_reply():
+    reply = (
+        "Sounds good, see you then.\n\n"
+        "On Mon, 3 Jun 2024 at 10:00, John Smith <john@example.com>\nwrote:\n"
+        "> Shall we meet at noon?\n> John\n"
+    )
+    assert strip_quoted_reply(reply).strip() == "Sounds good, see you then."
+
+    outlook = "Approved.\n\n-----Original Message-----\nFrom: Jane\nPlease approve the budget."
+    assert strip_quoted_reply(outlook).strip() == "Approved."
+
+    inline = "> Can you send the report?\nAttached.\n> Thanks"
+    assert strip_quoted_reply(inline).strip() == "Attached."
+
+    # A message that is only a quote is kept
+    assert strip_quoted_reply("> just a quote") == "> just a quote"
+
+
+def test_strip_signature():
+    text = "The invoice is attached.\n\n-- \nJane Doe\nAccounts\n+1 555 0100\n"
+    assert strip_signature(text).strip() == "The invoice is attached."
+
+    text = "Let me know if the dates work.\n\nBest regards,\nJane Doe\nAcme Corp\n\nSent from my iPhone"
+    assert strip_signature(text).strip() == "Let me know if the dates work."
+
+    # A sign-off followed by a long text is not a signature
+    text = "Thanks\n" + "\n".join(f"line {i}" for i in range(20))
+    assert strip_signature(text) == text
+
+    text = "Thanks,\nJane Doe\nSenior Manager, Acme Inc.\nhttps://acme.example.com\n+1 (555) 010-0100"
+    assert strip_signature(text) == text  # Nothing precedes the sign-off
+    assert strip_signature("See you Monday.\n\n" + text).strip() == "See you Monday."
+
+
+def test_strip_signature_keeps_sign_off_words_in_the_message():
+    body = "Hi Bob,\n\nThanks!\n\nThe quarterly budget meeting moved to 3pm in room 4.\nBring the Q3 numbers.\n"
+    assert clean_text(body) == (
+        "Hi Bob,\n\nThanks!\n\nThe quarterly budget meeting moved to 3pm in room 4.\nBring the Q3 numbers."
+    )
+    body = "Hi Ann,\n\nBest\nto call me after 5pm, the office line is busy.\n"
+    assert strip_signature(body) == body
+    body = "Hi Ann,\n\nBest time to call is after 5pm.\nCheers\nBob"
+    assert strip_signature(body).strip() == "Hi Ann,\n\nBest time to call is after 5pm."
+
+
+def test_clean_text():
+    body = (
+        "<div>Hi team,</div><div><br></div><div>The   release is   out.</div>"
+        "<div>Cheers,</div><div>Sam</div>"
+        '<div class="gmail_quote">On Tue, Sam wrote:<blockquote>Is the release out?</blockquote></div>'
+    )
+    assert clean_text(body) == "Hi team,\n\nThe release is out."
+    assert clean_text("") == ""
+    # Nothing is left after cleaning, so only whitespace is collapsed
+    assert clean_text("Thanks,\n\n") == "Thanks,"